@@ -0,0 +1,50 @@
+"""
+Backfill unique de `file_chunks.blob_key`.
+
+Les chunks sont désormais rattachés à un blob (SHA-256 + extension) et non plus
+au seul hash: le texte extrait dépend de l'extension. Ce script rattache les
+chunks existants au blob de leurs fichiers; quand un même hash est partagé par
+plusieurs extensions, ses chunks sont supprimés et les fichiers remis en file
+d'ingestion (idempotent: il peut être relancé sans risque).
+
+Usage (depuis backend/): python backfill_chunk_keys.py
+"""
+import sys
+from pymongo import MongoClient
+from config.settings import MONGO_URL, DB_NAME
+from services.storage import content_key
+
+def backfill(db):
+    keyed = requeued = removed = 0
+    for content_hash in db.file_chunks.distinct("content_hash", {"blob_key": {"$exists": False}}):
+        files = list(db.files.find({"content_hash": content_hash}, {"_id": 0, "id": 1, "content_hash": 1, "blob_key": 1, "file_path": 1}))
+        keys = {content_key(file) for file in files}
+        legacy = {"content_hash": content_hash, "blob_key": {"$exists": False}}
+        if len(keys) == 1:
+            keyed += db.file_chunks.update_many(legacy, {"$set": {"blob_key": keys.pop()}}).modified_count
+            continue
+        # Aucun fichier, ou plusieurs extensions: chaque blob sera redécoupé par son propre parseur
+        removed += db.file_chunks.delete_many(legacy).deleted_count
+        if files:
+            db.blobs.update_many({"_id": {"$in": list(keys)}}, {"$unset": {"chunk_count": ""}})
+            requeued += db.files.update_many(
+                {"content_hash": content_hash},
+                {"$set": {"analysis_status": "pending"}, "$unset": {"analysis_error": ""}}
+            ).modified_count
+
+    db.file_chunks.create_index([("blob_key", 1), ("chunk_index", 1)])
+    print(f"✅ {keyed} chunks rattachés à leur blob, {removed} supprimés, {requeued} fichiers à ré-ingérer")
+
+def main():
+    client = MongoClient(MONGO_URL)
+    try:
+        backfill(client[DB_NAME])
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"❌ Erreur lors du backfill: {e}")
+        sys.exit(1)
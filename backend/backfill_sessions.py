@@ -0,0 +1,72 @@
+"""
+Backfill unique de la collection `sessions` à partir de `chat_messages`.
+
+Depuis que /chat maintient `sessions` à chaque message, GET /sessions lit cette
+collection au lieu d'agréger tout l'historique. Ce script reconstruit les
+sessions des messages existants (idempotent: il peut être relancé sans risque).
+
+Usage (depuis backend/): python backfill_sessions.py
+"""
+import sys
+from pymongo import MongoClient, UpdateOne
+from config.settings import MONGO_URL, DB_NAME
+from services.session_service import session_preview
+
+RESPONSE_FIELDS = ["chatgpt_response", "gemini_response", "deepseek_response", "claude_response"]
+BATCH_SIZE = 500
+
+def backfill(db):
+    pipeline = [
+        {"$sort": {"timestamp": 1}},
+        {"$group": {
+            "_id": {"session_id": "$session_id", "user_id": "$user_id"},
+            "created_at": {"$first": "$timestamp"},
+            "updated_at": {"$last": "$timestamp"},
+            "session_name": {"$last": "$session_name"},
+            "latest_message": {"$last": "$message"},
+            "latest_message_id": {"$last": "$id"},
+            **{f"latest_{field}": {"$last": f"${field}"} for field in RESPONSE_FIELDS},
+            "message_count": {"$sum": 1}
+        }}
+    ]
+
+    operations = []
+    total = 0
+    for session in db.chat_messages.aggregate(pipeline, allowDiskUse=True):
+        ai_response = next((session[f"latest_{field}"] for field in RESPONSE_FIELDS if session.get(f"latest_{field}")), None)
+        operations.append(UpdateOne(
+            {"session_id": session["_id"]["session_id"], "user_id": session["_id"]["user_id"]},
+            {"$set": {
+                "session_name": session.get("session_name") or "Nouvelle conversation",
+                "preview": session_preview(session["latest_message"], ai_response),
+                "latest_message_id": session["latest_message_id"],
+                "created_at": session["created_at"],
+                "updated_at": session["updated_at"],
+                "message_count": session["message_count"]
+            }},
+            upsert=True
+        ))
+        if len(operations) >= BATCH_SIZE:
+            db.sessions.bulk_write(operations, ordered=False)
+            total += len(operations)
+            operations = []
+    if operations:
+        db.sessions.bulk_write(operations, ordered=False)
+        total += len(operations)
+
+    db.sessions.create_index([("user_id", 1), ("updated_at", -1)])
+    print(f"✅ {total} sessions reconstruites")
+
+def main():
+    client = MongoClient(MONGO_URL)
+    try:
+        backfill(client[DB_NAME])
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"❌ Erreur lors du backfill: {e}")
+        sys.exit(1)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark: session par appel vs session partagée (services.http_client)
+
+Lance un faux serveur LLM local et mesure le temps jusqu'au premier octet
+(TTFB) pour N requêtes séquentielles dans les deux configurations.
+
+Utilisation (depuis backend/):
+    python -m benchmarks.http_session_benchmark [nombre_de_requetes]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+from services.http_client import get_http_session, close_http_sessions  # noqa: E402
+
+HOST = "127.0.0.1"
+PORT = 8765
+URL = f"http://{HOST}:{PORT}/v1/chat/completions"
+
+async def mock_completion(request):
+    await request.json()
+    return web.json_response({"choices": [{"message": {"content": "ok"}}]})
+
+async def timed_post(session: aiohttp.ClientSession) -> float:
+    start = time.perf_counter()
+    async with session.post(URL, json={"messages": []}) as response:
+        await response.content.read(1)
+        ttfb = time.perf_counter() - start
+        await response.read()
+    return ttfb
+
+async def per_call_sessions(n: int):
+    timings = []
+    for _ in range(n):
+        async with aiohttp.ClientSession() as session:
+            timings.append(await timed_post(session))
+    return timings
+
+async def shared_session(n: int):
+    timings = []
+    session = get_http_session("benchmark")
+    for _ in range(n):
+        timings.append(await timed_post(session))
+    await close_http_sessions()
+    return timings
+
+def report(label: str, timings):
+    ms = sorted(t * 1000 for t in timings)
+    p95 = ms[int(len(ms) * 0.95) - 1]
+    print(f"{label:<22} p50={statistics.median(ms):.3f}ms  p95={p95:.3f}ms  mean={statistics.mean(ms):.3f}ms")
+
+async def main(n: int):
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", mock_completion)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, HOST, PORT).start()
+    try:
+        report("Session par appel", await per_call_sessions(n))
+        report("Session partagée", await shared_session(n))
+    finally:
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
@@ -1,28 +1,56 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from .settings import MONGO_URL, DB_NAME
+from .settings import (
+    MONGO_URL, DB_NAME, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_SERVERLESS,
+    MONGO_HEALTH_CHECK_INTERVAL, MONGO_HEALTH_CHECK_MAX_BACKOFF
+)
+import asyncio
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
 class Database:
     client: AsyncIOMotorClient = None
     database = None
+    # Lazy health-check state (serverless mode only)
+    next_health_check: float = 0.0
+    failed_checks: int = 0
+    retry_after: float = 0.0
 
 # Global database instance
 db_instance = Database()
+_client_lock = asyncio.Lock()
+
+def _create_client() -> AsyncIOMotorClient:
+    """Create a pooled Motor client shared by every request of this process"""
+    return AsyncIOMotorClient(
+        MONGO_URL,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS
+    )
+
+def _reset_client():
+    """Drop the cached client so the next call builds a new one"""
+    if db_instance.client:
+        db_instance.client.close()
+    db_instance.client = None
+    db_instance.database = None
 
 async def connect_to_mongo():
     """Create database connection"""
     try:
-        db_instance.client = AsyncIOMotorClient(MONGO_URL)
+        db_instance.client = _create_client()
         db_instance.database = db_instance.client[DB_NAME]
         # Test the connection
         await db_instance.client.admin.command('ping')
-        logger.info("Connected to MongoDB")
+        db_instance.next_health_check = time.monotonic() + MONGO_HEALTH_CHECK_INTERVAL
+        logger.info(f"Connected to MongoDB (maxPoolSize={MONGO_MAX_POOL_SIZE})")
     except Exception as e:
         logger.error(f"Error connecting to MongoDB: {e}")
         # Don't raise the exception to allow the app to start
-        # The connection will be retried when needed
+        # The client is kept: Motor reconnects on its own when the server comes back
         pass
 
 async def close_mongo_connection():
@@ -30,20 +58,51 @@ async def close_mongo_connection():
     try:
         if db_instance.client:
             db_instance.client.close()
+            db_instance.client = None
+            db_instance.database = None
             logger.info("Disconnected from MongoDB")
     except Exception as e:
         logger.error(f"Error disconnecting from MongoDB: {e}")
 
-async def get_database():
-    """Get database instance with reconnection logic for serverless environment"""
-    # Always create a fresh connection for serverless functions
+async def _check_health():
+    """Ping the cached client at most once per interval, backing off on failures"""
+    now = time.monotonic()
+    if now < db_instance.next_health_check:
+        return
     try:
-        # Create a new client for each request in serverless environment
-        client = AsyncIOMotorClient(MONGO_URL)
-        database = client[DB_NAME]
-        # Test the connection
-        await client.admin.command('ping')
-        return database
+        await db_instance.client.admin.command('ping')
+        db_instance.failed_checks = 0
+        db_instance.next_health_check = now + MONGO_HEALTH_CHECK_INTERVAL
     except Exception as e:
-        logger.error(f"Failed to connect to database: {e}")
-        return None
\ No newline at end of file
+        db_instance.failed_checks += 1
+        backoff = min(2 ** db_instance.failed_checks, MONGO_HEALTH_CHECK_MAX_BACKOFF)
+        db_instance.retry_after = now + backoff
+        logger.error(f"MongoDB health check failed ({db_instance.failed_checks}x), retrying in {backoff:.0f}s: {e}")
+        _reset_client()
+
+async def get_database():
+    """
+    Get the shared database handle.
+
+    The client is created once (by connect_to_mongo() in the lifespan, or lazily
+    here when the lifespan did not run) and reused by every dependency. In
+    serverless mode the client is cached per warm container and pinged lazily.
+    """
+    if db_instance.database is None:
+        if time.monotonic() < db_instance.retry_after:
+            return None
+        async with _client_lock:
+            if db_instance.database is None:
+                try:
+                    db_instance.client = _create_client()
+                    db_instance.database = db_instance.client[DB_NAME]
+                    # A fresh client is checked on its first use below
+                    db_instance.next_health_check = 0.0
+                except Exception as e:
+                    logger.error(f"Failed to connect to database: {e}")
+                    return None
+
+    if MONGO_SERVERLESS:
+        await _check_health()
+
+    return db_instance.database
@@ -9,6 +9,13 @@ load_dotenv(ROOT_DIR / '.env')
 # MongoDB Configuration
 MONGO_URL = os.environ['MONGO_URL']
 DB_NAME = os.environ['DB_NAME']
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '50'))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+# Serverless mode: the client is cached per warm container and health-checked lazily
+MONGO_SERVERLESS = os.getenv('MONGO_SERVERLESS', os.getenv('VERCEL', '')).lower() in ('1', 'true', 'yes')
+MONGO_HEALTH_CHECK_INTERVAL = float(os.getenv('MONGO_HEALTH_CHECK_INTERVAL', '30'))
+MONGO_HEALTH_CHECK_MAX_BACKOFF = float(os.getenv('MONGO_HEALTH_CHECK_MAX_BACKOFF', '60'))
 
 # LLM API Keys
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
@@ -16,15 +23,127 @@ GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY', '')
 CLAUDE_API_KEY = os.getenv('CLAUDE_API_KEY', '')
 
+# Providers used by compare mode (comma-separated registry names)
+COMPARE_PROVIDERS = [name.strip() for name in os.getenv('COMPARE_PROVIDERS', 'chatgpt,gemini,deepseek,claude').split(',') if name.strip()]
+# Optional local OpenAI-compatible server (vLLM, Ollama, llama.cpp...), registered as "local"
+LOCAL_LLM_URL = os.getenv('LOCAL_LLM_URL', '')  # e.g. http://localhost:11434/v1/chat/completions
+LOCAL_LLM_MODEL = os.getenv('LOCAL_LLM_MODEL', 'llama3.1')
+LOCAL_LLM_API_KEY = os.getenv('LOCAL_LLM_API_KEY', 'local')
+
+# LLM HTTP client Configuration (one keep-alive session per provider)
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '10'))
+LLM_READ_TIMEOUT = float(os.getenv('LLM_READ_TIMEOUT', '120'))
+LLM_MAX_CONNECTIONS_PER_HOST = int(os.getenv('LLM_MAX_CONNECTIONS_PER_HOST', '20'))
+LLM_DNS_CACHE_TTL = int(os.getenv('LLM_DNS_CACHE_TTL', '300'))
+LLM_KEEPALIVE_TIMEOUT = float(os.getenv('LLM_KEEPALIVE_TIMEOUT', '60'))
+# Upper bound of one non-streaming provider call, and deadline of a compare request:
+# models still running at the deadline are returned as timed_out and finish in the background
+LLM_REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', '90'))
+COMPARE_DEADLINE = float(os.getenv('COMPARE_DEADLINE', '30'))
+# Per-provider scheduling: concurrent calls, initial rate (0 = learn from rate-limit headers),
+# retries of 429/5xx with jittered exponential backoff, circuit breaker
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+LLM_RATE_LIMIT_RPS = float(os.getenv('LLM_RATE_LIMIT_RPS', '0'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+LLM_RETRY_BASE_DELAY = float(os.getenv('LLM_RETRY_BASE_DELAY', '0.5'))
+LLM_RETRY_MAX_DELAY = float(os.getenv('LLM_RETRY_MAX_DELAY', '20'))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', '30'))
+# "fast" single-model requests: a hedge is fired when the primary passes its rolling p95
+# (HEDGE_DEFAULT_DELAY until HEDGE_MIN_SAMPLES calls were seen). HEDGE_FALLBACKS maps a
+# model to the alternate it falls back to (e.g. "chatgpt:claude,gemini:chatgpt");
+# models without an alternate are hedged with a duplicate request to the same provider
+LATENCY_WINDOW = int(os.getenv('LATENCY_WINDOW', '200'))
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', '20'))
+HEDGE_DEFAULT_DELAY = float(os.getenv('HEDGE_DEFAULT_DELAY', '8'))
+HEDGE_FALLBACKS = dict(
+    pair.strip().split(':', 1) for pair in os.getenv('HEDGE_FALLBACKS', '').split(',') if ':' in pair
+)
+
+# Response cache for identical prompts (opt-in): in-process LRU + shared MongoDB tier with TTL
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', '86400'))  # seconds
+RESPONSE_CACHE_MEMORY_SIZE = int(os.getenv('RESPONSE_CACHE_MEMORY_SIZE', '512'))  # entries
+
 # JWT Configuration
 SECRET_KEY = os.getenv('SECRET_KEY', 'chatbot_secret_key_2025')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 hours
+# get_current_user cache: active users (TTL + LRU), missing users (short TTL), verified token payloads
+AUTH_USER_CACHE_TTL = float(os.getenv('AUTH_USER_CACHE_TTL', '60'))
+AUTH_USER_CACHE_SIZE = int(os.getenv('AUTH_USER_CACHE_SIZE', '1024'))
+AUTH_NEGATIVE_CACHE_TTL = float(os.getenv('AUTH_NEGATIVE_CACHE_TTL', '5'))
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', '4096'))
 
 # File Upload Configuration
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', str(10 * 1024 * 1024)))  # 10MB
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))  # uploads are streamed to disk by chunks of 1MB
+# Upload storage backend: "local" (UPLOAD_DIR/blobs) or "s3" (any S3-compatible store: AWS, MinIO...; needs boto3)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local').lower()
+S3_BUCKET = os.getenv('S3_BUCKET', '')
+S3_PREFIX = os.getenv('S3_PREFIX', 'blobs/')
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL', '') or None  # e.g. http://localhost:9000 for MinIO
+S3_REGION = os.getenv('S3_REGION', '') or None
+S3_ACCESS_KEY_ID = os.getenv('S3_ACCESS_KEY_ID', '') or None
+S3_SECRET_ACCESS_KEY = os.getenv('S3_SECRET_ACCESS_KEY', '') or None
+S3_MULTIPART_CHUNK_SIZE = int(os.getenv('S3_MULTIPART_CHUNK_SIZE', str(8 * 1024 * 1024)))  # multipart above this size (min 5MB)
+# Threads of the blocking object store calls (S3 GET/PUT/DELETE), apart from the extraction pools
+STORAGE_IO_WORKERS = int(os.getenv('STORAGE_IO_WORKERS', '16'))
+# Local read-through cache of remote blobs (parsers need a seekable file), evicted LRU above its size
+STORAGE_CACHE_DIR = Path(os.getenv('STORAGE_CACHE_DIR', 'cache/blobs'))
+STORAGE_CACHE_MAX_BYTES = int(os.getenv('STORAGE_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))  # 1GB
+# Extracted text cache, content-addressed by the SHA-256 of the uploaded file
+EXTRACTION_CACHE_DIR = Path(os.getenv('EXTRACTION_CACHE_DIR', 'cache/extracted'))
+EXTRACTION_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+# Document parsers run outside the event loop (processes for PDF/DOCX/XML, threads for reads)
+EXTRACTION_PROCESS_WORKERS = int(os.getenv('EXTRACTION_PROCESS_WORKERS', str(min(4, os.cpu_count() or 1))))
+EXTRACTION_THREAD_WORKERS = int(os.getenv('EXTRACTION_THREAD_WORKERS', '4'))
+EXTRACTION_TIMEOUT = float(os.getenv('EXTRACTION_TIMEOUT', '120'))
+# Full PDF extractions (indexing) above PDF_PARALLEL_MIN_PAGES are split into jobs of PDF_PAGES_PER_JOB pages
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '64'))
+PDF_PAGES_PER_JOB = int(os.getenv('PDF_PAGES_PER_JOB', '32'))
+# XLSX sheets are streamed row by row; at most XLSX_MAX_ROWS_PER_SHEET rows of each sheet are profiled
+XLSX_MAX_ROWS_PER_SHEET = int(os.getenv('XLSX_MAX_ROWS_PER_SHEET', '500000'))
+XLSX_MAX_SHEETS = int(os.getenv('XLSX_MAX_SHEETS', '20'))
+XLSX_MAX_CELL_CHARS = int(os.getenv('XLSX_MAX_CELL_CHARS', '60'))
+# CSV/XLSX tables are profiled in batches (types, empty values, ranges, quartiles, frequent values)
+# and the prompt gets the profile plus a sample of rows instead of raw rows
+TABLE_PROFILE_BATCH_ROWS = int(os.getenv('TABLE_PROFILE_BATCH_ROWS', '10000'))
+TABLE_PROFILE_SAMPLE_ROWS = int(os.getenv('TABLE_PROFILE_SAMPLE_ROWS', '10'))
+TABLE_PROFILE_TOP_K = int(os.getenv('TABLE_PROFILE_TOP_K', '5'))
+TABLE_PROFILE_RESERVOIR_SIZE = int(os.getenv('TABLE_PROFILE_RESERVOIR_SIZE', '10000'))  # values kept per column for quartiles
+# XML/JSON files above STRUCTURED_OUTLINE_MIN_BYTES are summarized as a streamed structural outline
+# (paths, counts, samples) instead of being rendered whole; reading stops once the structure is stable
+STRUCTURED_OUTLINE_MIN_BYTES = int(os.getenv('STRUCTURED_OUTLINE_MIN_BYTES', str(1024 * 1024)))  # 1MB
+OUTLINE_MAX_PATHS = int(os.getenv('OUTLINE_MAX_PATHS', '200'))
+OUTLINE_SAMPLES_PER_PATH = int(os.getenv('OUTLINE_SAMPLES_PER_PATH', '3'))
+OUTLINE_CONVERGENCE_EVENTS = int(os.getenv('OUTLINE_CONVERGENCE_EVENTS', '20000'))  # events without a new path
+TABLE_PROFILE_MAX_ROWS = int(os.getenv('TABLE_PROFILE_MAX_ROWS', '5000000'))  # CSV rows profiled; the rest is only counted
+# Background ingestion of uploaded files (extraction, normalization, chunking)
+INGESTION_WORKERS = int(os.getenv('INGESTION_WORKERS', '2'))
+INGESTION_POLL_INTERVAL = float(os.getenv('INGESTION_POLL_INTERVAL', '30'))
+# A file in processing refreshes processing_heartbeat_at; without it for 4 intervals its worker is presumed dead
+INGESTION_HEARTBEAT_INTERVAL = float(os.getenv('INGESTION_HEARTBEAT_INTERVAL', '15'))
+CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', '1500'))  # characters
+CHUNK_OVERLAP = int(os.getenv('CHUNK_OVERLAP', '200'))
+# Local BM25 retrieval over file_chunks: the top-k chunks are ranked, as many as fit the token budget go into the prompt
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '32'))
+RETRIEVAL_INDEX_CACHE_SIZE = int(os.getenv('RETRIEVAL_INDEX_CACHE_SIZE', '64'))  # indexed files kept in memory
+# Optional semantic index over all of a user's uploads (one memory-mapped matrix per user)
+VECTOR_SEARCH_ENABLED = os.getenv('VECTOR_SEARCH_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+EMBEDDING_PROVIDER = os.getenv('EMBEDDING_PROVIDER', 'hashing')  # hashing, sentence-transformers, openai
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', '')
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
+VECTOR_INDEX_DIR = Path(os.getenv('VECTOR_INDEX_DIR', 'cache/vectors'))
+VECTOR_TOP_K = int(os.getenv('VECTOR_TOP_K', '6'))
+VECTOR_ANN_MIN_VECTORS = int(os.getenv('VECTOR_ANN_MIN_VECTORS', '20000'))  # HNSW above this size (if hnswlib is installed)
+# Prompt budgeting in tokens: file context fills what the context window leaves after the
+# system prompt, the question and max_tokens, up to CONTEXT_MAX_TOKENS (bounds the cost of a call)
+CONTEXT_MAX_TOKENS = int(os.getenv('CONTEXT_MAX_TOKENS', '8000'))
+CONTEXT_SAFETY_TOKENS = int(os.getenv('CONTEXT_SAFETY_TOKENS', '256'))  # margin for estimated counts and message framing
+LOCAL_LLM_CONTEXT_WINDOW = int(os.getenv('LOCAL_LLM_CONTEXT_WINDOW', '8192'))
 
 # Logging Configuration
 LOGGING_CONFIG = {
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 import uuid
 
@@ -21,8 +21,16 @@ class ChatRequest(BaseModel):
     session_id: str
     session_name: Optional[str] = "Nouvelle conversation"
     message: str
-    mode: str  # 'compare', 'chatgpt', 'gemini', 'deepseek', 'claude'
+    mode: str  # 'compare' ou nom d'un fournisseur enregistré ('chatgpt', 'gemini', 'deepseek', 'claude', ...)
     file_id: Optional[str] = None  # ID du fichier pour le contexte
+    search_all_files: bool = False  # Recherche sémantique dans tous les fichiers de l'utilisateur
+    fast: bool = False  # Modes à un modèle: requête de couverture si le modèle dépasse son p95
+
+class ModelResponse(BaseModel):
+    response: Optional[str] = None
+    response_time: Optional[float] = None
+    cached: bool = False
+    status: str = "completed"  # 'completed', 'error' ou 'timed_out' (la réponse arrivera dans l'historique)
 
 class ChatResponse(BaseModel):
     id: str
@@ -34,6 +42,13 @@ class ChatResponse(BaseModel):
     gemini_response_time: Optional[float] = None
     deepseek_response_time: Optional[float] = None
     claude_response_time: Optional[float] = None
+    chatgpt_cached: Optional[bool] = None
+    gemini_cached: Optional[bool] = None
+    deepseek_cached: Optional[bool] = None
+    claude_cached: Optional[bool] = None
+    responses: Dict[str, ModelResponse] = {}  # Réponses de tous les fournisseurs, y compris hors des quatre champs fixes
+    timed_out: List[str] = []  # Modèles encore en cours à l'échéance du mode compare
+    answered_by: Optional[str] = None  # Mode "fast": fournisseur qui a réellement répondu
     mode: str
     timestamp: datetime
 
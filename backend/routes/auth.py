@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 from config.database import get_database
 from models.schemas import UserCreate, UserLogin, UserResponse, Token, User
-from services.auth_service import hash_password, verify_password, create_access_token, get_current_user
+from services.auth_service import hash_password, verify_password, create_access_token, get_current_user, cache_user, invalidate_user
 import uuid
 import logging
 from datetime import datetime
@@ -36,6 +36,7 @@ async def register_user(user_data: UserCreate):
     
     try:
         await db.users.insert_one(user_doc)
+        invalidate_user(user_id)
         logger.info(f"User registered: {user_data.username}")
         
         return UserResponse(
@@ -63,8 +64,9 @@ async def login_user(user_data: UserLogin):
     if not verify_password(user_data.password, user["password"]):
         raise HTTPException(status_code=401, detail="Nom d'utilisateur ou mot de passe incorrect")
     
-    # Create access token
+    # Create access token (the user is cached for the requests that follow)
     access_token = create_access_token({"user_id": user["id"]})
+    cache_user(User(**user))
     
     logger.info(f"User logged in: {user_data.username}")
     
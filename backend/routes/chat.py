@@ -1,10 +1,18 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from config.database import get_database
-from models.schemas import ChatRequest, ChatResponse, ChatMessage, ChatSession, User
+from config.settings import VECTOR_SEARCH_ENABLED, COMPARE_DEADLINE
+from models.schemas import ChatRequest, ChatResponse, ChatMessage, ChatSession, ModelResponse, User
 from services.auth_service import get_current_user
-from services.llm_service import call_chatgpt_api, call_gemini_api, call_deepseek_api, call_claude_api, call_ai_with_file_context
+from services.llm_service import call_ai_cached, call_ai_hedged, is_error_response, create_context_message, create_user_files_context_message, stream_ai_api, StreamError
+from services.providers import PROVIDERS, get_provider, get_compare_providers
+from services.rate_limiter import set_call_priority
+from services.session_service import record_session_message
+from services.pagination import fetch_page, json_list_response
 import uuid
+import json
+import time
 import asyncio
 import logging
 from datetime import datetime
@@ -12,6 +20,53 @@ from datetime import datetime
 logger = logging.getLogger(__name__)
 router = APIRouter(tags=["Chat"])
 
+# Stragglers of compare requests still running after the response was returned
+_background_completions = set()
+
+def _result_fields(model: str, result) -> dict:
+    """
+    Stored fields of one model's (text, time, cached) result or exception.
+    Provider errors (429, 5xx, missing key...) go to {model}_error, not into the answer.
+    """
+    response_text, response_time, cached = result if not isinstance(result, BaseException) else (f"Erreur: {result}", 0.0, False)
+    failed = is_error_response(response_text)
+    return {
+        f"{model}_response": None if failed else response_text,
+        f"{model}_error": response_text if failed else None,
+        f"{model}_response_time": response_time,
+        f"{model}_cached": cached,
+        f"{model}_status": "error" if failed else "completed",
+        f"{model}_completed_at": datetime.utcnow()
+    }
+
+async def _complete_in_background(db, message_id: str, model: str, task: asyncio.Task):
+    """Wait for a timed-out model and store its answer in the saved message"""
+    try:
+        result = await task
+    except asyncio.CancelledError:
+        return
+    except Exception as e:
+        result = e
+    try:
+        await db.chat_messages.update_one({"id": message_id}, {"$set": _result_fields(model, result)})
+        logger.info(f"Late {model} response stored for message {message_id}")
+    except Exception as e:
+        logger.error(f"Late response update error: {str(e)}")
+
+# Fields of a message shown by the history (answers, errors and status of every registered provider, no internal fields)
+HISTORY_PROJECTION = {
+    "_id": 0, "id": 1, "user_id": 1, "session_id": 1, "session_name": 1, "message": 1, "mode": 1, "timestamp": 1, "file_id": 1,
+    **{f"{name}_{field}": 1 for name in PROVIDERS for field in ("response", "error", "status")}
+}
+
+def resolve_models(mode: str) -> List[str]:
+    """Providers answering a chat mode: the compare set, or the named provider"""
+    if mode == "compare":
+        return [provider.name for provider in get_compare_providers()]
+    if get_provider(mode) is not None:
+        return [mode]
+    raise HTTPException(status_code=400, detail="Mode non supporté")
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(
     request: ChatRequest,
@@ -34,6 +89,14 @@ async def chat_endpoint(
             if not file_doc:
                 raise HTTPException(status_code=404, detail="Fichier non trouvé")
         
+        models = resolve_models(request.mode)
+        
+        # Sans fichier attaché: recherche optionnelle dans tous les fichiers de l'utilisateur
+        # (un seul prompt pour tous les modèles, dans le budget de tokens de chacun)
+        prompt = request.message
+        if not file_doc and request.search_all_files and VECTOR_SEARCH_ENABLED:
+            prompt = await create_user_files_context_message(request.message, current_user.id, models)
+        
         # Create base message document
         message_doc = {
             "id": message_id,
@@ -45,132 +108,74 @@ async def chat_endpoint(
             "file_id": request.file_id
         }
         
-        if request.mode == "compare":
-            # Call all APIs concurrently
-            if file_doc:
-                # Avec contexte de fichier
-                tasks = [
-                    call_ai_with_file_context(request.message, file_doc["file_path"], file_doc["original_filename"], "chatgpt"),
-                    call_ai_with_file_context(request.message, file_doc["file_path"], file_doc["original_filename"], "gemini"),
-                    call_ai_with_file_context(request.message, file_doc["file_path"], file_doc["original_filename"], "deepseek"),
-                    call_ai_with_file_context(request.message, file_doc["file_path"], file_doc["original_filename"], "claude")
-                ]
-            else:
-                # Sans contexte de fichier
-                tasks = [
-                    call_chatgpt_api(request.message),
-                    call_gemini_api(request.message),
-                    call_deepseek_api(request.message),
-                    call_claude_api(request.message)
-                ]
-            
-            responses = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Handle responses and exceptions with timing
-            chatgpt_response, chatgpt_time = responses[0] if not isinstance(responses[0], Exception) else (f"Erreur: {responses[0]}", 0.0)
-            gemini_response, gemini_time = responses[1] if not isinstance(responses[1], Exception) else (f"Erreur: {responses[1]}", 0.0)
-            deepseek_response, deepseek_time = responses[2] if not isinstance(responses[2], Exception) else (f"Erreur: {responses[2]}", 0.0)
-            claude_response, claude_time = responses[3] if not isinstance(responses[3], Exception) else (f"Erreur: {responses[3]}", 0.0)
-            
-            message_doc.update({
-                "chatgpt_response": chatgpt_response,
-                "gemini_response": gemini_response,
-                "deepseek_response": deepseek_response,
-                "claude_response": claude_response,
-                "chatgpt_response_time": chatgpt_time,
-                "gemini_response_time": gemini_time,
-                "deepseek_response_time": deepseek_time,
-                "claude_response_time": claude_time
-            })
-            
-            response_text = f"**ChatGPT ({chatgpt_time:.2f}s):**\n{chatgpt_response}\n\n**Gemini ({gemini_time:.2f}s):**\n{gemini_response}\n\n**DeepSeek ({deepseek_time:.2f}s):**\n{deepseek_response}\n\n**Claude ({claude_time:.2f}s):**\n{claude_response}"
-            
-        elif request.mode == "chatgpt":
-            if file_doc:
-                response_text, response_time = await call_ai_with_file_context(request.message, file_doc["file_path"], file_doc["original_filename"], "chatgpt")
-            else:
-                response_text, response_time = await call_chatgpt_api(request.message)
-            message_doc["chatgpt_response"] = response_text
-            message_doc["chatgpt_response_time"] = response_time
-            
-        elif request.mode == "gemini":
-            if file_doc:
-                response_text, response_time = await call_ai_with_file_context(request.message, file_doc["file_path"], file_doc["original_filename"], "gemini")
-            else:
-                response_text, response_time = await call_gemini_api(request.message)
-            message_doc["gemini_response"] = response_text
-            message_doc["gemini_response_time"] = response_time
-            
-        elif request.mode == "deepseek":
-            if file_doc:
-                response_text, response_time = await call_ai_with_file_context(request.message, file_doc["file_path"], file_doc["original_filename"], "deepseek")
-            else:
-                response_text, response_time = await call_deepseek_api(request.message)
-            message_doc["deepseek_response"] = response_text
-            message_doc["deepseek_response_time"] = response_time
-            
-        elif request.mode == "claude":
-            if file_doc:
-                response_text, response_time = await call_ai_with_file_context(request.message, file_doc["file_path"], file_doc["original_filename"], "claude")
-            else:
-                response_text, response_time = await call_claude_api(request.message)
-            message_doc["claude_response"] = response_text
-            message_doc["claude_response_time"] = response_time
-            
-        else:
-            raise HTTPException(status_code=400, detail="Mode non supporté")
+        # Interactive single-model chats are scheduled ahead of compare fan-outs, fairly across users
+        set_call_priority("compare" if request.mode == "compare" else "interactive", current_user.id)
+        
+        # Call the APIs concurrently (through the response cache when enabled).
+        # Compare mode waits at most COMPARE_DEADLINE; single-model calls are bounded by LLM_REQUEST_TIMEOUT
+        hedged = request.fast and request.mode != "compare"
+        call = call_ai_hedged if hedged else call_ai_cached
+        tasks = {model: asyncio.create_task(call(model, prompt, file_doc)) for model in models}
+        deadline = COMPARE_DEADLINE if request.mode == "compare" else None
+        await asyncio.wait(tasks.values(), timeout=deadline)
+        
+        # Handle responses and exceptions with timing
+        response_fields = {}
+        model_responses = {}
+        timed_out = []
+        for model, task in tasks.items():
+            if not task.done():
+                timed_out.append(model)
+                response_fields[f"{model}_response"] = None
+                response_fields[f"{model}_response_time"] = None
+                response_fields[f"{model}_status"] = "timed_out"
+                model_responses[model] = ModelResponse(status="timed_out")
+                continue
+            result = task.exception() or task.result()
+            if hedged and not isinstance(result, BaseException):
+                # The answer is stored under the requested mode, with the provider that gave it
+                response_text, response_time, cached, message_doc["answered_by"] = result
+                result = (response_text, response_time, cached)
+            fields = _result_fields(model, result)
+            response_fields.update(fields)
+            model_responses[model] = ModelResponse(
+                response=fields[f"{model}_response"] or fields[f"{model}_error"],
+                response_time=fields[f"{model}_response_time"],
+                cached=fields[f"{model}_cached"],
+                status=fields[f"{model}_status"]
+            )
+        message_doc.update(response_fields)
+        message_doc["returned_at"] = datetime.utcnow()
         
         # Save message to database
         await db.chat_messages.insert_one(message_doc)
+        await record_session_message(db, message_doc, models, request.session_name)
         
-        logger.info(f"Chat message processed: {request.mode} for user {current_user.id}")
+        # Stragglers keep running and update the stored message when they finish
+        for model in timed_out:
+            completion = asyncio.create_task(_complete_in_background(db, message_id, model, tasks[model]))
+            _background_completions.add(completion)
+            completion.add_done_callback(_background_completions.discard)
         
-        # Prepare response based on mode
-        if request.mode == "compare":
-            return ChatResponse(
-                id=message_id,
-                chatgpt_response=chatgpt_response,
-                gemini_response=gemini_response,
-                deepseek_response=deepseek_response,
-                claude_response=claude_response,
-                chatgpt_response_time=chatgpt_time,
-                gemini_response_time=gemini_time,
-                deepseek_response_time=deepseek_time,
-                claude_response_time=claude_time,
-                mode=request.mode,
-                timestamp=datetime.utcnow()
-            )
+        if timed_out:
+            logger.info(f"Chat message processed: {request.mode} for user {current_user.id} (timed out: {', '.join(timed_out)})")
         else:
-            # For single model responses
-            response_data = {
-                "id": message_id,
-                "mode": request.mode,
-                "timestamp": datetime.utcnow(),
-                "chatgpt_response": None,
-                "gemini_response": None,
-                "deepseek_response": None,
-                "claude_response": None,
-                "chatgpt_response_time": None,
-                "gemini_response_time": None,
-                "deepseek_response_time": None,
-                "claude_response_time": None
-            }
-            
-            # Set the appropriate response field
-            if request.mode == "chatgpt":
-                response_data["chatgpt_response"] = response_text
-                response_data["chatgpt_response_time"] = response_time
-            elif request.mode == "gemini":
-                response_data["gemini_response"] = response_text
-                response_data["gemini_response_time"] = response_time
-            elif request.mode == "deepseek":
-                response_data["deepseek_response"] = response_text
-                response_data["deepseek_response_time"] = response_time
-            elif request.mode == "claude":
-                response_data["claude_response"] = response_text
-                response_data["claude_response_time"] = response_time
-                
-            return ChatResponse(**response_data)
+            logger.info(f"Chat message processed: {request.mode} for user {current_user.id}")
+        
+        # Errors are not stored as answers but are still shown to the user
+        display_fields = dict(response_fields)
+        for model, result in model_responses.items():
+            display_fields[f"{model}_response"] = result.response
+        
+        return ChatResponse(
+            id=message_id,
+            mode=request.mode,
+            timestamp=datetime.utcnow(),
+            responses=model_responses,
+            timed_out=timed_out,
+            answered_by=message_doc.get("answered_by"),
+            **display_fields
+        )
         
     except HTTPException:
         raise
@@ -178,63 +183,162 @@ async def chat_endpoint(
         logger.error(f"Chat error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur lors du traitement: {str(e)}")
 
-@router.get("/sessions", response_model=List[ChatSession])
-async def get_chat_sessions(current_user: User = Depends(get_current_user)):
-    """Get all chat sessions for the current user"""
+def _sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(
+    request: ChatRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Streaming chat endpoint (Server-Sent Events).
+    Tokens are forwarded as they arrive; in compare mode the compared models are
+    multiplexed onto the same stream and tagged by model. A provider error is
+    reported in the "error" field of the model's "done" event.
+    """
     db = await get_database()
     
-    try:
-        # Get unique sessions with latest message and AI response
-        pipeline = [
-            {"$match": {"user_id": current_user.id}},
-            {"$sort": {"timestamp": -1}},
-            {"$group": {
-                "_id": "$session_id",
-                "latest_message": {"$first": "$message"},
-                "latest_chatgpt_response": {"$first": "$chatgpt_response"},
-                "latest_gemini_response": {"$first": "$gemini_response"},
-                "latest_deepseek_response": {"$first": "$deepseek_response"},
-                "latest_claude_response": {"$first": "$claude_response"},
-                "latest_timestamp": {"$first": "$timestamp"},
-                "message_count": {"$sum": 1}
-            }}
-        ]
+    models = resolve_models(request.mode)
+    
+    # Vérifier si un fichier est attaché
+    prompt = request.message
+    if request.file_id:
+        file_doc = await db.files.find_one({
+            "$or": [{"file_id": request.file_id}, {"id": request.file_id}],
+            "user_id": current_user.id
+        })
+        if not file_doc:
+            raise HTTPException(status_code=404, detail="Fichier non trouvé")
+        # Le contexte est construit une seule fois pour tous les modèles, dans le budget de tokens de chacun
+        prompt = await create_context_message(
+            request.message, file_doc["file_path"], file_doc["original_filename"], file_doc.get("content_hash"), models
+        )
+    elif request.search_all_files and VECTOR_SEARCH_ENABLED:
+        prompt = await create_user_files_context_message(request.message, current_user.id, models)
+    
+    message_id = str(uuid.uuid4())
+    
+    async def event_stream():
+        set_call_priority("compare" if request.mode == "compare" else "interactive", current_user.id)
+        queue: asyncio.Queue = asyncio.Queue()
+        chunks = {model: [] for model in models}
+        errors = {}
+        timings = {}
         
-        sessions_cursor = db.chat_messages.aggregate(pipeline)
-        sessions_data = await sessions_cursor.to_list(length=None)
+        async def pump(model: str):
+            start_time = time.time()
+            first_token_time = None
+            try:
+                async for text in stream_ai_api(model, prompt):
+                    if isinstance(text, StreamError):
+                        # Erreur du fournisseur, éventuellement après une réponse partielle:
+                        # envoyée dans l'événement "done" du modèle, jamais comme token
+                        errors[model] = str(text)
+                        continue
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                    chunks[model].append(text)
+                    await queue.put(("token", model, text))
+            finally:
+                timings[model] = (first_token_time, time.time() - start_time, datetime.utcnow())
+                await queue.put(("done", model, None))
         
-        sessions = []
-        for session in sessions_data:
-            latest_message = session.get("latest_message", "Nouvelle conversation")
+        tasks = [asyncio.create_task(pump(model)) for model in models]
+        try:
+            yield _sse_event("start", {"id": message_id, "mode": request.mode, "models": models})
             
-            # Get the AI response (prioritize non-null responses)
-            ai_response = (
-                session.get("latest_chatgpt_response") or 
-                session.get("latest_gemini_response") or 
-                session.get("latest_deepseek_response") or 
-                session.get("latest_claude_response") or 
-                "Pas de réponse"
-            )
+            remaining = len(models)
+            while remaining:
+                kind, model, text = await queue.get()
+                if kind == "token":
+                    yield _sse_event("token", {"model": model, "text": text})
+                else:
+                    remaining -= 1
+                    first_token_time, response_time, _ = timings[model]
+                    yield _sse_event("done", {
+                        "model": model,
+                        "first_token_time": first_token_time,
+                        "response_time": response_time,
+                        "error": errors.get(model)
+                    })
             
-            # Create session name with both user message and AI response
-            if ai_response and ai_response != "Pas de réponse":
-                conversation_preview = f"Vous: {latest_message[:30]}... | IA: {ai_response[:30]}..."
-            else:
-                conversation_preview = f"Vous: {latest_message[:50]}..."
+            # Save the assembled message to database
+            message_doc = {
+                "id": message_id,
+                "session_id": request.session_id,
+                "message": request.message,
+                "mode": request.mode,
+                "timestamp": datetime.utcnow(),
+                "user_id": current_user.id,
+                "file_id": request.file_id
+            }
+            for model in models:
+                first_token_time, response_time, completed_at = timings[model]
+                # Le texte reçu avant une erreur est gardé comme réponse (partielle), l'erreur à part
+                message_doc[f"{model}_response"] = "".join(chunks[model]) or None
+                message_doc[f"{model}_error"] = errors.get(model)
+                message_doc[f"{model}_status"] = "error" if model in errors else "completed"
+                message_doc[f"{model}_response_time"] = response_time
+                message_doc[f"{model}_first_token_time"] = first_token_time
+                message_doc[f"{model}_completed_at"] = completed_at
+            await db.chat_messages.insert_one(message_doc)
+            await record_session_message(db, message_doc, models, request.session_name)
             
-            # Truncate if too long
-            session_name = conversation_preview[:80] + "..." if len(conversation_preview) > 80 else conversation_preview
+            logger.info(f"Chat message streamed: {request.mode} for user {current_user.id}")
+            yield _sse_event("end", {"id": message_id})
             
-            sessions.append(ChatSession(
-                session_id=session["_id"],
-                session_name=session_name,
-                created_at=session["latest_timestamp"],
-                updated_at=session["latest_timestamp"],
-                message_count=session["message_count"]
-            ))
+        except Exception as e:
+            logger.error(f"Chat stream error: {str(e)}")
+            yield _sse_event("error", {"detail": f"Erreur lors du traitement: {str(e)}"})
+        finally:
+            # Client disconnected or stream finished: stop pending provider streams
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/sessions", response_model=List[ChatSession])
+async def get_chat_sessions(
+    limit: int = Query(100, ge=1, le=500),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get the chat sessions of the current user, most recently updated first.
+    Keyset pagination: the X-Before-Cursor / X-After-Cursor headers give the
+    cursors of the older / newer pages.
+    """
+    db = await get_database()
+    
+    try:
+        # Sessions are maintained by /chat; one indexed read on (user_id, updated_at)
+        sessions, headers = await fetch_page(
+            db.sessions,
+            {"user_id": current_user.id},
+            {"_id": 0, "session_id": 1, "preview": 1, "session_name": 1, "created_at": 1, "updated_at": 1, "message_count": 1},
+            "updated_at", "session_id", limit, before, after
+        )
         
-        return sorted(sessions, key=lambda x: x.updated_at, reverse=True)
+        return json_list_response([
+            {
+                "session_id": session["session_id"],
+                "session_name": session.get("preview") or session["session_name"],
+                "created_at": session["created_at"],
+                "updated_at": session["updated_at"],
+                "message_count": session["message_count"]
+            }
+            for session in sessions
+        ], headers)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Get sessions error: {str(e)}")
         raise HTTPException(status_code=500, detail="Erreur lors de la récupération des sessions")
@@ -263,6 +367,7 @@ async def delete_session(
             "session_id": session_id,
             "user_id": current_user.id
         })
+        await db.sessions.delete_one({"session_id": session_id, "user_id": current_user.id})
         
         logger.info(f"Session deleted: {session_id} ({result.deleted_count} messages) by user {current_user.id}")
         
@@ -279,21 +384,34 @@ async def delete_session(
 @router.get("/chat/history/{session_id}", response_model=List[ChatMessage])
 async def get_chat_history(
     session_id: str,
+    limit: int = Query(200, ge=1, le=1000),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    """Get chat history for a specific session"""
+    """
+    Get chat history for a specific session, oldest first.
+    Without cursor the latest `limit` messages are returned; X-Before-Cursor
+    gives the cursor of the older messages.
+    """
     db = await get_database()
     
     try:
-        messages_cursor = db.chat_messages.find({
-            "session_id": session_id,
-            "user_id": current_user.id
-        }).sort("timestamp", 1)
-        
-        messages = await messages_cursor.to_list(length=None)
+        messages, headers = await fetch_page(
+            db.chat_messages,
+            {"session_id": session_id, "user_id": current_user.id},
+            HISTORY_PROJECTION,
+            "timestamp", "id", limit, before, after,
+            newest_first=False
+        )
+        for message in messages:
+            # Champ du modèle ChatMessage, absent des messages enregistrés
+            message.setdefault("session_name", "Nouvelle conversation")
         
-        return [ChatMessage(**message) for message in messages]
+        return json_list_response(messages, headers)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Get chat history error: {str(e)}")
         raise HTTPException(status_code=500, detail="Erreur lors de la récupération de l'historique")
@@ -311,6 +429,7 @@ async def clear_chat_history(
             "session_id": session_id,
             "user_id": current_user.id
         })
+        await db.sessions.delete_one({"session_id": session_id, "user_id": current_user.id})
         
         logger.info(f"Chat history cleared: {session_id} ({result.deleted_count} messages) by user {current_user.id}")
         
@@ -1,20 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks, Request, Query
 from fastapi.security import HTTPBearer
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from config.database import get_database
 from services.auth_service import verify_token
-from services.llm_service import call_ai_with_file_context
+from services.llm_service import call_ai_with_file_context, is_error_response
+from services.rate_limiter import set_call_priority
+from services.file_processor import invalidate_file_content, compute_file_hash
+from services.ingestion import enqueue_file, ingest_file
+from services.retrieval import invalidate_index
+from services.vector_index import remove_file_vectors
+from config.settings import VECTOR_SEARCH_ENABLED, MAX_FILE_SIZE
+from services.storage import save_upload, release_upload, blob_key, UploadTooLargeError
+from services.blob_store import blob_exists
+from services.worker_pool import run_in_thread, run_until_disconnected
+from services.pagination import fetch_page, json_list_response
+from typing import Optional
 import os
 import uuid
+import logging
 from datetime import datetime
-import aiofiles
 
+logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/files", tags=["files"])
 security = HTTPBearer()
 
-# Dossier pour stocker les fichiers uploadés
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Champs renvoyés par la liste (ni chemin sur disque ni champs internes d'ingestion)
+FILE_LIST_PROJECTION = {
+    "_id": 0, "id": 1, "file_id": 1, "original_filename": 1, "filename": 1, "file_size": 1,
+    "file_type": 1, "analysis_status": 1, "chunk_count": 1, "uploaded_at": 1
+}
 
 # Types de fichiers autorisés
 ALLOWED_EXTENSIONS = {
@@ -30,6 +44,7 @@ ALLOWED_EXTENSIONS = {
 
 @router.post("/upload")
 async def upload_file(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     token: str = Depends(security),
     db: AsyncIOMotorDatabase = Depends(get_database)
@@ -52,15 +67,17 @@ async def upload_file(
                 detail=f"Type de fichier non supporté. Extensions autorisées: {', '.join(ALLOWED_EXTENSIONS.keys())}"
             )
         
-        # Générer un nom de fichier unique
         file_id = str(uuid.uuid4())
-        filename = f"{file_id}{file_extension}"
-        file_path = os.path.join(UPLOAD_DIR, filename)
         
-        # Sauvegarder le fichier
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
+        # Sauvegarder le fichier (par morceaux, taille limitée, hash calculé au passage).
+        # Stockage par contenu: un fichier déjà uploadé (par n'importe qui) n'est pas réécrit
+        try:
+            stored = await save_upload(db, file, file_extension)
+        except UploadTooLargeError:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Fichier trop volumineux. Taille maximale: {MAX_FILE_SIZE // (1024 * 1024)} Mo"
+            )
         
         # Enregistrer les métadonnées en base
         file_doc = {
@@ -68,20 +85,31 @@ async def upload_file(
             "file_id": file_id,  # Pour compatibilité
             "user_id": user_id,
             "original_filename": file.filename,
-            "filename": filename,
-            "file_path": file_path,
-            "file_size": len(content),
+            "filename": stored.blob_key,
+            "blob_key": stored.blob_key,
+            "file_path": stored.file_path,
+            "file_size": stored.file_size,
             "file_type": file.content_type,
+            "content_hash": stored.content_hash,
             "analysis_status": "pending",
             "uploaded_at": datetime.utcnow()
         }
         
-        await db.files.insert_one(file_doc)
+        try:
+            await db.files.insert_one(file_doc)
+        except Exception:
+            await release_upload(db, file_doc)
+            raise
+        
+        # Ingestion hors du chemin de la requête (pending -> processing -> ready/failed)
+        if not await enqueue_file(file_id):
+            # Pas de worker (ex. serverless sans lifespan): traitement après la réponse
+            background_tasks.add_task(ingest_file, db, file_id)
         
         return {
             "file_id": file_id,
             "filename": file.filename,
-            "size": len(content),
+            "size": stored.file_size,
             "status": "uploaded",
             "message": "Fichier uploadé avec succès"
         }
@@ -93,10 +121,16 @@ async def upload_file(
 
 @router.get("/list")
 async def list_files(
+    limit: int = Query(100, ge=1, le=500),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
     token: str = Depends(security),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Lister les fichiers de l'utilisateur"""
+    """
+    Lister les fichiers de l'utilisateur, les plus récents d'abord.
+    Pagination par curseur: en-têtes X-Before-Cursor / X-After-Cursor.
+    """
     try:
         # Vérifier le token
         payload = verify_token(token.credentials)
@@ -106,15 +140,47 @@ async def list_files(
         if not user_id:
             raise HTTPException(status_code=401, detail="Token invalide")
         
-        # Récupérer les fichiers de l'utilisateur
-        files_cursor = db.files.find(
+        # Récupérer les fichiers de l'utilisateur (tri sur uploaded_at, indexé)
+        files, headers = await fetch_page(
+            db.files,
             {"user_id": user_id},
-            {"_id": 0, "file_path": 0}  # Exclure les champs sensibles
-        ).sort("upload_date", -1)
+            FILE_LIST_PROJECTION,
+            "uploaded_at", "id", limit, before, after
+        )
         
-        files = await files_cursor.to_list(length=None)
+        return json_list_response(files, headers)
         
-        return files
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération: {str(e)}")
+
+@router.get("/{file_id}/status")
+async def get_file_status(
+    file_id: str,
+    token: str = Depends(security),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Suivre l'avancement de l'analyse d'un fichier"""
+    try:
+        # Vérifier le token
+        payload = verify_token(token.credentials)
+        if not payload:
+            raise HTTPException(status_code=401, detail="Token invalide")
+        user_id = payload.get("user_id")
+        if not user_id:
+            raise HTTPException(status_code=401, detail="Token invalide")
+        
+        file_doc = await db.files.find_one(
+            {"$or": [{"file_id": file_id}, {"id": file_id}], "user_id": user_id},
+            {"_id": 0, "analysis_status": 1, "analysis_stage": 1, "analysis_error": 1,
+             "chunk_count": 1, "processing_started_at": 1, "processed_at": 1}
+        )
+        
+        if not file_doc:
+            raise HTTPException(status_code=404, detail="Fichier non trouvé")
+        
+        return {"file_id": file_id, **file_doc}
         
     except HTTPException:
         raise
@@ -146,15 +212,27 @@ async def delete_file(
         if not file_doc:
             raise HTTPException(status_code=404, detail="Fichier non trouvé")
         
-        # Supprimer le fichier physique
-        if os.path.exists(file_doc["file_path"]):
-            os.remove(file_doc["file_path"])
+        content_hash = file_doc.get("content_hash")
+        if not content_hash and os.path.exists(file_doc["file_path"]):
+            # Lecture complète du fichier: hors de la boucle d'événements
+            content_hash = await run_in_thread(compute_file_hash, file_doc["file_path"])
         
         # Supprimer de la base de données
         await db.files.delete_one({
             "$or": [{"file_id": file_id}, {"id": file_id}],
             "user_id": user_id
         })
+        if VECTOR_SEARCH_ENABLED:
+            await remove_file_vectors(user_id, file_doc["id"])
+        
+        # Le contenu (blob, texte extrait, chunks) est partagé: supprimé avec la dernière référence
+        # (par blob: les mêmes octets sous une autre extension ont leur propre texte et leurs chunks)
+        if await release_upload(db, file_doc) and content_hash:
+            file_extension = os.path.splitext(file_doc["file_path"])[1].lower()
+            key = file_doc.get("blob_key") or blob_key(content_hash, file_extension)
+            invalidate_file_content(content_hash, file_extension)
+            await db.file_chunks.delete_many({"blob_key": key})
+            invalidate_index(key)
         
         return {"message": "Fichier supprimé avec succès"}
         
@@ -166,6 +244,7 @@ async def delete_file(
 @router.post("/ask")
 async def ask_with_file(
     request: dict,
+    http_request: Request,
     token: str = Depends(security),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
@@ -195,19 +274,21 @@ async def ask_with_file(
         if not file_doc:
             raise HTTPException(status_code=404, detail="Fichier non trouvé")
         
-        # Vérifier que le fichier existe physiquement
+        # Traiter la question avec le contexte du fichier (extraits ou texte en cache:
+        # le blob n'est lu, et son absence constatée, qu'en cas de défaut de cache)
         file_path = file_doc["file_path"]
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="Fichier physique non trouvé")
-        
-        # Traiter la question avec le contexte du fichier
+        set_call_priority("interactive", user_id)
         try:
-            ai_response = await call_ai_with_file_context(
+            # L'extraction éventuelle est annulée si le client se déconnecte
+            ai_response = await run_until_disconnected(http_request, call_ai_with_file_context(
                 message=question,
                 file_path=file_path,
                 original_filename=file_doc["original_filename"],
-                ai_model=ai_model
-            )
+                ai_model=ai_model,
+                content_hash=file_doc.get("content_hash")
+            ))
+            if is_error_response(ai_response[0]) and not await blob_exists(file_path):
+                raise HTTPException(status_code=404, detail="Fichier physique non trouvé")
             
             return {
                 "response": ai_response,
@@ -219,6 +300,8 @@ async def ask_with_file(
                 "question": question
             }
             
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Erreur lors du traitement de la question: {str(e)}")
         
@@ -2,6 +2,12 @@ from fastapi import APIRouter, HTTPException
 from typing import List
 from config.database import get_database
 from models.schemas import StatusCheck, StatusCheckCreate
+from services.worker_pool import get_pool_stats
+from services.response_cache import get_cache_stats
+from services.latency import get_latency_stats
+from services.rate_limiter import get_provider_stats
+from services.blob_store import get_blob_cache_stats
+from services.token_budget import get_tokenizer_stats
 import uuid
 import logging
 from datetime import datetime
@@ -46,4 +52,39 @@ async def get_status_checks():
         
     except Exception as e:
         logger.error(f"Get status checks error: {str(e)}")
-        raise HTTPException(status_code=500, detail="Erreur lors de la récupération des statuts")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Erreur lors de la récupération des statuts")
+
+@router.get("/extraction")
+async def get_extraction_stats():
+    """Queue depth and counters of the document extraction pools"""
+    return get_pool_stats()
+
+
+@router.get("/cache")
+async def get_response_cache_stats():
+    """Hit/miss counters of the response cache"""
+    return get_cache_stats()
+
+
+@router.get("/latency")
+async def get_provider_latency_stats():
+    """Rolling latency percentiles of each provider"""
+    return get_latency_stats()
+
+
+@router.get("/providers")
+async def get_provider_scheduler_stats():
+    """Queue depth, rate limit and circuit breaker state of each provider"""
+    return get_provider_stats()
+
+
+@router.get("/storage")
+async def get_storage_cache_stats():
+    """Size and hit/miss counters of the local cache of remote blobs"""
+    return get_blob_cache_stats()
+
+
+@router.get("/tokenizers")
+async def get_prompt_tokenizer_stats():
+    """Local tokenizers available and calibration of the token estimate of the other providers"""
+    return get_tokenizer_stats()
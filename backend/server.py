@@ -1,4 +1,5 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import uvicorn
@@ -7,9 +8,17 @@ import logging
 # Import configuration
 from config.settings import (
     API_TITLE, API_VERSION, CORS_ORIGINS, CORS_CREDENTIALS,
-    CORS_METHODS, CORS_HEADERS, HOST, PORT, RELOAD
+    CORS_METHODS, CORS_HEADERS, HOST, PORT, RELOAD, RESPONSE_CACHE_ENABLED, MAX_FILE_SIZE, VECTOR_SEARCH_ENABLED
 )
 from config.database import connect_to_mongo, close_mongo_connection
+from services.http_client import open_http_sessions, close_http_sessions
+from services.providers import PROVIDERS
+from services.worker_pool import shutdown_pools
+from services.token_budget import load_tokenizers
+from services.embeddings import load_embedder
+from services.ingestion import start_ingestion_workers, stop_ingestion_workers
+from services.response_cache import ensure_response_cache_indexes
+from services.pagination import BEFORE_CURSOR_HEADER, AFTER_CURSOR_HEADER
 
 # Import routes
 from routes.auth import router as auth_router
@@ -30,9 +39,23 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up AI Chatbot API...")
     await connect_to_mongo()
+    if RESPONSE_CACHE_ENABLED:
+        await ensure_response_cache_indexes()
+    await open_http_sessions(list(PROVIDERS))
+    await load_tokenizers()
+    if VECTOR_SEARCH_ENABLED:
+        try:
+            await load_embedder()
+        except Exception as e:
+            # Retried at the first indexing or search
+            logger.error(f"Embedding provider unavailable: {str(e)}")
+    await start_ingestion_workers()
     yield
     # Shutdown
     logger.info("Shutting down AI Chatbot API...")
+    await stop_ingestion_workers()
+    await close_http_sessions()
+    shutdown_pools()
     await close_mongo_connection()
 
 # Create FastAPI application
@@ -42,6 +65,21 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Reject oversized uploads from Content-Length before the multipart body is read
+# (declared before CORS so the 413 still carries the CORS headers)
+UPLOAD_MULTIPART_OVERHEAD = 64 * 1024
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    if request.method == "POST" and request.url.path.endswith("/files/upload"):
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_FILE_SIZE + UPLOAD_MULTIPART_OVERHEAD:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"Fichier trop volumineux. Taille maximale: {MAX_FILE_SIZE // (1024 * 1024)} Mo"}
+            )
+    return await call_next(request)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -49,6 +87,7 @@ app.add_middleware(
     allow_credentials=CORS_CREDENTIALS,
     allow_methods=CORS_METHODS,
     allow_headers=CORS_HEADERS,
+    expose_headers=[BEFORE_CURSOR_HEADER, AFTER_CURSOR_HEADER],
 )
 
 # Include routers
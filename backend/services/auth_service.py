@@ -1,16 +1,33 @@
 import hashlib
+import time
+from collections import OrderedDict
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
-from config.settings import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from config.settings import (
+    SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES,
+    AUTH_USER_CACHE_TTL, AUTH_USER_CACHE_SIZE, AUTH_NEGATIVE_CACHE_TTL, AUTH_TOKEN_CACHE_SIZE
+)
 from config.database import get_database
 from models.schemas import User
 
 security = HTTPBearer(auto_error=False)
 
+class AuthCache:
+    """
+    Per-process caches of get_current_user: active users by id (TTL + LRU),
+    ids not found in the database (short TTL) and verified token payloads
+    (until the token expires). Other workers see a change after the TTL.
+    """
+    users: "OrderedDict[str, Tuple[float, Optional[User]]]" = OrderedDict()  # user_id -> (expires, user or None)
+    tokens: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()  # token -> (exp, payload)
+
+# Global auth cache
+auth_cache = AuthCache()
+
 def hash_password(password: str) -> str:
     """Hash password using SHA-256"""
     return hashlib.sha256(password.encode()).hexdigest()
@@ -27,12 +44,39 @@ def create_access_token(data: dict) -> str:
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def verify_token(token: str) -> Optional[dict]:
-    """Verify JWT token"""
+    """Verify JWT token (verified payloads are cached for the token's remaining lifetime)"""
+    entry = auth_cache.tokens.get(token)
+    if entry is not None:
+        if entry[0] > time.time():
+            auth_cache.tokens.move_to_end(token)
+            return entry[1]
+        auth_cache.tokens.pop(token, None)
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError:
         return None
+    if "exp" in payload:
+        auth_cache.tokens[token] = (float(payload["exp"]), payload)
+        while len(auth_cache.tokens) > AUTH_TOKEN_CACHE_SIZE:
+            auth_cache.tokens.popitem(last=False)
+    return payload
+
+def _cache_entry(user_id: str, ttl: float, user: Optional[User]):
+    auth_cache.users[user_id] = (time.time() + ttl, user)
+    auth_cache.users.move_to_end(user_id)
+    while len(auth_cache.users) > AUTH_USER_CACHE_SIZE:
+        auth_cache.users.popitem(last=False)
+
+def cache_user(user: User):
+    """Cache an active user (e.g. right after login)"""
+    if not user.is_active:
+        invalidate_user(user.id)
+        return
+    _cache_entry(user.id, AUTH_USER_CACHE_TTL, user)
+
+def invalidate_user(user_id: str):
+    """To call whenever a user is created, changed, deactivated or deleted"""
+    auth_cache.users.pop(user_id, None)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Get current user from JWT token"""
@@ -47,10 +91,24 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     if not user_id:
         raise HTTPException(status_code=401, detail="Token invalide")
     
+    entry = auth_cache.users.get(user_id)
+    if entry is not None:
+        expires, user = entry
+        if expires > time.time():
+            auth_cache.users.move_to_end(user_id)
+            if user is None:
+                raise HTTPException(status_code=401, detail="Utilisateur non trouvé")
+            return user
+        auth_cache.users.pop(user_id, None)
+    
     # Get user from database
     db = await get_database()
     user = await db.users.find_one({"id": user_id})
     if not user:
+        # Cache négatif court: un token d'utilisateur supprimé ne coûte pas une requête à chaque appel
+        _cache_entry(user_id, AUTH_NEGATIVE_CACHE_TTL, None)
         raise HTTPException(status_code=401, detail="Utilisateur non trouvé")
     
-    return User(**user)
\ No newline at end of file
+    user = User(**user)
+    cache_user(user)
+    return user
\ No newline at end of file
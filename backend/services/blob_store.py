@@ -0,0 +1,370 @@
+import asyncio
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import aiofiles
+from config.settings import (
+    UPLOAD_DIR, UPLOAD_CHUNK_SIZE, STORAGE_BACKEND, S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_REGION,
+    S3_ACCESS_KEY_ID, S3_SECRET_ACCESS_KEY, S3_MULTIPART_CHUNK_SIZE, STORAGE_CACHE_DIR, STORAGE_CACHE_MAX_BYTES
+)
+from services.worker_pool import run_in_io_thread, run_in_thread
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # optional: local storage only
+    boto3 = None
+
+logger = logging.getLogger(__name__)
+
+S3_SCHEME = "s3://"
+# Timeout of one blocking transfer (upload or download of a whole blob)
+TRANSFER_TIMEOUT = 300
+
+class BlobStore:
+    """
+    Where upload contents live. Blobs are written by key (see storage.blob_key)
+    and then addressed by their location, the string stored in files.file_path
+    and blobs.path, so documents written under another backend stay readable.
+    """
+
+    def location(self, key: str) -> str:
+        raise NotImplementedError
+
+    async def put_file(self, key: str, source_path: str) -> str:
+        """Store a local file (consumed) under key; returns its location"""
+        raise NotImplementedError
+
+    async def exists(self, location: str) -> bool:
+        raise NotImplementedError
+
+    async def delete(self, location: str):
+        raise NotImplementedError
+
+    async def read_range(self, location: str, start: int, end: Optional[int] = None) -> bytes:
+        """Bytes [start, end) of a blob (to the end when end is None)"""
+        raise NotImplementedError
+
+    def iter_chunks(self, location: str, start: int = 0, end: Optional[int] = None, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """Stream bytes [start, end) of a blob by chunks"""
+        raise NotImplementedError
+
+    def local_copy(self, location: str):
+        """
+        Async context manager giving the path of a local, seekable copy of the
+        blob (what the parsers open), valid until the block exits.
+        """
+        raise NotImplementedError
+
+class LocalBlobStore(BlobStore):
+    """Blobs on the local disk, sharded by the first two characters of the key"""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def location(self, key: str) -> str:
+        return str(self.root / key[:2] / key)
+
+    async def put_file(self, key: str, source_path: str) -> str:
+        location = self.location(key)
+        os.makedirs(os.path.dirname(location), exist_ok=True)
+        os.replace(source_path, location)
+        return location
+
+    async def exists(self, location: str) -> bool:
+        return os.path.exists(location)
+
+    async def delete(self, location: str):
+        try:
+            os.remove(location)
+        except FileNotFoundError:
+            pass
+
+    async def read_range(self, location: str, start: int, end: Optional[int] = None) -> bytes:
+        async with aiofiles.open(location, "rb") as f:
+            await f.seek(start)
+            return await f.read(-1 if end is None else max(0, end - start))
+
+    async def iter_chunks(self, location: str, start: int = 0, end: Optional[int] = None, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        async with aiofiles.open(location, "rb") as f:
+            await f.seek(start)
+            position = start
+            while end is None or position < end:
+                chunk = await f.read(chunk_size if end is None else min(chunk_size, end - position))
+                if not chunk:
+                    break
+                position += len(chunk)
+                yield chunk
+
+    @asynccontextmanager
+    async def local_copy(self, location: str):
+        if not os.path.exists(location):
+            raise FileNotFoundError(location)
+        yield location
+
+class BlobCache:
+    """
+    Read-through disk cache of remote blobs, evicted least recently used
+    first once it holds more than max_bytes. Copies in use (between open and
+    the end of its block) are pinned and never evicted.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, int]" = OrderedDict()  # key -> size, oldest first
+        self.total = 0
+        self.loaded = False
+        self.load_lock = asyncio.Lock()
+        self.locks: Dict[str, asyncio.Lock] = {}
+        self.pins: Dict[str, int] = {}  # key -> readers holding its copy
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key
+
+    def _scan(self) -> List[Tuple[str, int]]:
+        # Copies left by a previous run are reused, oldest access first
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = [entry for entry in os.scandir(self.directory) if entry.is_file() and not entry.name.endswith(".part")]
+        return [(entry.name, entry.stat().st_size) for entry in sorted(files, key=lambda entry: entry.stat().st_atime)]
+
+    async def _load(self):
+        async with self.load_lock:
+            if self.loaded:
+                return
+            for key, size in await run_in_thread(self._scan):
+                self.entries[key] = size
+                self.total += size
+            self.loaded = True
+
+    def _evict(self):
+        for key in list(self.entries):
+            if self.total <= self.max_bytes:
+                break
+            if self.pins.get(key):
+                continue
+            size = self.entries.pop(key)
+            self.total -= size
+            self._path(key).unlink(missing_ok=True)
+            logger.info(f"Blob cache evicted {key} ({size} bytes)")
+
+    @asynccontextmanager
+    async def open(self, key: str, download):
+        """Path of key, downloaded with download(key, path) on a miss; pinned until the block exits"""
+        self.pins[key] = self.pins.get(key, 0) + 1
+        try:
+            yield await self._fetch(key, download)
+        finally:
+            self.pins[key] -= 1
+            if not self.pins[key]:
+                del self.pins[key]
+                self._evict()
+
+    async def _fetch(self, key: str, download) -> str:
+        if not self.loaded:
+            await self._load()
+        path = self._path(key)
+        if key in self.entries and path.exists():
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return str(path)
+
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            if key not in self.entries or not path.exists():
+                self.misses += 1
+                tmp_path = self.directory / f"{key}.{uuid.uuid4().hex}.part"
+                try:
+                    await download(key, str(tmp_path))
+                    os.replace(tmp_path, path)
+                finally:
+                    tmp_path.unlink(missing_ok=True)
+                self.total -= self.entries.pop(key, 0)
+                self.entries[key] = path.stat().st_size
+                self.total += self.entries[key]
+                self._evict()
+            else:
+                self.entries.move_to_end(key)
+        self.locks.pop(key, None)
+        return str(path)
+
+    def discard(self, key: str):
+        self.total -= self.entries.pop(key, 0)
+        self._path(key).unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "bytes": self.total, "max_bytes": self.max_bytes, "pinned": len(self.pins), "hits": self.hits, "misses": self.misses}
+
+class S3BlobStore(BlobStore):
+    """
+    Blobs in an S3-compatible object store. Uploads above
+    S3_MULTIPART_CHUNK_SIZE go multipart, reads use Range requests and the
+    parsers get a copy from the local read-through cache.
+    """
+
+    def __init__(self, bucket: str, prefix: str, cache: BlobCache):
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 nécessite boto3 (pip install boto3)")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 nécessite S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache = cache
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=S3_ENDPOINT_URL,
+            region_name=S3_REGION,
+            aws_access_key_id=S3_ACCESS_KEY_ID,
+            aws_secret_access_key=S3_SECRET_ACCESS_KEY
+        )
+        chunk_size = max(S3_MULTIPART_CHUNK_SIZE, 5 * 1024 * 1024)
+        self.transfer_config = TransferConfig(multipart_threshold=chunk_size, multipart_chunksize=chunk_size)
+
+    def location(self, key: str) -> str:
+        return f"{S3_SCHEME}{self.bucket}/{self.prefix}{key}"
+
+    @staticmethod
+    def _split(location: str) -> tuple[str, str]:
+        bucket, _, object_key = location[len(S3_SCHEME):].partition("/")
+        return bucket, object_key
+
+    async def put_file(self, key: str, source_path: str) -> str:
+        location = self.location(key)
+        bucket, object_key = self._split(location)
+        await run_in_io_thread(
+            lambda: self.client.upload_file(source_path, bucket, object_key, Config=self.transfer_config),
+            timeout=TRANSFER_TIMEOUT
+        )
+        os.remove(source_path)
+        return location
+
+    async def exists(self, location: str) -> bool:
+        bucket, object_key = self._split(location)
+        try:
+            await run_in_io_thread(lambda: self.client.head_object(Bucket=bucket, Key=object_key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    async def delete(self, location: str):
+        bucket, object_key = self._split(location)
+        await run_in_io_thread(lambda: self.client.delete_object(Bucket=bucket, Key=object_key))
+        self.cache.discard(os.path.basename(object_key))
+
+    def _get_object(self, location: str, start: int, end: Optional[int]):
+        bucket, object_key = self._split(location)
+        byte_range = f"bytes={start}-" if end is None else f"bytes={start}-{end - 1}"
+        try:
+            return self.client.get_object(Bucket=bucket, Key=object_key, Range=byte_range)["Body"]
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError(location)
+            if code == "InvalidRange":
+                return None  # plage au-delà de la fin (objet vide)
+            raise
+
+    async def read_range(self, location: str, start: int, end: Optional[int] = None) -> bytes:
+        if end is not None and end <= start:
+            return b""
+        body = await run_in_io_thread(self._get_object, location, start, end)
+        if body is None:
+            return b""
+        try:
+            return await run_in_io_thread(body.read)
+        finally:
+            body.close()
+
+    async def iter_chunks(self, location: str, start: int = 0, end: Optional[int] = None, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        if end is not None and end <= start:
+            return
+        body = await run_in_io_thread(self._get_object, location, start, end)
+        if body is None:
+            return
+        try:
+            while True:
+                chunk = await run_in_io_thread(body.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    @asynccontextmanager
+    async def local_copy(self, location: str):
+        bucket, object_key = self._split(location)
+
+        async def download(key: str, path: str):
+            # Large objects are fetched with parallel ranged GETs
+            await run_in_io_thread(
+                lambda: self.client.download_file(bucket, object_key, path, Config=self.transfer_config),
+                timeout=TRANSFER_TIMEOUT
+            )
+
+        try:
+            async with self.cache.open(os.path.basename(object_key), download) as path:
+                yield path
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError(location)
+            raise
+
+class BlobStores:
+    """Storage backends, created on first use"""
+    local: Optional[LocalBlobStore] = None
+    s3: Optional[S3BlobStore] = None
+    cache = BlobCache(STORAGE_CACHE_DIR, STORAGE_CACHE_MAX_BYTES)
+
+# Global storage backends
+blob_stores = BlobStores()
+
+def _local_store() -> LocalBlobStore:
+    if blob_stores.local is None:
+        blob_stores.local = LocalBlobStore(UPLOAD_DIR / "blobs")
+    return blob_stores.local
+
+def _s3_store() -> S3BlobStore:
+    if blob_stores.s3 is None:
+        blob_stores.s3 = S3BlobStore(S3_BUCKET, S3_PREFIX, blob_stores.cache)
+    return blob_stores.s3
+
+def get_upload_store() -> BlobStore:
+    """Backend new uploads are written to (STORAGE_BACKEND)"""
+    if STORAGE_BACKEND == "s3":
+        return _s3_store()
+    return _local_store()
+
+def get_store(location: str) -> BlobStore:
+    """Backend holding an existing blob, from its location"""
+    return _s3_store() if location.startswith(S3_SCHEME) else _local_store()
+
+async def blob_exists(location: str) -> bool:
+    return await get_store(location).exists(location)
+
+async def delete_blob(location: str):
+    await get_store(location).delete(location)
+
+async def read_blob_range(location: str, start: int, end: Optional[int] = None) -> bytes:
+    return await get_store(location).read_range(location, start, end)
+
+def iter_blob(location: str, start: int = 0, end: Optional[int] = None, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    return get_store(location).iter_chunks(location, start, end, chunk_size)
+
+def local_copy(location: str):
+    """
+    async with local_copy(location) as path: local copy of a blob for the
+    parsers, kept until the block exits (FileNotFoundError if it is gone)
+    """
+    return get_store(location).local_copy(location)
+
+def get_blob_cache_stats() -> dict:
+    return blob_stores.cache.stats()
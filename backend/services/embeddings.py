@@ -0,0 +1,132 @@
+import logging
+import threading
+import zlib
+from typing import Callable, Dict, List
+import numpy as np
+from config.settings import OPENAI_API_KEY, EMBEDDING_PROVIDER, EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE
+from services.http_client import get_http_session
+from services.rate_limiter import get_limiter
+from services.retrieval import tokenize
+from services.worker_pool import run_in_thread
+
+logger = logging.getLogger(__name__)
+
+# Seconds to create the embedder (a local model may be downloaded on first run)
+EMBEDDER_LOAD_TIMEOUT = 600
+
+class Embedder:
+    """Turns texts into L2-normalised float32 vectors"""
+    name: str = ""
+    dim: int = 0
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+class HashingEmbedder(Embedder):
+    """
+    CPU-only, dependency-free embedder: signed feature hashing of terms and
+    term bigrams with sublinear term frequency. Lexical rather than semantic,
+    but needs no model download.
+    """
+    name = "hashing"
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _embed_sync(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                h = zlib.crc32(feature.encode("utf-8"))
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        return _normalize(vectors)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return await run_in_thread(self._embed_sync, texts)
+
+class SentenceTransformerEmbedder(Embedder):
+    """Local CPU model through sentence-transformers (optional dependency)"""
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str = ""):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name or "all-MiniLM-L6-v2", device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def _embed_sync(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(texts, batch_size=EMBEDDING_BATCH_SIZE, convert_to_numpy=True)
+        return _normalize(np.asarray(vectors, dtype=np.float32))
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return await run_in_thread(self._embed_sync, texts)
+
+class OpenAIEmbedder(Embedder):
+    """OpenAI embeddings API, through the shared provider session"""
+    name = "openai"
+
+    def __init__(self, model_name: str = ""):
+        self.model = model_name or "text-embedding-3-small"
+        self.dim = 3072 if self.model.endswith("-large") else 1536
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        session = get_http_session("chatgpt")
+        # Shares the ChatGPT call slots, under the priority of the caller (batch during ingestion)
+        async with get_limiter("chatgpt").slot():
+            async with session.post(
+                "https://api.openai.com/v1/embeddings",
+                headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
+                json={"model": self.model, "input": texts}
+            ) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"OpenAI embeddings error {response.status}: {await response.text()}")
+                data = await response.json()
+        vectors = [item["embedding"] for item in sorted(data["data"], key=lambda item: item["index"])]
+        return _normalize(np.asarray(vectors, dtype=np.float32))
+
+# Registry of embedding providers, by name
+EMBEDDERS: Dict[str, Callable[[], Embedder]] = {
+    "hashing": lambda: HashingEmbedder(),
+    "sentence-transformers": lambda: SentenceTransformerEmbedder(EMBEDDING_MODEL),
+    "openai": lambda: OpenAIEmbedder(EMBEDDING_MODEL),
+}
+
+_embedder: Embedder = None
+_embedder_lock = threading.Lock()
+
+def get_embedder() -> Embedder:
+    """Return the configured embedder (created once; blocking, see load_embedder)"""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            factory = EMBEDDERS.get(EMBEDDING_PROVIDER)
+            if factory is None:
+                logger.warning(f"Unknown EMBEDDING_PROVIDER '{EMBEDDING_PROVIDER}', using hashing")
+                factory = EMBEDDERS["hashing"]
+            _embedder = factory()
+            logger.info(f"Embedding provider: {_embedder.name} (dim={_embedder.dim})")
+    return _embedder
+
+async def load_embedder() -> Embedder:
+    """The configured embedder, created in the thread pool (loading a local model blocks)"""
+    if _embedder is not None:
+        return _embedder
+    return await run_in_thread(get_embedder, timeout=EMBEDDER_LOAD_TIMEOUT)
+
+async def embed_texts(texts: List[str]) -> np.ndarray:
+    """Embed texts in batches of EMBEDDING_BATCH_SIZE"""
+    embedder = await load_embedder()
+    if not texts:
+        return np.zeros((0, embedder.dim), dtype=np.float32)
+    batches = [
+        await embedder.embed(texts[start:start + EMBEDDING_BATCH_SIZE])
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE)
+    ]
+    return np.vstack(batches)
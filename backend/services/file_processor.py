@@ -1,168 +1,395 @@
 import os
+import asyncio
+import codecs
+import hashlib
 import aiofiles
 import PyPDF2
 import docx
+import openpyxl
 import json
 import xml.etree.ElementTree as ET
 import csv
-from typing import Optional
+from contextlib import asynccontextmanager
+from datetime import datetime, time as dt_time
+from typing import Dict, List, Optional, Tuple
 import logging
+from config.settings import (
+    EXTRACTION_CACHE_DIR, PDF_PARALLEL_MIN_PAGES, PDF_PAGES_PER_JOB,
+    XLSX_MAX_ROWS_PER_SHEET, XLSX_MAX_SHEETS, XLSX_MAX_CELL_CHARS, TABLE_PROFILE_MAX_ROWS,
+    STRUCTURED_OUTLINE_MIN_BYTES
+)
+from services.worker_pool import run_in_process, run_in_thread
+from services.blob_store import local_copy, read_blob_range, iter_blob
+from services.table_profiler import TableProfiler
+from services.structure_outline import outline_json, outline_xml
 
 logger = logging.getLogger(__name__)
 
-async def extract_file_content(file_path: str, file_extension: str) -> Optional[str]:
+# Verrous par contenu: les extractions concurrentes d'un même fichier n'en font qu'une
+_extraction_locks: Dict[str, List] = {}  # key -> [lock, users]
+
+# Libellés des messages d'erreur d'extraction, par extension
+EXTRACTION_LABELS = {
+    '.txt': "du fichier texte", '.md': "du fichier Markdown", '.pdf': "du PDF",
+    '.docx': "du document Word", '.csv': "du fichier CSV", '.xlsx': "du fichier Excel",
+    '.json': "du fichier JSON", '.xml': "du fichier XML"
+}
+
+# Lus directement depuis le stockage (Range GET / streaming), sans copie locale du blob;
+# les autres formats sont analysés dans le pool de processus et demandent un fichier local
+STREAMED_EXTENSIONS = {'.txt', '.md'}
+# Extractions qui s'arrêtent à max_chars: un résultat obtenu avec un budget n'est jamais mis en cache
+BUDGETED_EXTENSIONS = {'.txt', '.md', '.pdf', '.xlsx'}
+
+class ExtractionError(Exception):
+    """The file could not be parsed (corrupt or not in the format of its extension)"""
+
+def compute_file_hash(file_path: str) -> str:
+    """Calcule le SHA-256 d'un fichier par blocs"""
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def _cache_key(content_hash: str, file_extension: str) -> str:
+    # Comme storage.blob_key: le texte extrait dépend aussi de l'extension
+    return f"{content_hash}{file_extension}"
+
+def _cache_path(key: str):
+    return EXTRACTION_CACHE_DIR / f"{key}.txt"
+
+@asynccontextmanager
+async def _extraction_lock(key: str):
+    entry = _extraction_locks.get(key)
+    if entry is None:
+        entry = _extraction_locks[key] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _extraction_locks[key]
+
+async def get_file_content(file_path: str, file_extension: str, content_hash: Optional[str] = None, max_chars: Optional[int] = None) -> Optional[str]:
+    """
+    Retourne le contenu textuel d'un fichier en passant par le cache d'extraction.
+    Le fichier n'est analysé qu'une fois par contenu (clé: SHA-256 + extension);
+    un blob distant n'est téléchargé (cache local) qu'en cas d'absence du texte en cache.
+    Avec max_chars, une extraction manquante peut s'arrêter au budget pour les
+    formats de BUDGETED_EXTENSIONS: ce résultat n'est jamais mis en cache, même
+    plus court que le budget (l'ingestion extrait le fichier entier). Les autres
+    formats sont extraits en entier et mis en cache; l'appelant coupe au budget.
+    Lève ExtractionError si le fichier ne peut pas être analysé (rien n'est mis en cache).
+    """
+    if not content_hash:
+        try:
+            async with local_copy(file_path) as local_path:
+                content_hash = await run_in_thread(compute_file_hash, local_path)
+        except FileNotFoundError:
+            logger.error(f"Fichier non trouvé: {file_path}")
+            return None
+    
+    key = _cache_key(content_hash, file_extension)
+    cache_path = _cache_path(key)
+    async with _extraction_lock(key):
+        if cache_path.exists():
+            async with aiofiles.open(cache_path, 'r', encoding='utf-8') as f:
+                return await f.read()
+        
+        budgeted = max_chars is not None and file_extension in BUDGETED_EXTENSIONS
+        content = await _extract_blob(file_path, file_extension, max_chars if budgeted else None)
+        if content is None or budgeted:
+            return content
+        
+        # Écriture atomique pour ne jamais servir un cache partiel
+        tmp_path = cache_path.with_suffix('.tmp')
+        async with aiofiles.open(tmp_path, 'w', encoding='utf-8') as f:
+            await f.write(content)
+        os.replace(tmp_path, cache_path)
+        return content
+
+async def _extract_blob(file_path: str, file_extension: str, max_chars: Optional[int]) -> Optional[str]:
+    """Extraction d'un blob: lu dans le stockage, ou sur une copie locale gardée pendant l'analyse"""
+    if file_extension in STREAMED_EXTENSIONS:
+        return await extract_file_content(file_path, file_extension, max_chars)
+    try:
+        async with local_copy(file_path) as local_path:
+            return await extract_file_content(local_path, file_extension, max_chars)
+    except FileNotFoundError:
+        logger.error(f"Fichier non trouvé: {file_path}")
+        return None
+
+def invalidate_file_content(content_hash: str, file_extension: str):
+    """Supprime l'entrée du cache d'extraction d'un fichier"""
+    key = _cache_key(content_hash, file_extension)
+    try:
+        _cache_path(key).unlink(missing_ok=True)
+    except Exception as e:
+        logger.error(f"Erreur lors de l'invalidation du cache {key}: {str(e)}")
+
+async def extract_file_content(file_path: str, file_extension: str, max_chars: Optional[int] = None) -> Optional[str]:
     """
-    Extrait le contenu textuel d'un fichier selon son extension
+    Extrait le contenu textuel d'un fichier selon son extension.
+    max_chars borne le texte dont l'appelant a besoin (les formats qui le
+    permettent s'arrêtent plus tôt; le résultat peut le dépasser).
+    None si le fichier manque ou si l'extension n'est pas supportée;
+    ExtractionError si son contenu ne peut pas être analysé.
     """
     try:
+        if file_extension in STREAMED_EXTENSIONS:
+            # Markdown comme texte
+            return await extract_txt_content(file_path, max_chars)
+        
         if not os.path.exists(file_path):
             logger.error(f"Fichier non trouvé: {file_path}")
             return None
             
-        if file_extension == '.txt':
-            return await extract_txt_content(file_path)
-        elif file_extension == '.pdf':
-            return await extract_pdf_content(file_path)
+        if file_extension == '.pdf':
+            return await extract_pdf_content(file_path, max_chars)
         elif file_extension == '.docx':
             return await extract_docx_content(file_path)
         elif file_extension == '.csv':
             return await extract_csv_content(file_path)
         elif file_extension == '.xlsx':
-            return await extract_xlsx_content(file_path)
+            return await extract_xlsx_content(file_path, max_chars)
         elif file_extension == '.json':
             return await extract_json_content(file_path)
         elif file_extension == '.xml':
             return await extract_xml_content(file_path)
-        elif file_extension == '.md':
-            return await extract_txt_content(file_path)  # Markdown comme texte
         else:
             logger.warning(f"Extension non supportée pour l'extraction: {file_extension}")
             return None
             
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        raise
+    except FileNotFoundError:
+        logger.error(f"Fichier non trouvé: {file_path}")
+        return None
     except Exception as e:
         logger.error(f"Erreur lors de l'extraction du contenu de {file_path}: {str(e)}")
-        return None
+        label = EXTRACTION_LABELS.get(file_extension, "du fichier")
+        raise ExtractionError(f"Erreur lors de la lecture {label}: {str(e) or type(e).__name__}") from e
 
-async def extract_txt_content(file_path: str) -> str:
-    """Extrait le contenu d'un fichier texte"""
-    async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-        return await f.read()
+async def extract_txt_content(file_path: str, max_chars: Optional[int] = None) -> str:
+    """
+    Extrait le contenu d'un fichier texte depuis son emplacement (local ou S3),
+    par morceaux; avec max_chars seul le début du blob est lu (lecture par plage).
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    if max_chars is not None:
+        # Au plus 4 octets par caractère; un caractère coupé en fin de plage est écarté
+        return decoder.decode(await read_blob_range(file_path, 0, max_chars * 4 + 4))
+    parts = [decoder.decode(chunk) async for chunk in iter_blob(file_path)]
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
 
-async def extract_pdf_content(file_path: str) -> str:
-    """Extrait le contenu d'un fichier PDF"""
-    content = ""
+async def extract_pdf_content(file_path: str, max_chars: Optional[int] = None, page_range: Optional[Tuple[int, int]] = None) -> str:
+    """
+    Extrait le contenu d'un fichier PDF (dans le pool de processus).
+    Avec max_chars, l'extraction s'arrête dès que le budget est atteint; sans
+    budget, les longs documents sont découpés en lots de pages analysés en parallèle.
+    """
+    if max_chars is not None:
+        content, _ = await run_in_process(_extract_pdf_sync, file_path, max_chars, page_range)
+        return content
+    
+    # Le premier job donne aussi le nombre de pages: un long document n'y lit que son premier lot
+    content, page_count = await run_in_process(_extract_pdf_sync, file_path, None, page_range, PDF_PARALLEL_MIN_PAGES)
+    start, end = _pdf_page_range(page_range, page_count)
+    if end - start < PDF_PARALLEL_MIN_PAGES:
+        return content
+    batches = await asyncio.gather(*(
+        run_in_process(_extract_pdf_sync, file_path, None, (batch_start, min(batch_start + PDF_PAGES_PER_JOB, end)))
+        for batch_start in range(start + PDF_PAGES_PER_JOB, end, PDF_PAGES_PER_JOB)
+    ))
+    return content + "".join(batch for batch, _ in batches)
+
+def _pdf_page_range(page_range: Optional[Tuple[int, int]], page_count: int) -> Tuple[int, int]:
+    start, end = page_range or (0, page_count)
+    return max(0, start), min(end, page_count)
+
+def _pdf_page_text(pdf_reader, page_num: int) -> str:
     try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                content += page.extract_text() + "\n"
+        return pdf_reader.pages[page_num].extract_text() or ""
     except Exception as e:
-        logger.error(f"Erreur lors de l'extraction PDF: {str(e)}")
-        return f"Erreur lors de la lecture du PDF: {str(e)}"
-    return content
+        # Une page illisible n'empêche pas de lire les autres
+        logger.warning(f"Page PDF {page_num + 1} illisible: {str(e)}")
+        return ""
+
+def _extract_pdf_sync(file_path: str, max_chars: Optional[int] = None, page_range: Optional[Tuple[int, int]] = None,
+                      parallel_min_pages: Optional[int] = None) -> Tuple[str, int]:
+    """
+    Texte des pages de page_range et nombre de pages du document. Les pages
+    sont analysées une à une: la mémoire reste bornée quelle que soit la
+    taille du document. Une plage d'au moins parallel_min_pages pages
+    s'arrête après son premier lot (PDF_PAGES_PER_JOB pages): la suite est
+    répartie entre d'autres jobs.
+    """
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        page_count = len(pdf_reader.pages)
+        start, end = _pdf_page_range(page_range, page_count)
+        if parallel_min_pages is not None and end - start >= parallel_min_pages:
+            end = min(end, start + PDF_PAGES_PER_JOB)
+        parts: List[str] = []
+        length = 0
+        for page_num in range(start, end):
+            text = _pdf_page_text(pdf_reader, page_num)
+            parts.append(text)
+            parts.append("\n")
+            length += len(text) + 1
+            if max_chars is not None and length >= max_chars:
+                break
+    return "".join(parts), page_count
 
 async def extract_docx_content(file_path: str) -> str:
-    """Extrait le contenu d'un fichier DOCX"""
-    try:
-        doc = docx.Document(file_path)
-        content = ""
-        for paragraph in doc.paragraphs:
-            content += paragraph.text + "\n"
-        return content
-    except Exception as e:
-        logger.error(f"Erreur lors de l'extraction DOCX: {str(e)}")
-        return f"Erreur lors de la lecture du document Word: {str(e)}"
+    """Extrait le contenu d'un fichier DOCX (dans le pool de processus)"""
+    return await run_in_process(_extract_docx_sync, file_path)
+
+def _extract_docx_sync(file_path: str) -> str:
+    doc = docx.Document(file_path)
+    content = ""
+    for paragraph in doc.paragraphs:
+        content += paragraph.text + "\n"
+    return content
 
 async def extract_csv_content(file_path: str) -> str:
-    """Extrait le contenu d'un fichier CSV"""
-    try:
-        content = "Contenu du fichier CSV:\n\n"
-        with open(file_path, 'r', encoding='utf-8', newline='') as csvfile:
-            # Détecter le délimiteur
-            sample = csvfile.read(1024)
-            csvfile.seek(0)
-            sniffer = csv.Sniffer()
-            delimiter = sniffer.sniff(sample).delimiter
-            
-            reader = csv.reader(csvfile, delimiter=delimiter)
-            rows = list(reader)
-            
-            if rows:
-                headers = rows[0]
-                content += f"Colonnes ({len(headers)}): {', '.join(headers)}\n\n"
-                content += "Aperçu des données (10 premières lignes):\n"
-                
-                # Afficher les en-têtes
-                content += "\t".join(headers) + "\n"
-                content += "-" * 50 + "\n"
-                
-                # Afficher les données (max 10 lignes)
-                for i, row in enumerate(rows[1:11]):
-                    content += "\t".join(str(cell) for cell in row) + "\n"
-                
-                if len(rows) > 11:
-                    content += f"\n... et {len(rows) - 11} autres lignes"
-                    
-                content += f"\n\nTotal: {len(rows) - 1} lignes de données"
-            else:
-                content += "Le fichier CSV est vide."
-                
-        return content
-    except Exception as e:
-        logger.error(f"Erreur lors de l'extraction CSV: {str(e)}")
-        return f"Erreur lors de la lecture du fichier CSV: {str(e)}"
+    """Profil statistique d'un fichier CSV (dans le pool de processus)"""
+    return await run_in_process(_extract_csv_sync, file_path)
+
+def _extract_csv_sync(file_path: str) -> str:
+    """
+    Le fichier est lu en streaming et profilé par lots (TableProfiler): la
+    mémoire ne dépend pas de sa taille, et le prompt reçoit un résumé par
+    colonne et un échantillon de lignes au lieu des lignes brutes.
+    """
+    with open(file_path, 'r', encoding='utf-8-sig', newline='') as csvfile:
+        # Détecter le délimiteur sur des lignes complètes
+        sample = csvfile.read(8192)
+        csvfile.seek(0)
+        if "\n" in sample:
+            sample = sample[:sample.rfind("\n")]
+        try:
+            delimiter = csv.Sniffer().sniff(sample).delimiter
+        except csv.Error:
+            delimiter = ','
+
+        reader = csv.reader(csvfile, delimiter=delimiter)
+        rows = filter(None, reader)  # lignes vides ignorées
+        headers = next(rows, None)
+        if headers is None:
+            return "Contenu du fichier CSV:\n\nLe fichier CSV est vide."
+
+        profiler = TableProfiler(headers)
+        if profiler.consume(rows, max_rows=TABLE_PROFILE_MAX_ROWS):
+            return profiler.render("Contenu du fichier CSV:")
+        # Au-delà de la limite, les lignes sont seulement comptées
+        remaining = sum(1 for _ in rows)
+        if not remaining:
+            return profiler.render("Contenu du fichier CSV:")
+        return profiler.render(
+            "Contenu du fichier CSV:",
+            f"{profiler.rows + remaining} lignes de données (profil calculé sur les {profiler.rows} premières)"
+        )
+
+async def extract_xlsx_content(file_path: str, max_chars: Optional[int] = None) -> str:
+    """Profil statistique d'un fichier Excel (dans le pool de processus)"""
+    return await run_in_process(_extract_xlsx_sync, file_path, max_chars)
+
+def _format_cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    elif isinstance(value, datetime) and value.time() == dt_time(0):
+        value = value.date().isoformat()  # Excel stocke les dates comme des datetimes
+    elif hasattr(value, "isoformat"):
+        value = value.isoformat()
+    text = " ".join(str(value).split())  # pas de retours à la ligne dans une cellule
+    if len(text) > XLSX_MAX_CELL_CHARS:
+        text = text[:XLSX_MAX_CELL_CHARS - 1] + "…"
+    return text
+
+def _row_cells(row) -> List[str]:
+    cells = [_format_cell(value) for value in row]
+    while cells and not cells[-1]:
+        cells.pop()
+    return cells
 
-async def extract_xlsx_content(file_path: str) -> str:
-    """Extrait le contenu d'un fichier Excel"""
+def _extract_xlsx_sync(file_path: str, max_chars: Optional[int] = None) -> str:
+    """
+    Lecture en streaming (read_only, values_only): les lignes sont lues une à une
+    sans charger le classeur et profilées par lots, au plus
+    XLSX_MAX_ROWS_PER_SHEET lignes par feuille.
+    """
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    parts: List[str] = []
+    length = 0
     try:
-        # Pour l'instant, retourner un message indiquant que Excel n'est pas encore supporté
-        # TODO: Implémenter l'extraction Excel avec openpyxl
-        return f"Fichier Excel détecté: {os.path.basename(file_path)}\n\nNote: L'extraction du contenu des fichiers Excel sera implémentée dans une prochaine version. Pour l'instant, veuillez convertir votre fichier en CSV pour pouvoir l'analyser."
-    except Exception as e:
-        logger.error(f"Erreur lors de l'extraction Excel: {str(e)}")
-        return f"Erreur lors de la lecture du fichier Excel: {str(e)}"
+        sheets = workbook.worksheets
+        parts.append(f"Contenu du fichier Excel ({len(sheets)} feuille{'s' if len(sheets) > 1 else ''}):\n")
+        for sheet in sheets[:XLSX_MAX_SHEETS]:
+            if max_chars is not None and length >= max_chars:
+                break
+            title = f"=== Feuille: {sheet.title} ==="
+            rows = (cells for cells in map(_row_cells, sheet.iter_rows(values_only=True)) if cells)
+            headers = next(rows, None)
+            if headers is None:
+                parts.append(f"\n{title}\n(feuille vide)\n")
+                continue
+
+            profiler = TableProfiler(headers)
+            row_count = None
+            if not profiler.consume(rows, max_rows=XLSX_MAX_ROWS_PER_SHEET) and next(rows, None) is not None:
+                # Le reste de la feuille n'est pas lu: dimensions déclarées par le fichier (absentes de certains exports)
+                total = f"environ {sheet.max_row - 1}" if sheet.max_row else f"plus de {profiler.rows}"
+                row_count = f"{total} lignes de données (profil calculé sur les {profiler.rows} premières)"
+            rendered = profiler.render(title, row_count)
+            parts.append("\n" + rendered)
+            length += len(rendered)
+
+        if len(sheets) > XLSX_MAX_SHEETS:
+            parts.append(f"\n... et {len(sheets) - XLSX_MAX_SHEETS} autres feuilles non affichées\n")
+        return "".join(parts)
+    finally:
+        # En mode read_only le fichier reste ouvert jusqu'à la fermeture du classeur
+        workbook.close()
 
 async def extract_json_content(file_path: str) -> str:
-    """Extrait le contenu d'un fichier JSON"""
-    try:
-        async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-            content = await f.read()
-            # Valider et formater le JSON
-            json_data = json.loads(content)
-            return json.dumps(json_data, indent=2, ensure_ascii=False)
-    except Exception as e:
-        logger.error(f"Erreur lors de l'extraction JSON: {str(e)}")
-        return f"Erreur lors de la lecture du fichier JSON: {str(e)}"
+    """Extrait le contenu d'un fichier JSON (dans le pool de processus)"""
+    return await run_in_process(_extract_json_sync, file_path)
+
+def _extract_json_sync(file_path: str) -> str:
+    # Gros fichier: plan de la structure lu en streaming, sans charger le document
+    if os.path.getsize(file_path) > STRUCTURED_OUTLINE_MIN_BYTES:
+        return outline_json(file_path)
+    with open(file_path, 'r', encoding='utf-8') as f:
+        # Valider et formater le JSON
+        json_data = json.load(f)
+        return json.dumps(json_data, indent=2, ensure_ascii=False)
 
 async def extract_xml_content(file_path: str) -> str:
-    """Extrait le contenu d'un fichier XML"""
-    try:
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        
-        def xml_to_text(element, level=0):
-            text = "  " * level + f"<{element.tag}>"
-            if element.text and element.text.strip():
-                text += f" {element.text.strip()}"
-            text += "\n"
-            
-            for child in element:
-                text += xml_to_text(child, level + 1)
-            
-            return text
-        
-        return xml_to_text(root)
-    except Exception as e:
-        logger.error(f"Erreur lors de l'extraction XML: {str(e)}")
-        return f"Erreur lors de la lecture du fichier XML: {str(e)}"
+    """Extrait le contenu d'un fichier XML (dans le pool de processus)"""
+    return await run_in_process(_extract_xml_sync, file_path)
 
-def truncate_content(content: str, max_length: int = 8000) -> str:
-    """
-    Tronque le contenu si il est trop long pour l'API
-    """
-    if len(content) <= max_length:
-        return content
+def _extract_xml_sync(file_path: str) -> str:
+    # Gros fichier: plan de la structure lu avec iterparse, sans construire l'arbre
+    if os.path.getsize(file_path) > STRUCTURED_OUTLINE_MIN_BYTES:
+        return outline_xml(file_path)
+    tree = ET.parse(file_path)
+    lines: List[str] = []
+    
+    def xml_to_text(element, level=0):
+        line = "  " * level + f"<{element.tag}>"
+        if element.text and element.text.strip():
+            line += f" {element.text.strip()}"
+        lines.append(line)
+        
+        for child in element:
+            xml_to_text(child, level + 1)
     
-    truncated = content[:max_length]
-    return truncated + "\n\n[CONTENU TRONQUÉ - Le fichier est trop long pour être traité entièrement]"
\ No newline at end of file
+    xml_to_text(tree.getroot())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,60 @@
+import aiohttp
+import logging
+from typing import Dict
+from config.settings import (
+    LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT, LLM_MAX_CONNECTIONS_PER_HOST,
+    LLM_DNS_CACHE_TTL, LLM_KEEPALIVE_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+class HTTPSessionPool:
+    """One long-lived aiohttp session per LLM provider"""
+    sessions: Dict[str, aiohttp.ClientSession] = {}
+
+# Global session pool
+http_pool = HTTPSessionPool()
+
+def _create_session() -> aiohttp.ClientSession:
+    """Create a keep-alive session with DNS caching and a per-host connection cap"""
+    connector = aiohttp.TCPConnector(
+        limit_per_host=LLM_MAX_CONNECTIONS_PER_HOST,
+        ttl_dns_cache=LLM_DNS_CACHE_TTL,
+        keepalive_timeout=LLM_KEEPALIVE_TIMEOUT
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=None,
+        sock_connect=LLM_CONNECT_TIMEOUT,
+        sock_read=LLM_READ_TIMEOUT
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+def get_http_session(provider: str) -> aiohttp.ClientSession:
+    """
+    Return the shared session of a provider.
+
+    Sessions are normally opened in the lifespan; they are created lazily here
+    when the lifespan did not run (serverless) or after the pool was closed.
+    """
+    session = http_pool.sessions.get(provider)
+    if session is None or session.closed:
+        session = _create_session()
+        http_pool.sessions[provider] = session
+    return session
+
+async def open_http_sessions(providers):
+    """Open the sessions of the given providers"""
+    for provider in providers:
+        get_http_session(provider)
+    logger.info(f"HTTP sessions opened for: {', '.join(providers)}")
+
+async def close_http_sessions():
+    """Close every provider session"""
+    for provider, session in list(http_pool.sessions.items()):
+        try:
+            if not session.closed:
+                await session.close()
+        except Exception as e:
+            logger.error(f"Error closing HTTP session for {provider}: {e}")
+    http_pool.sessions.clear()
+    logger.info("HTTP sessions closed")
@@ -0,0 +1,316 @@
+import asyncio
+import logging
+import os
+import re
+import unicodedata
+import uuid
+from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Set, Tuple
+from config.database import get_database
+from config.settings import (
+    INGESTION_WORKERS, INGESTION_POLL_INTERVAL, INGESTION_HEARTBEAT_INTERVAL, CHUNK_SIZE, CHUNK_OVERLAP,
+    VECTOR_SEARCH_ENABLED
+)
+from services.file_processor import ExtractionError, get_file_content, compute_file_hash
+from services.worker_pool import run_in_thread
+from services.retrieval import invalidate_index
+from services.vector_index import index_file_chunks
+from services.rate_limiter import set_call_priority
+from services.storage import content_key
+from services.token_budget import chunk_token_counts
+
+logger = logging.getLogger(__name__)
+
+CHUNK_INSERT_BATCH = 500
+# Heartbeats missed before a file in processing is handed to another worker
+STALE_HEARTBEATS = 4
+
+class IngestionQueue:
+    """In-process queue of file ids; MongoDB (files.analysis_status) is the durable backing"""
+    queue: Optional[asyncio.Queue] = None
+    workers: List[asyncio.Task] = []
+    poller: Optional[asyncio.Task] = None
+    queued: Set[str] = set()
+    content_locks: Dict[str, List] = {}  # content key -> [lock, users]
+
+# Global ingestion queue
+ingestion_queue = IngestionQueue()
+
+_CONTROL_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+_SPACES = re.compile(r"[ \t\u00a0]+")
+_BLANK_LINES = re.compile(r"\n\s*\n\s*\n+")
+
+def normalize_text(text: str) -> str:
+    """Normalise le texte extrait (Unicode NFC, espaces, lignes vides)"""
+    text = unicodedata.normalize("NFC", text)
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _CONTROL_CHARS.sub("", text)
+    text = _SPACES.sub(" ", text)
+    text = _BLANK_LINES.sub("\n\n", text)
+    return text.strip()
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    Découpe le texte en chunks qui se chevauchent.
+    Les coupures se font de préférence sur un paragraphe, une ligne, une phrase ou un mot.
+    """
+    chunks = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + chunk_size, length)
+        if end < length:
+            window = text[start:end]
+            for separator in ("\n\n", "\n", ". ", " "):
+                cut = window.rfind(separator)
+                if cut > chunk_size // 2:
+                    end = start + cut + len(separator)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+def _prepare_chunks(content: str) -> List[str]:
+    return chunk_text(normalize_text(content))
+
+@asynccontextmanager
+async def _content_lock(key: str):
+    """Un seul découpage à la fois par contenu (dans ce processus)"""
+    entry = ingestion_queue.content_locks.get(key)
+    if entry is None:
+        entry = ingestion_queue.content_locks[key] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del ingestion_queue.content_locks[key]
+
+async def _shared_chunks(db, file_doc: dict) -> Optional[Tuple[int, Optional[List[str]]]]:
+    """
+    Chunks déjà produits pour ce contenu (autre upload du même blob): pas de
+    nouvelle extraction. Les textes ne sont relus que pour l'index vectoriel.
+    """
+    if not file_doc.get("blob_key"):
+        return None
+    blob = await db.blobs.find_one({"_id": file_doc["blob_key"]}, {"chunk_count": 1})
+    if not blob or blob.get("chunk_count") is None:
+        return None
+    # Les chunks doivent encore exister (ingestion interrompue, suppression): sinon on refait
+    texts = None
+    if VECTOR_SEARCH_ENABLED:
+        cursor = db.file_chunks.find(
+            {"blob_key": file_doc["blob_key"]}, {"_id": 0, "chunk_text": 1}
+        ).sort("chunk_index", 1)
+        texts = [chunk["chunk_text"] async for chunk in cursor]
+        if len(texts) != blob["chunk_count"]:
+            return None
+    elif await db.file_chunks.count_documents({"blob_key": file_doc["blob_key"]}) != blob["chunk_count"]:
+        return None
+    return blob["chunk_count"], texts
+
+async def _chunk_content(db, file_doc: dict) -> Tuple[int, List[str]]:
+    """Extraction, normalisation et découpage; les chunks sont stockés par contenu (clé du blob)"""
+    file_id = file_doc["id"]
+    content_hash = file_doc["content_hash"]
+    key = content_key(file_doc)
+    file_extension = os.path.splitext(file_doc["file_path"])[1].lower()
+    # Un fichier illisible (ExtractionError) fait échouer l'ingestion: rien n'est découpé ni indexé
+    content = await get_file_content(file_doc["file_path"], file_extension, content_hash)
+    if content is None:
+        raise ExtractionError("Impossible de lire le contenu du fichier")
+
+    await db.files.update_one({"id": file_id}, {"$set": {"analysis_stage": "chunking"}})
+    chunks = await run_in_thread(_prepare_chunks, content)
+    # Comptés une fois ici: le budget de tokens d'un prompt additionne ces comptes
+    token_counts = await run_in_thread(lambda: [chunk_token_counts(chunk) for chunk in chunks])
+
+    now = datetime.utcnow()
+    await db.file_chunks.delete_many({"blob_key": key})
+    chunk_docs = [
+        {
+            "id": str(uuid.uuid4()),
+            "blob_key": key,
+            "content_hash": content_hash,
+            "chunk_text": chunk,
+            "chunk_index": index,
+            "chunk_size": len(chunk),
+            "token_counts": counts,
+            "created_at": now
+        }
+        for index, (chunk, counts) in enumerate(zip(chunks, token_counts))
+    ]
+    for batch_start in range(0, len(chunk_docs), CHUNK_INSERT_BATCH):
+        await db.file_chunks.insert_many(chunk_docs[batch_start:batch_start + CHUNK_INSERT_BATCH])
+    invalidate_index(key)
+    if file_doc.get("blob_key"):
+        # Marque le blob comme découpé: les uploads suivants du même contenu réutilisent les chunks
+        await db.blobs.update_one({"_id": file_doc["blob_key"]}, {"$set": {"chunk_count": len(chunks)}})
+    return len(chunks), chunks
+
+@asynccontextmanager
+async def _heartbeat(db, file_id: str):
+    """Refresh processing_heartbeat_at while a file is processed, however long it takes"""
+    async def beat():
+        while True:
+            await asyncio.sleep(INGESTION_HEARTBEAT_INTERVAL)
+            try:
+                await db.files.update_one(
+                    {"id": file_id, "analysis_status": "processing"},
+                    {"$set": {"processing_heartbeat_at": datetime.utcnow()}}
+                )
+            except Exception as e:
+                logger.error(f"Ingestion heartbeat error on {file_id}: {str(e)}")
+
+    task = asyncio.create_task(beat())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+async def ingest_file(db, file_id: str) -> bool:
+    """
+    Traite un fichier uploadé: extraction, normalisation, découpage en chunks.
+    Les chunks sont partagés par les fichiers de même contenu (même blob).
+    Statuts: pending -> processing -> ready / failed
+    """
+    # Réservation atomique: un seul worker (ou processus uvicorn) traite un fichier
+    now = datetime.utcnow()
+    file_doc = await db.files.find_one_and_update(
+        {"id": file_id, "analysis_status": "pending"},
+        {"$set": {
+            "analysis_status": "processing",
+            "analysis_stage": "extracting",
+            "processing_started_at": now,
+            "processing_heartbeat_at": now
+        }}
+    )
+    if not file_doc:
+        return False
+    # Les appels aux fournisseurs (embeddings) passent après le chat interactif
+    set_call_priority("batch", file_doc["user_id"])
+    async with _heartbeat(db, file_id):
+        return await _process_file(db, file_id, file_doc)
+
+async def _process_file(db, file_id: str, file_doc: dict) -> bool:
+    try:
+        content_hash = file_doc.get("content_hash")
+        if not content_hash:
+            # Fichier antérieur au hachage à l'upload: les chunks sont indexés par contenu
+            content_hash = file_doc["content_hash"] = await run_in_thread(compute_file_hash, file_doc["file_path"])
+            await db.files.update_one({"id": file_id}, {"$set": {"content_hash": content_hash}})
+        async with _content_lock(content_key(file_doc)):
+            shared = await _shared_chunks(db, file_doc)
+            chunk_count, chunks = shared if shared is not None else await _chunk_content(db, file_doc)
+
+        if VECTOR_SEARCH_ENABLED:
+            await db.files.update_one({"id": file_id}, {"$set": {"analysis_stage": "embedding"}})
+            try:
+                await index_file_chunks(file_doc["user_id"], file_id, chunks)
+            except Exception as e:
+                # La recherche lexicale reste disponible sans embeddings
+                logger.error(f"Erreur lors de l'indexation vectorielle de {file_id}: {str(e)}")
+
+        await db.files.update_one({"id": file_id}, {
+            "$set": {
+                "analysis_status": "ready",
+                "analysis_stage": "done",
+                "chunk_count": chunk_count,
+                "processed_at": datetime.utcnow()
+            },
+            "$unset": {"analysis_error": ""}  # erreur d'une tentative précédente
+        })
+        logger.info(f"File ingested: {file_id} ({chunk_count} chunks{', shared' if shared is not None else ''})")
+        return True
+
+    except ExtractionError as e:
+        logger.warning(f"Fichier illisible, ingestion de {file_id} en échec: {str(e)}")
+        await db.files.update_one({"id": file_id}, {"$set": {
+            "analysis_status": "failed",
+            "analysis_stage": "failed",
+            "analysis_error": str(e)
+        }})
+        return False
+
+    except Exception as e:
+        logger.error(f"Erreur lors de l'ingestion de {file_id}: {str(e)}")
+        await db.files.update_one({"id": file_id}, {"$set": {
+            "analysis_status": "failed",
+            "analysis_stage": "failed",
+            "analysis_error": str(e) or type(e).__name__
+        }})
+        return False
+
+async def enqueue_file(file_id: str) -> bool:
+    """Ajoute un fichier à la file d'ingestion; False si aucun worker ne tourne"""
+    if ingestion_queue.queue is None:
+        return False
+    if file_id not in ingestion_queue.queued:
+        ingestion_queue.queued.add(file_id)
+        await ingestion_queue.queue.put(file_id)
+    return True
+
+async def _worker(index: int):
+    while True:
+        file_id = await ingestion_queue.queue.get()
+        try:
+            db = await get_database()
+            if db is not None:
+                await ingest_file(db, file_id)
+        except Exception as e:
+            logger.error(f"Ingestion worker {index} error on {file_id}: {str(e)}")
+        finally:
+            ingestion_queue.queued.discard(file_id)
+            ingestion_queue.queue.task_done()
+
+async def _enqueue_pending(db):
+    """Requeue pending files and files whose worker stopped sending heartbeats (crash, restart)"""
+    stale_before = datetime.utcnow() - timedelta(seconds=INGESTION_HEARTBEAT_INTERVAL * STALE_HEARTBEATS)
+    await db.files.update_many(
+        {"analysis_status": "processing", "$or": [
+            {"processing_heartbeat_at": {"$lt": stale_before}},
+            # Réservé avant les heartbeats
+            {"processing_heartbeat_at": {"$exists": False}, "processing_started_at": {"$lt": stale_before}}
+        ]},
+        {"$set": {"analysis_status": "pending"}}
+    )
+    cursor = db.files.find({"analysis_status": "pending"}, {"id": 1}).sort("uploaded_at", 1)
+    async for file_doc in cursor:
+        await enqueue_file(file_doc["id"])
+
+async def _poller():
+    # Picks up files uploaded through another instance and recovers after restarts
+    while True:
+        try:
+            db = await get_database()
+            if db is not None:
+                await _enqueue_pending(db)
+        except Exception as e:
+            logger.error(f"Ingestion poller error: {str(e)}")
+        await asyncio.sleep(INGESTION_POLL_INTERVAL)
+
+async def start_ingestion_workers():
+    """Démarre les workers d'ingestion (appelé dans le lifespan)"""
+    ingestion_queue.queue = asyncio.Queue()
+    ingestion_queue.workers = [asyncio.create_task(_worker(i)) for i in range(INGESTION_WORKERS)]
+    ingestion_queue.poller = asyncio.create_task(_poller())
+    logger.info(f"Ingestion started with {INGESTION_WORKERS} workers")
+
+async def stop_ingestion_workers():
+    """Arrête les workers; les fichiers non traités restent pending en base"""
+    tasks = ingestion_queue.workers + ([ingestion_queue.poller] if ingestion_queue.poller else [])
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    ingestion_queue.queue = None
+    ingestion_queue.workers = []
+    ingestion_queue.poller = None
+    ingestion_queue.queued.clear()
+    logger.info("Ingestion stopped")
@@ -0,0 +1,38 @@
+import logging
+from collections import deque
+from typing import Deque, Dict, Optional
+import numpy as np
+from config.settings import LATENCY_WINDOW, HEDGE_MIN_SAMPLES
+
+logger = logging.getLogger(__name__)
+
+class LatencyTracker:
+    """Rolling window of the latencies of successful calls, per provider"""
+    samples: Dict[str, Deque[float]] = {}
+
+# Global latency tracker
+latency_tracker = LatencyTracker()
+
+def record_latency(provider: str, seconds: float):
+    """Record the duration of a successful provider call"""
+    window = latency_tracker.samples.get(provider)
+    if window is None:
+        window = latency_tracker.samples[provider] = deque(maxlen=LATENCY_WINDOW)
+    window.append(seconds)
+
+def get_percentile(provider: str, percentile: float = 95) -> Optional[float]:
+    """Percentile of the recent latencies, None until HEDGE_MIN_SAMPLES calls were seen"""
+    window = latency_tracker.samples.get(provider)
+    if not window or len(window) < HEDGE_MIN_SAMPLES:
+        return None
+    return float(np.percentile(window, percentile))
+
+def get_latency_stats() -> dict:
+    """p50/p95/p99 and sample count per provider"""
+    stats = {}
+    for provider, window in latency_tracker.samples.items():
+        if not window:
+            continue
+        p50, p95, p99 = np.percentile(window, [50, 95, 99])
+        stats[provider] = {"samples": len(window), "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+    return stats
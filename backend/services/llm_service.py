@@ -1,287 +1,430 @@
 import asyncio
-import uuid
 import logging
 import aiohttp
 import json
 import time
-from config.settings import OPENAI_API_KEY, GEMINI_API_KEY, DEEPSEEK_API_KEY, CLAUDE_API_KEY
-from services.file_processor import extract_file_content, truncate_content
+from typing import AsyncIterator, List, Optional
+from services.file_processor import get_file_content
+from services.http_client import get_http_session
+from services.providers import get_provider
+from services.latency import record_latency, get_percentile
+from services.rate_limiter import CircuitOpenError, RETRYABLE_STATUSES, get_limiter, retry_delay
+from services.retrieval import retrieve_chunks
+from services.vector_index import search_user_chunks
+from services.response_cache import make_cache_key, get_or_compute
+from services.storage import blob_key, content_key
+from services.token_budget import context_budget, record_prompt_usage
+from config.settings import (
+    RESPONSE_CACHE_ENABLED, LLM_REQUEST_TIMEOUT, LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT,
+    HEDGE_DEFAULT_DELAY, HEDGE_FALLBACKS, LLM_MAX_RETRIES
+)
+from config.database import get_database
 import os
 
 logger = logging.getLogger(__name__)
 
-async def call_chatgpt_api(message: str) -> tuple[str, float]:
+# Per-call bound on top of the session's connect/read timeouts (non-streaming calls only)
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(
+    total=LLM_REQUEST_TIMEOUT,
+    sock_connect=LLM_CONNECT_TIMEOUT,
+    sock_read=LLM_READ_TIMEOUT
+)
+class StreamError(str):
+    """Error message yielded by stream_ai_api, before or after the tokens of a partial answer"""
+
+# Appended to the content of a file cut to fit the token budget
+TRUNCATION_NOTICE = "\n\n[CONTENU TRONQUÉ - Le fichier est trop long pour être traité entièrement]"
+
+FILE_EXCERPTS_PROMPT = """Voici les extraits les plus pertinents du fichier "{filename}" ({count} sur {total}):
+
+--- DÉBUT DES EXTRAITS ---
+{excerpts}
+--- FIN DES EXTRAITS ---
+
+Question de l'utilisateur: {message}
+
+Veuillez répondre à la question en vous basant sur les extraits du fichier ci-dessus. Si la question ne peut pas être répondue avec ces informations, indiquez-le clairement."""
+
+FILE_CONTENT_PROMPT = """Voici le contenu du fichier "{filename}":
+
+--- DÉBUT DU FICHIER ---
+{content}
+--- FIN DU FICHIER ---
+
+Question de l'utilisateur: {message}
+
+Veuillez répondre à la question en vous basant sur le contenu du fichier ci-dessus. Si la question ne peut pas être répondue avec les informations du fichier, indiquez-le clairement."""
+
+USER_FILES_PROMPT = """Voici les extraits les plus pertinents de vos fichiers:
+
+--- DÉBUT DES EXTRAITS ---
+{excerpts}
+--- FIN DES EXTRAITS ---
+
+Question de l'utilisateur: {message}
+
+Veuillez répondre à la question en vous basant sur les extraits ci-dessus. Si la question ne peut pas être répondue avec ces informations, indiquez-le clairement."""
+
+async def call_provider(ai_model: str, message: str) -> tuple[str, float]:
     """
-    Call ChatGPT API (OpenAI) - Direct API implementation
+    Call a registered provider - Direct API implementation.
+    Calls go through the provider's limiter; 429/5xx and connection errors are
+    retried with jittered exponential backoff.
     Returns: (response_text, response_time_seconds)
     """
+    provider = get_provider(ai_model)
+    if provider is None:
+        return f"Modèle IA non supporté: {ai_model}", 0.0
+    
     start_time = time.time()
     
-    if not OPENAI_API_KEY or OPENAI_API_KEY == "your_openai_api_key_here":
-        return "ChatGPT API Key manquante. Ajoutez OPENAI_API_KEY dans .env", 0.0
+    if not provider.is_configured():
+        return f"{provider.label} API Key manquante. Ajoutez {provider.api_key_env} dans .env", 0.0
     
-    try:
-        headers = {
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-            "Content-Type": "application/json"
-        }
+    limiter = get_limiter(provider.name)
+    url, headers, payload = provider.build_request(message)
+    session = get_http_session(provider.name)
+    attempt = 0
+    while True:
+        retry_after = None
+        try:
+            async with limiter.slot():
+                async with session.post(url, headers=headers, json=payload, timeout=REQUEST_TIMEOUT) as response:
+                    limiter.update_from_headers(response.status, response.headers)
+                    if response.status == 200:
+                        data = await response.json()
+                        limiter.record_success()
+                        input_tokens, _ = provider.parse_usage(data)
+                        record_prompt_usage(provider, message, input_tokens)
+                        end_time = time.time()
+                        response_time = end_time - start_time
+                        record_latency(provider.name, response_time)
+                        return provider.parse_response(data), response_time
+                    status = response.status
+                    error_text = await response.text()
+                    retry_after = response.headers.get("retry-after")
+                    if status >= 500:
+                        limiter.record_failure()
+                    error = f"Erreur {provider.label} API ({status}): {error_text}"
+        except CircuitOpenError:
+            return f"Erreur {provider.label}: service temporairement indisponible", 0.0
+        except asyncio.TimeoutError:
+            limiter.record_failure()
+            logger.error(f"{provider.label} API Timeout after {LLM_REQUEST_TIMEOUT}s")
+            return f"Erreur {provider.label}: délai dépassé ({LLM_REQUEST_TIMEOUT:.0f}s)", time.time() - start_time
+        except aiohttp.ClientConnectionError as e:
+            limiter.record_failure()
+            status = None
+            error = f"Erreur {provider.label}: {str(e)}"
+        except Exception as e:
+            logger.error(f"{provider.label} API Error: {str(e)}")
+            end_time = time.time()
+            response_time = end_time - start_time
+            return f"Erreur {provider.label}: {str(e)}", response_time
         
-        payload = {
-            "model": "gpt-4o",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "You are an intelligent and helpful AI assistant. Respond clearly and precisely in the same language as the user's question. If the user writes in English, respond in English. If the user writes in French, respond in French."
-                },
-                {
-                    "role": "user",
-                    "content": message
-                }
-            ],
-            "max_tokens": 1500,
-            "temperature": 0.7
-        }
+        if (status is None or status in RETRYABLE_STATUSES) and attempt < LLM_MAX_RETRIES:
+            delay = retry_delay(attempt, retry_after)
+            attempt += 1
+            limiter.stats["retries"] += 1
+            logger.warning(f"{provider.label} API {status or 'connection error'}, retry {attempt}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                json=payload
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    end_time = time.time()
-                    response_time = end_time - start_time
-                    return data["choices"][0]["message"]["content"], response_time
-                else:
-                    error_text = await response.text()
-                    logger.error(f"OpenAI API Error {response.status}: {error_text}")
-                    end_time = time.time()
-                    response_time = end_time - start_time
-                    return f"Erreur ChatGPT API ({response.status}): {error_text}", response_time
-                    
-    except Exception as e:
-        logger.error(f"ChatGPT API Error: {str(e)}")
-        end_time = time.time()
-        response_time = end_time - start_time
-        return f"Erreur ChatGPT: {str(e)}", response_time
+        logger.error(f"{provider.label} API Error {status}: {error}")
+        return error, time.time() - start_time
+
+async def call_chatgpt_api(message: str) -> tuple[str, float]:
+    """Call ChatGPT API (OpenAI)"""
+    return await call_provider("chatgpt", message)
 
 async def call_gemini_api(message: str) -> tuple[str, float]:
-    """
-    Call Gemini API (Google) - Direct API implementation
-    Returns: (response_text, response_time_seconds)
-    """
-    start_time = time.time()
-    
-    if not GEMINI_API_KEY or GEMINI_API_KEY == "your_gemini_api_key_here":
-        return "Gemini API Key manquante. Ajoutez GEMINI_API_KEY dans .env", 0.0
-    
-    try:
-        headers = {
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "contents": [{
-                "parts": [{
-                    "text": f"You are an intelligent and creative AI assistant. Respond in detail and engagingly in the same language as the user's question. If the user writes in English, respond in English. If the user writes in French, respond in French.\n\nQuestion: {message}"
-                }]
-            }],
-            "generationConfig": {
-                "temperature": 0.7,
-                "maxOutputTokens": 1500
-            }
-        }
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-pro:generateContent?key={GEMINI_API_KEY}",
-                headers=headers,
-                json=payload
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    end_time = time.time()
-                    response_time = end_time - start_time
-                    return data["candidates"][0]["content"]["parts"][0]["text"], response_time
-                else:
-                    error_text = await response.text()
-                    logger.error(f"Gemini API Error {response.status}: {error_text}")
-                    end_time = time.time()
-                    response_time = end_time - start_time
-                    return f"Erreur Gemini API ({response.status}): {error_text}", response_time
-                    
-    except Exception as e:
-        logger.error(f"Gemini API Error: {str(e)}")
-        end_time = time.time()
-        response_time = end_time - start_time
-        return f"Erreur Gemini: {str(e)}", response_time
+    """Call Gemini API (Google)"""
+    return await call_provider("gemini", message)
 
 async def call_deepseek_api(message: str) -> tuple[str, float]:
-    """
-    Call DeepSeek API - Real implementation using OpenAI-compatible endpoint
-    Returns: (response_text, response_time_seconds)
-    """
-    start_time = time.time()
-    
-    if not DEEPSEEK_API_KEY:
-        return "DeepSeek API Key manquante. Ajoutez DEEPSEEK_API_KEY dans .env", 0.0
-    
-    try:
-        headers = {
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": "deepseek-chat",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "You are DeepSeek, an AI assistant that excels in logical reasoning and code analysis. Respond thoroughly and technically in the same language as the user's question. If the user writes in English, respond in English. If the user writes in French, respond in French."
-                },
-                {
-                    "role": "user",
-                    "content": message
-                }
-            ],
-            "max_tokens": 1500,
-            "temperature": 0.7
-        }
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.deepseek.com/v1/chat/completions",
-                headers=headers,
-                json=payload
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    end_time = time.time()
-                    response_time = end_time - start_time
-                    return data["choices"][0]["message"]["content"], response_time
-                else:
-                    error_text = await response.text()
-                    logger.error(f"DeepSeek API Error {response.status}: {error_text}")
-                    end_time = time.time()
-                    response_time = end_time - start_time
-                    return f"Erreur DeepSeek API ({response.status}): {error_text}", response_time
-                    
-    except Exception as e:
-        logger.error(f"DeepSeek API Error: {str(e)}")
-        end_time = time.time()
-        response_time = end_time - start_time
-        return f"Erreur DeepSeek: {str(e)}", response_time
+    """Call DeepSeek API (OpenAI-compatible endpoint)"""
+    return await call_provider("deepseek", message)
 
 async def call_claude_api(message: str) -> tuple[str, float]:
+    """Call Claude API (Anthropic)"""
+    return await call_provider("claude", message)
+
+# Streaming
+
+async def _iter_sse_data(response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+    """Yield the payload of every `data:` line of a Server-Sent Events response"""
+    async for raw_line in response.content:
+        line = raw_line.decode("utf-8").strip()
+        if line.startswith("data:"):
+            yield line[5:].strip()
+
+async def stream_ai_api(ai_model: str, message: str) -> AsyncIterator[str]:
     """
-    Call Claude API (Anthropic) - Direct API implementation
-    Returns: (response_text, response_time_seconds)
+    Stream the answer of a model token by token using the provider's streaming mode.
+    Errors are yielded as text, like call_provider returns them, but typed
+    StreamError so that a partial answer can be told apart from its error;
+    a rejected stream (429/5xx) is retried while no token has been sent yet.
     """
-    start_time = time.time()
+    provider = get_provider(ai_model)
+    if provider is None:
+        yield StreamError(f"Modèle IA non supporté: {ai_model}")
+        return
     
-    if not CLAUDE_API_KEY or CLAUDE_API_KEY == "your_claude_api_key_here":
-        return "Claude API Key manquante. Ajoutez CLAUDE_API_KEY dans .env", 0.0
+    if not provider.is_configured():
+        yield StreamError(f"{provider.label} API Key manquante. Ajoutez {provider.api_key_env} dans .env")
+        return
     
-    try:
-        headers = {
-            "x-api-key": CLAUDE_API_KEY,
-            "Content-Type": "application/json",
-            "anthropic-version": "2023-06-01"
-        }
-        
-        payload = {
-            "model": "claude-3-5-sonnet-20241022",
-            "max_tokens": 1500,
-            "temperature": 0.7,
-            "system": "You are Claude, an AI assistant developed by Anthropic. You are helpful, harmless, and honest. Always respond in the same language as the user's question. If the user writes in English, respond in English. If the user writes in French, respond in French.",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": message
-                }
-            ]
-        }
+    limiter = get_limiter(provider.name)
+    url, headers, payload = provider.build_request(message, stream=True)
+    session = get_http_session(provider.name)
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            async with limiter.slot():
+                async with session.post(url, headers=headers, json=payload) as response:
+                    limiter.update_from_headers(response.status, response.headers)
+                    if response.status != 200:
+                        error_text = await response.text()
+                        if response.status >= 500:
+                            limiter.record_failure()
+                        if response.status in RETRYABLE_STATUSES and attempt < LLM_MAX_RETRIES:
+                            retry_after = response.headers.get("retry-after")
+                        else:
+                            logger.error(f"{provider.label} API Error {response.status}: {error_text}")
+                            yield StreamError(f"Erreur {provider.label} API ({response.status}): {error_text}")
+                            return
+                    else:
+                        async for data in _iter_sse_data(response):
+                            if data == "[DONE]":
+                                break
+                            text = provider.parse_stream_chunk(json.loads(data))
+                            if text:
+                                yield text
+                        limiter.record_success()
+                        return
+        except CircuitOpenError:
+            yield StreamError(f"Erreur {provider.label}: service temporairement indisponible")
+            return
+        except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+            limiter.record_failure()
+            logger.error(f"{provider.label} streaming Error: {str(e)}")
+            yield StreamError(f"Erreur {provider.label}: {str(e) or 'délai dépassé'}")
+            return
+        except Exception as e:
+            logger.error(f"{provider.label} streaming Error: {str(e)}")
+            yield StreamError(f"Erreur {provider.label}: {str(e)}")
+            return
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.anthropic.com/v1/messages",
-                headers=headers,
-                json=payload
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    end_time = time.time()
-                    response_time = end_time - start_time
-                    return data["content"][0]["text"], response_time
-                else:
-                    error_text = await response.text()
-                    logger.error(f"Claude API Error {response.status}: {error_text}")
-                    end_time = time.time()
-                    response_time = end_time - start_time
-                    return f"Erreur Claude API ({response.status}): {error_text}", response_time
-                    
-    except Exception as e:
-        logger.error(f"Claude API Error: {str(e)}")
-        end_time = time.time()
-        response_time = end_time - start_time
-        return f"Erreur Claude: {str(e)}", response_time
+        delay = retry_delay(attempt, retry_after)
+        limiter.stats["retries"] += 1
+        logger.warning(f"{provider.label} stream rejected, retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+        await asyncio.sleep(delay)
 
-async def create_context_message(message: str, file_path: str, original_filename: str) -> str:
+async def create_context_message(message: str, file_path: str, original_filename: str, content_hash: Optional[str] = None,
+                                 ai_models: Optional[List[str]] = None) -> str:
     """
-    Crée un message avec le contexte du fichier
+    Crée un message avec le contexte du fichier, dans le budget de tokens des
+    modèles auxquels il est envoyé (ai_models).
+    Si le fichier a été découpé en chunks, les extraits les plus pertinents pour
+    la question sont inclus tant qu'ils tiennent dans le budget (comptes de tokens
+    stockés avec les chunks); sinon le début du fichier, coupé au budget.
     """
     try:
+        ai_models = ai_models or []
         # Extraire l'extension du fichier
         file_extension = os.path.splitext(file_path)[1].lower()
         
-        # Extraire le contenu du fichier
-        file_content = await extract_file_content(file_path, file_extension)
+        # Extraits pertinents (index BM25 sur les chunks partagés du blob)
+        if content_hash:
+            db = await get_database()
+            key = blob_key(content_hash, file_extension)
+            retrieved = await retrieve_chunks(db, key, message) if db is not None else None
+            if retrieved:
+                ranked, total_chunks = retrieved
+                budget = context_budget(ai_models, FILE_EXCERPTS_PROMPT.format(
+                    filename=original_filename, count=total_chunks, total=total_chunks, excerpts="", message=message
+                ))
+                selected = []
+                for index, text, token_counts in ranked:
+                    header = f"--- EXTRAIT {index + 1}/{total_chunks} ---\n"
+                    if budget.take(text, token_counts, header + "\n\n"):
+                        selected.append((index, header + text))
+                if not selected:
+                    # Budget plus petit qu'un chunk: le plus pertinent, coupé
+                    index, text, _ = ranked[0]
+                    header = f"--- EXTRAIT {index + 1}/{total_chunks} ---\n"
+                    budget.take(header)
+                    selected.append((index, header + budget.fit(text)))
+                excerpts = "\n\n".join(text for _, text in sorted(selected))
+                return FILE_EXCERPTS_PROMPT.format(
+                    filename=original_filename, count=len(selected), total=total_chunks, excerpts=excerpts, message=message
+                )
+        
+        budget = context_budget(ai_models, FILE_CONTENT_PROMPT.format(
+            filename=original_filename, content=TRUNCATION_NOTICE, message=message
+        ))
+        
+        # Extraire le contenu du fichier (une seule fois par contenu, ensuite depuis le cache);
+        # sans cache, l'extraction s'arrête dès que le budget ne peut plus contenir la suite
+        file_content = await get_file_content(file_path, file_extension, content_hash, max_chars=budget.max_chars() + 1)
         
         if not file_content:
             return f"Erreur: Impossible de lire le contenu du fichier {original_filename}"
         
-        # Tronquer le contenu si nécessaire
-        truncated_content = truncate_content(file_content, max_length=6000)
+        # Couper le contenu au budget de tokens si nécessaire
+        content = budget.fit(file_content)
+        if len(content) < len(file_content):
+            content += TRUNCATION_NOTICE
         
         # Créer le message contextuel
-        context_message = f"""Voici le contenu du fichier "{original_filename}":
-
---- DÉBUT DU FICHIER ---
-{truncated_content}
---- FIN DU FICHIER ---
-
-Question de l'utilisateur: {message}
-
-Veuillez répondre à la question en vous basant sur le contenu du fichier ci-dessus. Si la question ne peut pas être répondue avec les informations du fichier, indiquez-le clairement."""
-        
-        return context_message
+        return FILE_CONTENT_PROMPT.format(filename=original_filename, content=content, message=message)
         
     except Exception as e:
         logger.error(f"Erreur lors de la création du contexte: {str(e)}")
         return f"Erreur lors du traitement du fichier: {str(e)}"
 
-async def call_ai_with_file_context(message: str, file_path: str, original_filename: str, ai_model: str) -> tuple[str, float]:
+async def create_user_files_context_message(message: str, user_id: str, ai_models: Optional[List[str]] = None) -> str:
+    """
+    Crée un message avec les extraits les plus proches de la question parmi
+    tous les fichiers de l'utilisateur (index vectoriel), dans le budget de
+    tokens des modèles auxquels il est envoyé.
+    """
+    try:
+        hits = [hit for hit in await search_user_chunks(user_id, message) if hit[2] > 0]
+        db = await get_database()
+        if not hits or db is None:
+            return message
+        
+        # Les chunks sont stockés par blob: fichier -> clé, puis (clé, index) -> texte
+        files_cursor = db.files.find(
+            {"id": {"$in": list({file_id for file_id, _, _ in hits})}, "user_id": user_id},
+            {"_id": 0, "id": 1, "content_hash": 1, "blob_key": 1, "file_path": 1, "original_filename": 1}
+        )
+        files = {file["id"]: (content_key(file), file) async for file in files_cursor if file.get("content_hash")}
+        hits = [(*files[file_id], index) for file_id, index, _ in hits if file_id in files]
+        if not hits:
+            return message
+        cursor = db.file_chunks.find(
+            {"$or": [{"blob_key": key, "chunk_index": index} for key, _, index in hits]},
+            {"_id": 0, "blob_key": 1, "chunk_index": 1, "chunk_text": 1, "token_counts": 1}
+        )
+        chunks = {(chunk["blob_key"], chunk["chunk_index"]): chunk async for chunk in cursor}
+        
+        # Les extraits les plus proches d'abord, tant qu'ils tiennent dans le budget
+        budget = context_budget(ai_models or [], USER_FILES_PROMPT.format(excerpts="", message=message))
+        excerpts = []
+        for key, file, index in hits:
+            chunk = chunks.get((key, index))
+            if chunk is None:
+                continue
+            header = f"--- EXTRAIT ({file['original_filename']}) ---\n"
+            if budget.take(chunk["chunk_text"], chunk.get("token_counts"), header + "\n\n"):
+                excerpts.append(header + chunk["chunk_text"])
+        if not excerpts:
+            return message
+        
+        return USER_FILES_PROMPT.format(excerpts="\n\n".join(excerpts), message=message)
+        
+    except Exception as e:
+        logger.error(f"Erreur lors de la recherche dans les fichiers: {str(e)}")
+        return message
+
+async def call_ai_with_file_context(message: str, file_path: str, original_filename: str, ai_model: str, content_hash: Optional[str] = None) -> tuple[str, float]:
     """
     Appelle une IA avec le contexte d'un fichier
     Returns: (response_text, response_time_seconds)
     """
     try:
-        # Créer le message avec contexte
-        context_message = await create_context_message(message, file_path, original_filename)
+        # Créer le message avec contexte, au budget de tokens du modèle
+        context_message = await create_context_message(message, file_path, original_filename, content_hash, [ai_model])
         
         # Appeler l'IA appropriée
-        if ai_model == "chatgpt":
-            return await call_chatgpt_api(context_message)
-        elif ai_model == "gemini":
-            return await call_gemini_api(context_message)
-        elif ai_model == "deepseek":
-            return await call_deepseek_api(context_message)
-        elif ai_model == "claude":
-            return await call_claude_api(context_message)
-        else:
-            return f"Modèle IA non supporté: {ai_model}", 0.0
+        return await call_provider(ai_model, context_message)
             
     except Exception as e:
         logger.error(f"Erreur lors de l'appel IA avec contexte: {str(e)}")
-        return f"Erreur lors du traitement: {str(e)}", 0.0
\ No newline at end of file
+        return f"Erreur lors du traitement: {str(e)}", 0.0
+
+def is_error_response(text: str) -> bool:
+    """True pour les messages d'erreur renvoyés à la place d'une réponse"""
+    return text.startswith("Erreur") or "API Key manquante" in text or text.startswith("Modèle IA non supporté")
+
+async def call_ai(ai_model: str, message: str, file_doc: Optional[dict] = None) -> tuple[str, float]:
+    """Appelle une IA, avec le contexte d'un fichier si file_doc est fourni"""
+    if file_doc:
+        return await call_ai_with_file_context(
+            message, file_doc["file_path"], file_doc["original_filename"], ai_model,
+            file_doc.get("content_hash")
+        )
+    return await call_provider(ai_model, message)
+
+async def call_ai_cached(ai_model: str, message: str, file_doc: Optional[dict] = None) -> tuple[str, float, bool]:
+    """
+    Appelle une IA (avec le contexte d'un fichier si file_doc est fourni) en passant
+    par le cache de réponses quand il est activé.
+    Returns: (response_text, response_time_seconds, cached)
+    """
+    async def compute() -> tuple[str, float]:
+        return await call_ai(ai_model, message, file_doc)
+    
+    provider = get_provider(ai_model)
+    file_hash = file_doc.get("content_hash") if file_doc else None
+    # Pas de clé fiable sans fournisseur connu ou pour un fichier sans hash
+    if not RESPONSE_CACHE_ENABLED or provider is None or (file_doc and not file_hash):
+        response_text, response_time = await compute()
+        return response_text, response_time, False
+    
+    key = make_cache_key(provider.name, provider.model, provider.system_prompt, message, file_hash, provider.temperature)
+    return await get_or_compute(key, provider.name, compute, lambda text: not is_error_response(text))
+
+async def call_ai_hedged(ai_model: str, message: str, file_doc: Optional[dict] = None) -> tuple[str, float, bool, str]:
+    """
+    Mode "fast": si le modèle demandé dépasse son p95 (ou échoue), une seconde requête
+    est lancée vers son alternative (HEDGE_FALLBACKS) ou en double vers le même
+    fournisseur; la première réponse valide gagne et l'autre est annulée.
+    Returns: (response_text, response_time_seconds, cached, answered_by)
+    """
+    start_time = time.time()
+    fallback = HEDGE_FALLBACKS.get(ai_model)
+    if fallback is not None and get_provider(fallback) is None:
+        logger.warning(f"HEDGE_FALLBACKS: unknown provider '{fallback}'")
+        fallback = None
+    hedge_model = fallback or ai_model
+    hedge_delay = get_percentile(ai_model) or HEDGE_DEFAULT_DELAY
+    
+    primary = asyncio.create_task(call_ai_cached(ai_model, message, file_doc))
+    tasks = {primary: ai_model}
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if done and primary.exception() is None and not is_error_response(primary.result()[0]):
+            response_text, response_time, cached = primary.result()
+            return response_text, response_time, cached, ai_model
+        
+        # Primaire lent ou en erreur: requête de couverture. Un doublon contourne le
+        # cache, sinon il serait fusionné avec la requête primaire en cours
+        if fallback:
+            hedge = asyncio.create_task(call_ai_cached(hedge_model, message, file_doc))
+        else:
+            hedge = asyncio.create_task(_uncached(call_ai(hedge_model, message, file_doc)))
+        tasks[hedge] = hedge_model
+        logger.info(f"Hedging {ai_model} with {hedge_model} after {time.time() - start_time:.2f}s")
+        
+        pending = {task for task in tasks if not task.done()}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and not is_error_response(task.result()[0]):
+                    response_text, _, cached = task.result()
+                    return response_text, time.time() - start_time, cached, tasks[task]
+        
+        # Aucune réponse valide: on renvoie l'erreur du modèle demandé
+        if primary.exception() is not None:
+            raise primary.exception()
+        response_text, response_time, cached = primary.result()
+        return response_text, response_time, cached, ai_model
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def _uncached(call) -> tuple[str, float, bool]:
+    response_text, response_time = await call
+    return response_text, response_time, False
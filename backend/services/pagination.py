@@ -0,0 +1,95 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+# Response headers carrying the cursors of the neighbouring pages
+BEFORE_CURSOR_HEADER = "X-Before-Cursor"
+AFTER_CURSOR_HEADER = "X-After-Cursor"
+
+def encode_cursor(value: datetime, item_id: str) -> str:
+    """Opaque keyset cursor: position (sort value, id) of an item"""
+    raw = json.dumps([value.isoformat(), item_id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, item_id = json.loads(raw)
+        return datetime.fromisoformat(value), str(item_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+
+def _keyset_filter(sort_field: str, id_field: str, cursor: str, operator: str) -> dict:
+    value, item_id = decode_cursor(cursor)
+    return {"$or": [
+        {sort_field: {operator: value}},
+        {sort_field: value, id_field: {operator: item_id}}
+    ]}
+
+async def fetch_page(
+    collection,
+    query: dict,
+    projection: dict,
+    sort_field: str,
+    id_field: str,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    newest_first: bool = True
+) -> Tuple[List[dict], Dict[str, str]]:
+    """
+    Keyset pagination on (sort_field, id_field).
+
+    Without cursor the newest `limit` items are returned; `before` returns the
+    items older than the cursor, `after` the newer ones. Items are returned
+    newest first or oldest first according to `newest_first`; the headers hold
+    the cursors to continue in each direction when more items exist there.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="before et after sont exclusifs")
+
+    query = dict(query)
+    if before:
+        query.update(_keyset_filter(sort_field, id_field, before, "$lt"))
+    elif after:
+        query.update(_keyset_filter(sort_field, id_field, after, "$gt"))
+
+    # Read towards the requested direction, one extra item to know whether more exist
+    direction = 1 if after else -1
+    cursor = collection.find(query, projection).sort([(sort_field, direction), (id_field, direction)]).limit(limit + 1)
+    items = await cursor.to_list(length=limit + 1)
+    has_more = len(items) > limit
+    items = items[:limit]
+    if after:
+        items.reverse()  # newest first, like the other directions
+
+    # Reading after a cursor, older items exist (the cursor's); reading before it, newer ones do
+    older_exist = True if after else has_more
+    newer_exist = has_more if after else bool(before)
+    headers = {}
+    if items:
+        oldest, newest = items[-1], items[0]
+        if older_exist:
+            headers[BEFORE_CURSOR_HEADER] = encode_cursor(oldest[sort_field], oldest[id_field])
+        if newer_exist:
+            headers[AFTER_CURSOR_HEADER] = encode_cursor(newest[sort_field], newest[id_field])
+
+    if not newest_first:
+        items.reverse()
+    return items, headers
+
+def json_list_response(items: List[Any], headers: Dict[str, str], encode: Callable[[Any], Any] = jsonable_encoder) -> StreamingResponse:
+    """Encode a JSON array item by item instead of building the whole body at once"""
+    async def body() -> AsyncIterator[bytes]:
+        yield b"["
+        for index, item in enumerate(items):
+            if index:
+                yield b","
+            yield json.dumps(encode(item), ensure_ascii=False).encode("utf-8")
+        yield b"]"
+
+    return StreamingResponse(body(), media_type="application/json", headers=headers)
@@ -0,0 +1,250 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+from config.settings import (
+    OPENAI_API_KEY, GEMINI_API_KEY, DEEPSEEK_API_KEY, CLAUDE_API_KEY,
+    COMPARE_PROVIDERS, LOCAL_LLM_URL, LOCAL_LLM_MODEL, LOCAL_LLM_API_KEY, LOCAL_LLM_CONTEXT_WINDOW
+)
+
+logger = logging.getLogger(__name__)
+
+LANGUAGE_INSTRUCTION = "If the user writes in English, respond in English. If the user writes in French, respond in French."
+
+class Provider:
+    """
+    One LLM provider: how to build its requests, parse its answers and stream
+    chunks, and what a call costs. Providers are registered by name; the name
+    is also the chat mode and the prefix of the stored response fields.
+
+    context_window is the model's limit in tokens (prompt and answer);
+    tokenizer names the tiktoken encoding of the model, or "estimate" when
+    its tokenizer cannot run locally (see services.token_budget).
+    """
+
+    def __init__(self, name: str, label: str, url: str, model: str, api_key: str, api_key_env: str,
+                 system_prompt: str, input_cost_per_1k: float = 0.0, output_cost_per_1k: float = 0.0,
+                 temperature: float = 0.7, max_tokens: int = 1500, context_window: int = 8192,
+                 tokenizer: str = "estimate"):
+        self.name = name
+        self.label = label
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.api_key_env = api_key_env
+        self.system_prompt = system_prompt
+        self.input_cost_per_1k = input_cost_per_1k
+        self.output_cost_per_1k = output_cost_per_1k
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.context_window = context_window
+        self.tokenizer = tokenizer
+
+    def is_configured(self) -> bool:
+        """False when the API key is missing or still the .env placeholder"""
+        return bool(self.api_key) and not self.api_key.startswith("your_")
+
+    def build_request(self, message: str, stream: bool = False) -> Tuple[str, dict, dict]:
+        """Return (url, headers, payload)"""
+        raise NotImplementedError
+
+    def parse_response(self, data: dict) -> str:
+        """Extract the answer text of a non-streaming response"""
+        raise NotImplementedError
+
+    def parse_stream_chunk(self, data: dict) -> Optional[str]:
+        """Extract the text delta of one streamed event, if any"""
+        raise NotImplementedError
+
+    def parse_usage(self, data: dict) -> Tuple[int, int]:
+        """Return (input_tokens, output_tokens) reported by the provider"""
+        return 0, 0
+
+    def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
+        """Cost of a call in USD"""
+        return (input_tokens * self.input_cost_per_1k + output_tokens * self.output_cost_per_1k) / 1000
+
+class OpenAICompatibleProvider(Provider):
+    """OpenAI chat completions API and compatible servers (DeepSeek, local)"""
+
+    def build_request(self, message: str, stream: bool = False) -> Tuple[str, dict, dict]:
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": message}
+            ],
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature
+        }
+        if stream:
+            payload["stream"] = True
+        return self.url, headers, payload
+
+    def parse_response(self, data: dict) -> str:
+        return data["choices"][0]["message"]["content"]
+
+    def parse_stream_chunk(self, data: dict) -> Optional[str]:
+        choices = data.get("choices") or []
+        if not choices:
+            return None
+        return choices[0].get("delta", {}).get("content")
+
+    def parse_usage(self, data: dict) -> Tuple[int, int]:
+        usage = data.get("usage") or {}
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+class GeminiProvider(Provider):
+    """Google Gemini generateContent API (the system prompt is sent with the question)"""
+
+    def build_request(self, message: str, stream: bool = False) -> Tuple[str, dict, dict]:
+        headers = {
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "contents": [{
+                "parts": [{
+                    "text": f"{self.system_prompt}\n\nQuestion: {message}"
+                }]
+            }],
+            "generationConfig": {
+                "temperature": self.temperature,
+                "maxOutputTokens": self.max_tokens
+            }
+        }
+        if stream:
+            url = f"{self.url}/{self.model}:streamGenerateContent?alt=sse&key={self.api_key}"
+        else:
+            url = f"{self.url}/{self.model}:generateContent?key={self.api_key}"
+        return url, headers, payload
+
+    def parse_response(self, data: dict) -> str:
+        return data["candidates"][0]["content"]["parts"][0]["text"]
+
+    def parse_stream_chunk(self, data: dict) -> Optional[str]:
+        candidates = data.get("candidates") or []
+        if not candidates:
+            return None
+        parts = candidates[0].get("content", {}).get("parts") or []
+        return "".join(part.get("text", "") for part in parts) or None
+
+    def parse_usage(self, data: dict) -> Tuple[int, int]:
+        usage = data.get("usageMetadata") or {}
+        return usage.get("promptTokenCount", 0), usage.get("candidatesTokenCount", 0)
+
+class AnthropicProvider(Provider):
+    """Anthropic messages API"""
+
+    def build_request(self, message: str, stream: bool = False) -> Tuple[str, dict, dict]:
+        headers = {
+            "x-api-key": self.api_key,
+            "Content-Type": "application/json",
+            "anthropic-version": "2023-06-01"
+        }
+        payload = {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "system": self.system_prompt,
+            "messages": [
+                {"role": "user", "content": message}
+            ]
+        }
+        if stream:
+            payload["stream"] = True
+        return self.url, headers, payload
+
+    def parse_response(self, data: dict) -> str:
+        return data["content"][0]["text"]
+
+    def parse_stream_chunk(self, data: dict) -> Optional[str]:
+        if data.get("type") != "content_block_delta":
+            return None
+        return data.get("delta", {}).get("text")
+
+    def parse_usage(self, data: dict) -> Tuple[int, int]:
+        usage = data.get("usage") or {}
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+# Registry of providers, by name
+PROVIDERS: Dict[str, Provider] = {}
+
+def register_provider(provider: Provider):
+    """Register (or replace) a provider under its name"""
+    PROVIDERS[provider.name] = provider
+
+def get_provider(name: str) -> Optional[Provider]:
+    return PROVIDERS.get(name)
+
+def get_compare_providers() -> List[Provider]:
+    """Providers used by compare mode, in the order of COMPARE_PROVIDERS"""
+    providers = []
+    for name in COMPARE_PROVIDERS:
+        if name in PROVIDERS:
+            providers.append(PROVIDERS[name])
+        else:
+            logger.warning(f"COMPARE_PROVIDERS: unknown provider '{name}'")
+    return providers
+
+register_provider(OpenAICompatibleProvider(
+    name="chatgpt",
+    label="ChatGPT",
+    url="https://api.openai.com/v1/chat/completions",
+    model="gpt-4o",
+    api_key=OPENAI_API_KEY,
+    api_key_env="OPENAI_API_KEY",
+    system_prompt=f"You are an intelligent and helpful AI assistant. Respond clearly and precisely in the same language as the user's question. {LANGUAGE_INSTRUCTION}",
+    input_cost_per_1k=0.0025,
+    output_cost_per_1k=0.01,
+    context_window=128000,
+    tokenizer="o200k_base"
+))
+register_provider(GeminiProvider(
+    name="gemini",
+    label="Gemini",
+    url="https://generativelanguage.googleapis.com/v1beta/models",
+    model="gemini-1.5-pro",
+    api_key=GEMINI_API_KEY,
+    api_key_env="GEMINI_API_KEY",
+    system_prompt=f"You are an intelligent and creative AI assistant. Respond in detail and engagingly in the same language as the user's question. {LANGUAGE_INSTRUCTION}",
+    input_cost_per_1k=0.00125,
+    output_cost_per_1k=0.005,
+    context_window=2000000
+))
+register_provider(OpenAICompatibleProvider(
+    name="deepseek",
+    label="DeepSeek",
+    url="https://api.deepseek.com/v1/chat/completions",
+    model="deepseek-chat",
+    api_key=DEEPSEEK_API_KEY,
+    api_key_env="DEEPSEEK_API_KEY",
+    system_prompt=f"You are DeepSeek, an AI assistant that excels in logical reasoning and code analysis. Respond thoroughly and technically in the same language as the user's question. {LANGUAGE_INSTRUCTION}",
+    input_cost_per_1k=0.00027,
+    output_cost_per_1k=0.0011,
+    context_window=64000
+))
+register_provider(AnthropicProvider(
+    name="claude",
+    label="Claude",
+    url="https://api.anthropic.com/v1/messages",
+    model="claude-3-5-sonnet-20241022",
+    api_key=CLAUDE_API_KEY,
+    api_key_env="CLAUDE_API_KEY",
+    system_prompt=f"You are Claude, an AI assistant developed by Anthropic. You are helpful, harmless, and honest. Always respond in the same language as the user's question. {LANGUAGE_INSTRUCTION}",
+    input_cost_per_1k=0.003,
+    output_cost_per_1k=0.015,
+    context_window=200000
+))
+if LOCAL_LLM_URL:
+    register_provider(OpenAICompatibleProvider(
+        name="local",
+        label="Local",
+        url=LOCAL_LLM_URL,
+        model=LOCAL_LLM_MODEL,
+        api_key=LOCAL_LLM_API_KEY,
+        api_key_env="LOCAL_LLM_API_KEY",
+        system_prompt=f"You are a helpful AI assistant. Respond clearly in the same language as the user's question. {LANGUAGE_INSTRUCTION}",
+        context_window=LOCAL_LLM_CONTEXT_WINDOW
+    ))
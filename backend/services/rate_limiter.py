@@ -0,0 +1,275 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import re
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Mapping, Optional, Tuple
+from config.settings import (
+    LLM_MAX_CONCURRENCY, LLM_RATE_LIMIT_RPS, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY,
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_INCREASE_STEP = 0.05  # rps regained per successful call after a 429
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+
+# Priority classes and their share of a provider's capacity
+PRIORITY_WEIGHTS = {"interactive": 8.0, "compare": 4.0, "batch": 1.0}
+DEFAULT_PRIORITY = "interactive"
+FLOW_PRUNE_SIZE = 1024
+
+# (priority, user_id) of the calls made by the current request or job
+_call_priority: ContextVar[Tuple[str, Optional[str]]] = ContextVar("call_priority", default=(DEFAULT_PRIORITY, None))
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open"""
+
+def set_call_priority(priority: str, user_id: Optional[str] = None):
+    """
+    Set the priority class and user of the provider calls made from the current
+    task (and the tasks it creates). Routes call this before calling the models.
+    """
+    if priority not in PRIORITY_WEIGHTS:
+        raise ValueError(f"Unknown priority class: {priority}")
+    _call_priority.set((priority, user_id))
+
+class FairQueue:
+    """
+    Weighted fair queuing of concurrency slots.
+
+    Each (priority, user) pair is a flow. A waiting call gets the virtual finish
+    tag max(virtual time, flow's last tag) + 1 / weight and slots go to the
+    smallest tag, so priorities share capacity in proportion to their weight
+    and a user with many queued calls does not starve the others.
+    """
+
+    def __init__(self, slots: int):
+        self.available = slots
+        self.heap: List[Tuple[float, int, asyncio.Future]] = []
+        self.counter = itertools.count()
+        self.virtual_time = 0.0
+        self.flow_finish: Dict[Tuple[str, Optional[str]], float] = {}
+        self.waiting: Dict[str, int] = {priority: 0 for priority in PRIORITY_WEIGHTS}
+
+    def _tag(self, flow: Tuple[str, Optional[str]]) -> float:
+        finish = max(self.virtual_time, self.flow_finish.get(flow, 0.0)) + 1.0 / PRIORITY_WEIGHTS[flow[0]]
+        self.flow_finish[flow] = finish
+        if len(self.flow_finish) > FLOW_PRUNE_SIZE:
+            # Flows that are not ahead of the virtual clock carry no state worth keeping
+            self.flow_finish = {key: tag for key, tag in self.flow_finish.items() if tag > self.virtual_time}
+        return finish
+
+    async def acquire(self, flow: Tuple[str, Optional[str]]):
+        finish = self._tag(flow)
+        if self.available > 0 and not self.heap:
+            self.available -= 1
+            self.virtual_time = max(self.virtual_time, finish - 1.0 / PRIORITY_WEIGHTS[flow[0]])
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.heap, (finish, next(self.counter), future))
+        self.waiting[flow[0]] += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just before the cancellation: hand the slot on
+                self.release()
+            raise
+        finally:
+            self.waiting[flow[0]] -= 1
+
+    def release(self):
+        while self.heap:
+            finish, _, future = heapq.heappop(self.heap)
+            if not future.done():
+                self.virtual_time = max(self.virtual_time, finish)
+                future.set_result(None)
+                return
+        self.available += 1
+
+def _parse_reset(value: str) -> Optional[float]:
+    """Seconds until a rate-limit window resets ("6m0s", "20ms", "1.5" or an RFC 3339 timestamp)"""
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if parts:
+        units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(amount) * units[unit] for amount, unit in parts)
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return max(0.0, reset_at.timestamp() - time.time())
+    except ValueError:
+        return None
+
+class ProviderLimiter:
+    """
+    Scheduler of one provider's calls: weighted fair queuing of a bounded
+    number of concurrent calls, an adaptive token bucket and a circuit breaker.
+
+    The bucket starts unlimited (or at LLM_RATE_LIMIT_RPS). Rate-limit headers
+    set its ceiling and block it until their window resets; each 429 halves
+    the rate and successful calls slowly raise it again (AIMD).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.queue = FairQueue(LLM_MAX_CONCURRENCY)
+        self.rate: Optional[float] = LLM_RATE_LIMIT_RPS or None
+        self.ceiling: Optional[float] = self.rate
+        self.tokens = 1.0
+        self.refilled_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.inflight = 0
+        self.stats = {"calls": 0, "retries": 0, "throttled": 0, "rejected": 0, "failures": 0}
+
+    def _check_breaker(self):
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < CIRCUIT_RESET_TIMEOUT:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(self.name)
+            self.state = "half_open"
+        if self.state == "half_open":
+            # A single probe call decides whether the circuit closes again
+            if self.probing:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(self.name)
+            self.probing = True
+
+    async def _take_token(self):
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            if self.rate is None:
+                return
+            capacity = max(1.0, self.rate)
+            self.tokens = min(capacity, self.tokens + (now - self.refilled_at) * self.rate)
+            self.refilled_at = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[str] = None):
+        """
+        Hold one concurrency slot and one rate token for the duration of a call.
+        The call is queued under the priority and user set by set_call_priority.
+        """
+        flow_priority, user_id = _call_priority.get()
+        flow = (priority or flow_priority, user_id)
+        self._check_breaker()
+        try:
+            await self.queue.acquire(flow)
+            try:
+                await self._take_token()
+                self.inflight += 1
+                self.stats["calls"] += 1
+                try:
+                    yield
+                finally:
+                    self.inflight -= 1
+            finally:
+                self.queue.release()
+        finally:
+            # A probe that ended without a verdict (4xx, cancelled...) lets the next call probe
+            self.probing = False
+
+    def update_from_headers(self, status: int, headers: Mapping[str, str]):
+        """Adapt the bucket from x-ratelimit-* / anthropic-ratelimit-* / retry-after headers"""
+        limit = headers.get("x-ratelimit-limit-requests") or headers.get("anthropic-ratelimit-requests-limit")
+        remaining = headers.get("x-ratelimit-remaining-requests") or headers.get("anthropic-ratelimit-requests-remaining")
+        reset = headers.get("x-ratelimit-reset-requests") or headers.get("anthropic-ratelimit-requests-reset")
+        retry_after = headers.get("retry-after")
+
+        if limit and limit.isdigit() and int(limit) > 0:
+            # Request limits are per minute
+            self.ceiling = int(limit) / 60
+            if self.rate is None or self.rate > self.ceiling:
+                self.rate = self.ceiling
+        if remaining == "0" and reset:
+            wait = _parse_reset(reset)
+            if wait:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + wait)
+        if status == 429:
+            self.stats["throttled"] += 1
+            self.rate = max(0.1, (self.rate or LLM_MAX_CONCURRENCY) / 2)
+            wait = _parse_reset(retry_after) if retry_after else None
+            if wait:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + wait)
+            logger.warning(f"{self.name} rate limited, throttling to {self.rate:.2f} req/s")
+        elif status < 400 and self.rate is not None and self.rate != self.ceiling:
+            self.rate += RATE_INCREASE_STEP
+            if self.ceiling is not None:
+                self.rate = min(self.rate, self.ceiling)
+            elif self.rate >= LLM_MAX_CONCURRENCY:
+                # No known limit and no recent 429: back to unlimited
+                self.rate = None
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"{self.name} circuit closed")
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        """Count a 5xx, timeout or connection error; open the circuit past the threshold"""
+        self.stats["failures"] += 1
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or self.failures >= CIRCUIT_FAILURE_THRESHOLD:
+            if self.state != "open":
+                logger.error(f"{self.name} circuit opened after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "waiting": sum(self.queue.waiting.values()),
+            "waiting_by_priority": dict(self.queue.waiting),
+            "inflight": self.inflight,
+            "rate_limit_rps": self.rate,
+            "blocked_for": max(0.0, self.blocked_until - time.monotonic()),
+            **self.stats
+        }
+
+class ProviderLimiters:
+    """One limiter per provider, created on first use"""
+    limiters: Dict[str, ProviderLimiter] = {}
+
+# Global provider limiters
+provider_limiters = ProviderLimiters()
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    limiter = provider_limiters.limiters.get(provider)
+    if limiter is None:
+        limiter = provider_limiters.limiters[provider] = ProviderLimiter(provider)
+    return limiter
+
+def retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than the provider's retry-after"""
+    delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+    if retry_after:
+        delay = max(delay, _parse_reset(retry_after) or 0.0)
+    return min(delay, LLM_RETRY_MAX_DELAY)
+
+def get_provider_stats() -> dict:
+    """Queue depth, rate and circuit breaker state of each provider"""
+    return {name: limiter.snapshot() for name, limiter in provider_limiters.limiters.items()}
@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from pymongo import ASCENDING
+from config.database import get_database
+from config.settings import RESPONSE_CACHE_TTL, RESPONSE_CACHE_MEMORY_SIZE
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+class ResponseCache:
+    """Two-tier cache of model answers: in-process LRU, then MongoDB (shared across workers)"""
+    memory: "OrderedDict[str, Tuple[float, str, float]]" = OrderedDict()  # key -> (expires, text, time)
+    inflight: Dict[str, List] = {}  # key -> [lookup/compute task, callers awaiting it]
+    stats = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "coalesced": 0, "stores": 0}
+
+# Global response cache
+response_cache = ResponseCache()
+
+def normalize_message(message: str) -> str:
+    """Normalise une question pour que les variantes triviales partagent une entrée"""
+    return _WHITESPACE.sub(" ", message).strip().casefold()
+
+def make_cache_key(provider: str, model: str, system_prompt: str, message: str,
+                   file_hash: Optional[str], temperature: float) -> str:
+    """Clé = hash de (fournisseur, modèle, prompt système, question normalisée, fichier, température)"""
+    material = json.dumps(
+        [provider, model, system_prompt, normalize_message(message), file_hash or "", temperature],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+async def ensure_response_cache_indexes():
+    """Index unique sur la clé et index TTL pour l'expiration côté MongoDB"""
+    db = await get_database()
+    if db is None:
+        return
+    try:
+        await db.response_cache.create_index([("key", ASCENDING)], unique=True)
+        await db.response_cache.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+    except Exception as e:
+        logger.error(f"Error creating response cache indexes: {e}")
+
+def _memory_get(key: str) -> Optional[Tuple[str, float]]:
+    entry = response_cache.memory.get(key)
+    if entry is None:
+        return None
+    expires, text, response_time = entry
+    if expires < time.time():
+        response_cache.memory.pop(key, None)
+        return None
+    response_cache.memory.move_to_end(key)
+    return text, response_time
+
+def _memory_put(key: str, text: str, response_time: float, expires: float):
+    response_cache.memory[key] = (expires, text, response_time)
+    response_cache.memory.move_to_end(key)
+    while len(response_cache.memory) > RESPONSE_CACHE_MEMORY_SIZE:
+        response_cache.memory.popitem(last=False)
+
+async def _shared_get(key: str) -> Optional[Tuple[str, float, float]]:
+    db = await get_database()
+    if db is None:
+        return None
+    doc = await db.response_cache.find_one(
+        {"key": key, "expires_at": {"$gt": datetime.utcnow()}},
+        {"_id": 0, "response": 1, "response_time": 1, "expires_at": 1}
+    )
+    if not doc:
+        return None
+    expires = time.time() + (doc["expires_at"] - datetime.utcnow()).total_seconds()
+    return doc["response"], doc["response_time"], expires
+
+async def _shared_put(key: str, provider: str, text: str, response_time: float):
+    db = await get_database()
+    if db is None:
+        return
+    now = datetime.utcnow()
+    await db.response_cache.update_one(
+        {"key": key},
+        {"$set": {
+            "key": key,
+            "provider": provider,
+            "response": text,
+            "response_time": response_time,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=RESPONSE_CACHE_TTL)
+        }},
+        upsert=True
+    )
+
+async def _lookup_or_compute(
+    key: str,
+    provider: str,
+    compute: Callable[[], Awaitable[Tuple[str, float]]],
+    is_cacheable: Callable[[str], bool]
+) -> Tuple[str, float, bool]:
+    """Shared cache lookup, then upstream call stored when cacheable (one task per key)"""
+    try:
+        shared = await _shared_get(key)
+    except Exception as e:
+        logger.error(f"Response cache lookup error: {e}")
+        shared = None
+    if shared is not None:
+        response_cache.stats["shared_hits"] += 1
+        text, response_time, expires = shared
+        _memory_put(key, text, response_time, expires)
+        return text, response_time, True
+
+    response_cache.stats["misses"] += 1
+    text, response_time = await compute()
+    if is_cacheable(text):
+        _memory_put(key, text, response_time, time.time() + RESPONSE_CACHE_TTL)
+        try:
+            await _shared_put(key, provider, text, response_time)
+            response_cache.stats["stores"] += 1
+        except Exception as e:
+            logger.error(f"Response cache store error: {e}")
+    return text, response_time, False
+
+async def get_or_compute(
+    key: str,
+    provider: str,
+    compute: Callable[[], Awaitable[Tuple[str, float]]],
+    is_cacheable: Callable[[str], bool]
+) -> Tuple[str, float, bool]:
+    """
+    Return (text, response_time, cached). On a hit, response_time is the time of
+    the original upstream call. Concurrent identical requests share one
+    upstream call (single-flight): it runs in its own task, cancelled only
+    when every request awaiting it was cancelled.
+    """
+    hit = _memory_get(key)
+    if hit is not None:
+        response_cache.stats["memory_hits"] += 1
+        return hit[0], hit[1], True
+
+    entry = response_cache.inflight.get(key)
+    coalesced = entry is not None
+    if coalesced:
+        response_cache.stats["coalesced"] += 1
+    else:
+        task = asyncio.ensure_future(_lookup_or_compute(key, provider, compute, is_cacheable))
+        entry = response_cache.inflight[key] = [task, 0]
+
+        def _done(_):
+            if response_cache.inflight.get(key) is entry:
+                del response_cache.inflight[key]
+        task.add_done_callback(_done)
+
+    task = entry[0]
+    entry[1] += 1
+    try:
+        text, response_time, cached = await asyncio.shield(task)
+    except asyncio.CancelledError:
+        # Un appelant annulé (couverture gagnante, client parti) n'annule pas l'appel des autres
+        if entry[1] == 1:
+            task.cancel()
+        raise
+    finally:
+        entry[1] -= 1
+    if coalesced:
+        # Une erreur partagée n'est pas une réponse en cache (les erreurs ne sont jamais stockées)
+        return text, response_time, is_cacheable(text)
+    return text, response_time, cached
+
+def get_cache_stats() -> dict:
+    """Compteurs hit/miss du cache de réponses"""
+    stats = response_cache.stats
+    lookups = stats["memory_hits"] + stats["shared_hits"] + stats["coalesced"] + stats["misses"]
+    hits = lookups - stats["misses"]
+    return {
+        **stats,
+        "memory_entries": len(response_cache.memory),
+        "hit_rate": hits / lookups if lookups else 0.0
+    }
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import re
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from scipy.sparse import coo_matrix, csc_matrix
+from config.settings import RETRIEVAL_TOP_K, RETRIEVAL_INDEX_CACHE_SIZE
+from services.worker_pool import run_in_thread
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = {
+    # Français
+    "le", "la", "les", "un", "une", "des", "de", "du", "et", "ou", "en", "au", "aux", "ce", "ces",
+    "que", "qui", "quoi", "dans", "par", "pour", "sur", "avec", "est", "sont", "il", "elle", "je",
+    "tu", "nous", "vous", "ils", "elles", "ne", "pas", "se", "sa", "son", "ses", "leur", "leurs",
+    # English
+    "the", "an", "and", "or", "of", "to", "in", "on", "for", "with", "is", "are", "was", "were",
+    "it", "this", "that", "what", "which", "who", "how", "be", "by", "as", "at", "from", "do", "does",
+}
+
+def tokenize(text: str) -> List[str]:
+    """Découpe un texte en termes normalisés pour l'index lexical"""
+    return [
+        token for token in _TOKEN.findall(text.lower())
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+class BM25Index:
+    """
+    BM25 index over the chunks of one file.
+    The BM25 weight of every (chunk, term) pair is precomputed in a sparse
+    CSC matrix, so scoring a query is a column slice and a row sum.
+    """
+
+    def __init__(self, texts: List[str], k1: float = 1.5, b: float = 0.75):
+        self.vocabulary: Dict[str, int] = {}
+        rows, cols, counts = [], [], []
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for row, text in enumerate(texts):
+            term_counts = Counter(tokenize(text))
+            lengths[row] = sum(term_counts.values())
+            for term, count in term_counts.items():
+                rows.append(row)
+                cols.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                counts.append(count)
+
+        self.size = len(texts)
+        shape = (self.size, len(self.vocabulary))
+        rows = np.asarray(rows, dtype=np.int32)
+        cols = np.asarray(cols, dtype=np.int32)
+        tf = np.asarray(counts, dtype=np.float32)
+
+        document_frequency = np.bincount(cols, minlength=len(self.vocabulary))
+        idf = np.log1p((self.size - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        average_length = float(lengths.mean()) if self.size else 1.0
+        length_norm = k1 * (1 - b + b * lengths / (average_length or 1.0))
+
+        weights = idf[cols] * tf * (k1 + 1) / (tf + length_norm[rows])
+        self.weights: csc_matrix = coo_matrix((weights, (rows, cols)), shape=shape).tocsc()
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """Return the (chunk_index, score) pairs of the best chunks, best first"""
+        term_ids = sorted({self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary})
+        if not term_ids or self.size == 0:
+            return []
+        scores = np.asarray(self.weights[:, term_ids].sum(axis=1)).ravel()
+        k = min(top_k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+class IndexCache:
+    """LRU cache of the BM25 indexes of recently queried contents (by blob key), with the chunk texts and token counts"""
+    entries: "OrderedDict[str, Tuple[BM25Index, List[str], List[Optional[dict]]]]" = OrderedDict()
+    locks: Dict[str, asyncio.Lock] = {}
+
+# Global index cache
+index_cache = IndexCache()
+
+async def _load_index(db, key: str) -> Optional[Tuple[BM25Index, List[str], List[Optional[dict]]]]:
+    entry = index_cache.entries.get(key)
+    if entry is not None:
+        index_cache.entries.move_to_end(key)
+        return entry
+
+    lock = index_cache.locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        entry = index_cache.entries.get(key)
+        if entry is None:
+            cursor = db.file_chunks.find(
+                {"blob_key": key}, {"_id": 0, "chunk_text": 1, "token_counts": 1}
+            ).sort("chunk_index", 1)
+            chunks = await cursor.to_list(length=None)
+            if not chunks:
+                return None
+            texts = [chunk["chunk_text"] for chunk in chunks]
+            entry = (await run_in_thread(BM25Index, texts), texts, [chunk.get("token_counts") for chunk in chunks])
+            index_cache.entries[key] = entry
+            while len(index_cache.entries) > RETRIEVAL_INDEX_CACHE_SIZE:
+                index_cache.entries.popitem(last=False)
+    index_cache.locks.pop(key, None)
+    return entry
+
+async def retrieve_chunks(db, key: str, query: str, top_k: int = RETRIEVAL_TOP_K) -> Optional[Tuple[List[Tuple[int, str, Optional[dict]]], int]]:
+    """
+    Retourne les top-k chunks d'un contenu pour une question, du plus pertinent au
+    moins pertinent, avec leurs comptes de tokens stockés (index, texte, comptes),
+    ainsi que le nombre total de chunks. None si le contenu n'a pas (encore) de chunks.
+    Les chunks et l'index sont partagés par tous les fichiers de même blob (clé: hash + extension).
+    """
+    entry = await _load_index(db, key)
+    if entry is None:
+        return None
+    index, texts, token_counts = entry
+    hits = index.search(query, top_k)
+    # Sans terme commun avec la question, on garde le début du document
+    selected = [i for i, _ in hits] if hits else list(range(min(top_k, len(texts))))
+    return [(i, texts[i], token_counts[i]) for i in selected], len(texts)
+
+def invalidate_index(key: str):
+    """Retire l'index d'un contenu du cache (suppression ou ré-ingestion)"""
+    index_cache.entries.pop(key, None)
@@ -0,0 +1,42 @@
+import logging
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+def session_preview(latest_message: Optional[str], ai_response: Optional[str]) -> str:
+    """Nom affiché d'une session: dernier message et début de la réponse de l'IA"""
+    latest_message = latest_message or "Nouvelle conversation"
+    if ai_response:
+        conversation_preview = f"Vous: {latest_message[:30]}... | IA: {ai_response[:30]}..."
+    else:
+        conversation_preview = f"Vous: {latest_message[:50]}..."
+
+    # Truncate if too long
+    return conversation_preview[:80] + "..." if len(conversation_preview) > 80 else conversation_preview
+
+async def record_session_message(db, message_doc: dict, models: list, session_name: Optional[str] = None):
+    """
+    Met à jour le document de la session d'un message (créé au premier message):
+    compteur, aperçu et date de mise à jour, en une seule écriture atomique.
+    """
+    ai_response = next((message_doc.get(f"{model}_response") for model in models if message_doc.get(f"{model}_response")), None)
+    now = datetime.utcnow()
+    try:
+        await db.sessions.update_one(
+            {"session_id": message_doc["session_id"], "user_id": message_doc["user_id"]},
+            {
+                "$setOnInsert": {"created_at": message_doc["timestamp"]},
+                "$set": {
+                    "session_name": session_name or "Nouvelle conversation",
+                    "preview": session_preview(message_doc["message"], ai_response),
+                    "latest_message_id": message_doc["id"],
+                    "updated_at": now
+                },
+                "$inc": {"message_count": 1}
+            },
+            upsert=True
+        )
+    except Exception as e:
+        # The message itself is saved; the session list catches up on the next message
+        logger.error(f"Session update error: {str(e)}")
@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+import aiofiles
+from fastapi import UploadFile
+from pymongo import ReturnDocument
+from config.settings import UPLOAD_DIR, MAX_FILE_SIZE, UPLOAD_CHUNK_SIZE
+from services.blob_store import get_upload_store, blob_exists, delete_blob
+
+logger = logging.getLogger(__name__)
+
+TMP_DIR = UPLOAD_DIR / "tmp"
+
+# Un verrou par blob: l'ajout d'une référence et la suppression du dernier ne se croisent pas
+_blob_locks: Dict[str, List] = {}  # key -> [lock, users]
+
+class UploadTooLargeError(Exception):
+    """The upload exceeded MAX_FILE_SIZE (the partial file was removed)"""
+
+class StoredUpload(NamedTuple):
+    blob_key: str
+    file_path: str
+    file_size: int
+    content_hash: str
+    deduplicated: bool
+
+def blob_key(content_hash: str, extension: str) -> str:
+    """Clé d'un blob: hash du contenu + extension (les parseurs choisissent selon l'extension)"""
+    return f"{content_hash}{extension}"
+
+def content_key(file_doc: dict) -> Optional[str]:
+    """
+    Clé sous laquelle le contenu d'un fichier est découpé et indexé (file_chunks.blob_key):
+    son blob, ou la même forme pour un fichier antérieur au stockage par contenu
+    """
+    if file_doc.get("blob_key"):
+        return file_doc["blob_key"]
+    if not file_doc.get("content_hash"):
+        return None
+    return blob_key(file_doc["content_hash"], os.path.splitext(file_doc["file_path"])[1].lower())
+
+@asynccontextmanager
+async def _blob_lock(key: str):
+    entry = _blob_locks.get(key)
+    if entry is None:
+        entry = _blob_locks[key] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _blob_locks[key]
+
+async def _receive_upload(upload: UploadFile) -> tuple[str, int, str]:
+    """
+    Stream an upload to a temporary file by chunks of UPLOAD_CHUNK_SIZE, hashing
+    it (SHA-256) on the fly; aborted as soon as it exceeds MAX_FILE_SIZE.
+    Returns (tmp_path, size, sha256).
+    """
+    TMP_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = str(TMP_DIR / f"{uuid.uuid4()}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_FILE_SIZE:
+                    raise UploadTooLargeError(f"{upload.filename}: plus de {MAX_FILE_SIZE} octets")
+                digest.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        _remove(tmp_path)
+        raise
+    return tmp_path, size, digest.hexdigest()
+
+def _remove(path) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+async def save_upload(db, upload: UploadFile, extension: str) -> StoredUpload:
+    """
+    Store an upload as a content-addressed blob and take a reference on it.
+    A content already stored is not written again: the temporary copy is
+    dropped and the existing blob (with its extracted text and chunks) is shared.
+    """
+    tmp_path, size, content_hash = await _receive_upload(upload)
+    key = blob_key(content_hash, extension)
+    store = get_upload_store()
+    location = store.location(key)
+    try:
+        async with _blob_lock(key):
+            previous = await db.blobs.find_one_and_update(
+                {"_id": key},
+                {
+                    "$inc": {"ref_count": 1},
+                    "$setOnInsert": {"path": location, "size": size, "created_at": datetime.utcnow()}
+                },
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+            # Le contenu est (re)placé s'il manque, même pour un blob déjà référencé;
+            # un blob écrit sous un autre backend reste à son emplacement d'origine
+            if previous is not None:
+                location = previous["path"]
+            deduplicated = previous is not None and await blob_exists(location)
+            if not deduplicated:
+                try:
+                    location = await store.put_file(key, tmp_path)
+                except BaseException:
+                    # Contenu non stocké: la référence prise n'appartient à aucun fichier
+                    await _drop_reference(db, key)
+                    raise
+                if previous is not None and previous["path"] != location:
+                    await db.blobs.update_one({"_id": key}, {"$set": {"path": location}})
+    finally:
+        _remove(tmp_path)
+    if deduplicated:
+        logger.info(f"Upload deduplicated: {key} ({size} bytes)")
+    return StoredUpload(key, location, size, content_hash, deduplicated)
+
+async def _drop_reference(db, key: str):
+    """Give back a reference taken on a blob whose content could not be stored"""
+    try:
+        blob = await db.blobs.find_one_and_update(
+            {"_id": key, "ref_count": {"$gt": 0}},
+            {"$inc": {"ref_count": -1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if blob is not None and blob["ref_count"] == 0:
+            await db.blobs.delete_one({"_id": key, "ref_count": 0})
+    except Exception as e:
+        logger.error(f"Blob reference rollback error for {key}: {str(e)}")
+
+async def release_upload(db, file_doc: dict) -> bool:
+    """
+    Drop the reference of a deleted file on its blob; the blob is unlinked with
+    its last reference. Returns True when the content is no longer used, so
+    its shared extraction and chunks can be dropped too.
+    """
+    key = file_doc.get("blob_key")
+    if not key:
+        # Fichier antérieur au stockage par contenu: propre à ce document
+        _remove(file_doc["file_path"])
+        content_hash = file_doc.get("content_hash")
+        return not content_hash or await db.files.count_documents({"content_hash": content_hash}, limit=1) == 0
+
+    async with _blob_lock(key):
+        blob = await db.blobs.find_one_and_update(
+            {"_id": key, "ref_count": {"$gt": 0}},
+            {"$inc": {"ref_count": -1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if blob is None or blob["ref_count"] > 0:
+            return False
+        result = await db.blobs.delete_one({"_id": key, "ref_count": 0})
+        if result.deleted_count:
+            await delete_blob(blob["path"])
+            logger.info(f"Blob removed: {key}")
+            return True
+        return False
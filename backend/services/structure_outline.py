@@ -0,0 +1,164 @@
+import os
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional
+import ijson
+from config.settings import OUTLINE_MAX_PATHS, OUTLINE_SAMPLES_PER_PATH, OUTLINE_CONVERGENCE_EVENTS
+
+SAMPLE_MAX_CHARS = 60
+MAX_ATTRIBUTES = 10
+JSON_SCALARS = {"string": "texte", "number": "nombre", "boolean": "booléen", "null": "null"}
+
+class PathStats:
+    __slots__ = ("count", "kinds", "samples", "attributes")
+
+    def __init__(self):
+        self.count = 0
+        self.kinds: List[str] = []
+        self.samples: List[str] = []
+        self.attributes: List[str] = []
+
+class StructureOutline:
+    """
+    Structural outline of a document read as a stream of events: each path
+    (XML tags or JSON keys) with its number of occurrences, value types,
+    attributes and a few sample values.
+
+    Reading stops once OUTLINE_CONVERGENCE_EVENTS events went by without a
+    new path; the counts are then extrapolated from the share of the file
+    that was read, so the work done depends on the structure, not the size.
+    """
+
+    def __init__(self, file_size: int):
+        self.file_size = file_size
+        self.paths: Dict[str, PathStats] = {}
+        self.skipped_paths = 0
+        self.events = 0
+        self.last_new_path = 0
+        self.bytes_read: Optional[int] = None  # None: the whole file was read
+
+    def add(self, path: str, kind: Optional[str] = None, value=None, attributes=None, quote: bool = False):
+        self.events += 1
+        stats = self.paths.get(path)
+        if stats is None:
+            if len(self.paths) >= OUTLINE_MAX_PATHS:
+                self.skipped_paths += 1
+                return
+            stats = self.paths[path] = PathStats()
+            self.last_new_path = self.events
+        stats.count += 1
+        if kind and kind not in stats.kinds:
+            stats.kinds.append(kind)
+        if attributes:
+            for name in attributes:
+                if name not in stats.attributes and len(stats.attributes) < MAX_ATTRIBUTES:
+                    stats.attributes.append(name)
+        if value is not None:
+            self.sample(path, value, quote)
+
+    def sample(self, path: str, value, quote: bool = True):
+        """Keep a few distinct, shortened sample values per path (text values quoted)"""
+        stats = self.paths.get(path)
+        if stats is None or len(stats.samples) >= OUTLINE_SAMPLES_PER_PATH:
+            return
+        sample = " ".join(str(value).split())
+        if len(sample) > SAMPLE_MAX_CHARS:
+            sample = sample[:SAMPLE_MAX_CHARS - 1] + "…"
+        if quote:
+            sample = f'"{sample}"'
+        if sample and sample not in stats.samples:
+            stats.samples.append(sample)
+
+    def converged(self) -> bool:
+        return self.events - self.last_new_path >= OUTLINE_CONVERGENCE_EVENTS
+
+    def stop(self, bytes_read: int):
+        """Reading stopped early after bytes_read bytes"""
+        if bytes_read < self.file_size:
+            self.bytes_read = max(1, bytes_read)
+
+    def _count(self, count: int) -> str:
+        # Un chemin vu une seule fois (racine, en-tête) ne se répète pas dans la suite du fichier
+        if self.bytes_read is None or count == 1:
+            return str(count)
+        return f"≈ {round(count * self.file_size / self.bytes_read)}"
+
+    def render(self, title: str) -> str:
+        """
+        One line per path, in document order. The outline is bounded by
+        OUTLINE_MAX_PATHS and always rendered whole (it is cached), the
+        prompt budget cuts it afterwards.
+        """
+        header = f"{title} ({len(self.paths)} chemins"
+        if self.bytes_read is not None:
+            header += f", structure stable après {max(1, self.bytes_read * 100 // self.file_size)}% du fichier: nombres estimés"
+        lines = [header + "):"]
+        for path, stats in self.paths.items():
+            line = f"{path} ({', '.join(stats.kinds + [self._count(stats.count)])})"
+            if stats.attributes:
+                line += f" attributs: {', '.join(stats.attributes)}"
+            if stats.samples:
+                line += " ex: " + ", ".join(stats.samples)
+            lines.append(line)
+        if self.skipped_paths:
+            lines.append(f"... chemins au-delà des {OUTLINE_MAX_PATHS} premiers non détaillés")
+        return "\n".join(lines) + "\n"
+
+def _local_name(tag: str) -> str:
+    # {namespace}tag -> tag
+    return tag.rsplit("}", 1)[-1] if tag.startswith("{") else tag
+
+def outline_xml(file_path: str) -> str:
+    """Outline of an XML file read with iterparse; elements are freed as soon as they end"""
+    outline = StructureOutline(os.path.getsize(file_path))
+    stack: List[str] = []
+    root = None
+    with open(file_path, "rb") as f:
+        for event, element in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+                stack.append(_local_name(element.tag))
+                outline.add("/" + "/".join(stack), attributes=[_local_name(name) for name in element.attrib])
+                if outline.converged():
+                    outline.stop(f.tell())
+                    break
+                continue
+            if element.text and not element.text.isspace():
+                outline.sample("/" + "/".join(stack), element.text)
+            stack.pop()
+            element.clear()
+            if len(stack) == 1:
+                # Les enfants terminés restent attachés à la racine: on les libère
+                root.clear()
+    return outline.render("Structure du fichier XML")
+
+def outline_json(file_path: str) -> str:
+    """
+    Outline of a JSON file parsed incrementally (ijson events): paths like
+    $.users[].name, with "[]" for the elements of a list.
+    """
+    outline = StructureOutline(os.path.getsize(file_path))
+    path: List[str] = ["$"]
+    with open(file_path, "rb") as f:
+        for event, value in ijson.basic_parse(f, use_float=True):
+            if event == "map_key":
+                path[-1] = f".{value}"
+                continue
+            if event in ("end_map", "end_array"):
+                path.pop()
+                continue
+            current = "".join(path)
+            if event == "start_map":
+                outline.add(current, "objet")
+                path.append("")
+            elif event == "start_array":
+                outline.add(current, "liste")
+                path.append("[]")
+            else:
+                if event == "boolean":
+                    value = "true" if value else "false"
+                outline.add(current, JSON_SCALARS.get(event, event), value, quote=event == "string")
+            if outline.converged():
+                outline.stop(f.tell())
+                break
+    return outline.render("Structure du fichier JSON")
@@ -0,0 +1,201 @@
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from config.settings import (
+    TABLE_PROFILE_BATCH_ROWS, TABLE_PROFILE_SAMPLE_ROWS, TABLE_PROFILE_TOP_K, TABLE_PROFILE_RESERVOIR_SIZE
+)
+
+# Valeurs traitées comme vides (comparées telles quelles: pas de passage en minuscules par cellule)
+NULL_TOKENS = np.array(["", " ", "-", "NA", "na", "N/A", "n/a", "NaN", "nan", "NULL", "null", "None", "none"])
+# Valeurs distinctes suivies par colonne texte (top-k approximatif au-delà)
+DISTINCT_CAPACITY = 1000
+# Les cellules sont coupées avant conversion: un tableau NumPy de chaînes a la largeur de la plus longue
+MAX_CELL_CHARS = 200
+TYPE_LABELS = {"integer": "entier", "float": "décimal", "date": "date", "text": "texte", "empty": "vide"}
+
+class ColumnProfile:
+    """
+    Running statistics of one column, updated batch by batch.
+
+    The type starts as numeric and is demoted (numeric -> date -> text) as
+    soon as a batch holds a value that does not parse. Min/max/mean are
+    exact; quartiles come from a fixed-size reservoir sample.
+    """
+
+    def __init__(self, name: str, rng: np.random.Generator):
+        self.name = name
+        self.rng = rng
+        self.kind = "integer"
+        self.count = 0
+        self.nulls = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.reservoir = np.empty(0)
+        self.seen = 0  # values offered to the reservoir
+        self.counts: Dict[str, int] = {}
+        self.distinct_overflow = False
+
+    def _sample(self, values: np.ndarray):
+        free = TABLE_PROFILE_RESERVOIR_SIZE - len(self.reservoir)
+        if free > 0:
+            self.reservoir = np.concatenate([self.reservoir, values[:free]])
+            self.seen += min(free, len(values))
+            values = values[free:]
+        if len(values):
+            # Algorithme R vectorisé: la i-ème valeur remplace un élément avec une probabilité k/i
+            positions = np.arange(self.seen + 1, self.seen + len(values) + 1)
+            keep = self.rng.random(len(values)) < TABLE_PROFILE_RESERVOIR_SIZE / positions
+            slots = self.rng.integers(0, TABLE_PROFILE_RESERVOIR_SIZE, int(keep.sum()))
+            self.reservoir[slots] = values[keep]
+            self.seen += len(values)
+
+    def _add_numbers(self, numbers: np.ndarray):
+        if self.kind == "integer" and not np.all(np.mod(numbers, 1) == 0):
+            self.kind = "float"
+        self.total += float(numbers.sum())
+        low, high = float(numbers.min()), float(numbers.max())
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+        self._sample(numbers)
+
+    def _add_dates(self, dates: np.ndarray):
+        low, high = dates.min(), dates.max()
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+
+    def _add_texts(self, values: np.ndarray):
+        uniques, counts = np.unique(values, return_counts=True)
+        for value, count in zip(uniques.tolist(), counts.tolist()):
+            self.counts[value] = self.counts.get(value, 0) + count
+        if len(self.counts) > DISTINCT_CAPACITY:
+            # Seules les valeurs les plus fréquentes restent suivies
+            self.distinct_overflow = True
+            kept = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:DISTINCT_CAPACITY // 2]
+            self.counts = dict(kept)
+
+    def add(self, values: np.ndarray):
+        """Add one batch of raw string values"""
+        is_null = np.isin(values, NULL_TOKENS)
+        self.nulls += int(is_null.sum())
+        present = values[~is_null]
+        if not len(present):
+            return
+        self.count += len(present)
+
+        if self.kind in ("integer", "float"):
+            try:
+                self._add_numbers(present.astype(np.float64))
+                return
+            except ValueError:
+                # Première valeur non numérique: les valeurs déjà vues ne sont plus résumées comme des nombres
+                self.kind = "date" if self.count == len(present) else "text"
+                self.minimum = self.maximum = None
+                self.reservoir = np.empty(0)
+        if self.kind == "date":
+            try:
+                self._add_dates(present.astype("datetime64[s]"))
+                return
+            except ValueError:
+                self.kind = "text"
+                self.minimum = self.maximum = None
+        self._add_texts(present)
+
+    def render(self) -> str:
+        kind = "empty" if self.count == 0 else self.kind
+        line = f"- {self.name} ({TYPE_LABELS[kind]}): {self.nulls} vide(s)"
+        if kind in ("integer", "float"):
+            q1, median, q3 = np.quantile(self.reservoir, [0.25, 0.5, 0.75])
+            line += (
+                f", min {_number(self.minimum)}, max {_number(self.maximum)}, moyenne {_number(self.total / self.count)}"
+                f", quartiles {_number(q1)} / {_number(median)} / {_number(q3)}"
+            )
+        elif kind == "date":
+            line += f", du {_date(self.minimum)} au {_date(self.maximum)}"
+        elif kind == "text":
+            distinct = f"plus de {DISTINCT_CAPACITY}" if self.distinct_overflow else str(len(self.counts))
+            top = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:TABLE_PROFILE_TOP_K]
+            line += f", {distinct} valeurs distinctes, fréquentes: " + ", ".join(
+                f"{_shorten(value)} ({count})" for value, count in top
+            )
+        return line
+
+def _number(value: float) -> str:
+    return f"{value:.6g}"
+
+def _date(value) -> str:
+    text = str(value)
+    return text[:10] if text.endswith("T00:00:00") else text
+
+def _shorten(value: str, limit: int = 40) -> str:
+    return value if len(value) <= limit else value[:limit - 1] + "…"
+
+class TableProfiler:
+    """
+    Streaming profile of a table read in batches of TABLE_PROFILE_BATCH_ROWS
+    rows: column types, empty values, numeric/date ranges, frequent values,
+    row count, and a sample of rows (the first ones and a random reservoir).
+    Memory depends on the batch and sample sizes, not on the table size.
+    """
+
+    def __init__(self, header: Sequence[str], seed: Optional[int] = None):
+        self.header = [name.strip() or f"colonne_{index + 1}" for index, name in enumerate(header)]
+        self.rng = np.random.default_rng(seed)
+        self.columns = [ColumnProfile(name, self.rng) for name in self.header]
+        self.rows = 0
+        self.head: List[List[str]] = []
+        self.sample: List[Tuple[int, List[str]]] = []
+
+    def _sample_rows(self, rows: List[List[str]]):
+        head_size = TABLE_PROFILE_SAMPLE_ROWS // 2
+        reservoir_size = TABLE_PROFILE_SAMPLE_ROWS - head_size
+        offset = 0
+        while offset < len(rows) and (len(self.head) < head_size or len(self.sample) < reservoir_size):
+            if len(self.head) < head_size:
+                self.head.append(rows[offset])
+            else:
+                self.sample.append((self.rows + offset, rows[offset]))
+            offset += 1
+        if offset < len(rows) and reservoir_size:
+            # Reservoir sampling: tirage vectorisé, seules les lignes retenues sont parcourues
+            positions = np.arange(self.rows + offset, self.rows + len(rows))
+            seen = positions - head_size + 1
+            for index in np.flatnonzero(self.rng.random(len(positions)) < reservoir_size / seen):
+                self.sample[int(self.rng.integers(reservoir_size))] = (int(positions[index]), rows[offset + index])
+
+    def add_batch(self, rows: List[List[str]]):
+        if not rows:
+            return
+        width = len(self.header)
+        rows = [row[:width] + [""] * (width - len(row)) if len(row) != width else row for row in rows]
+        self._sample_rows(rows)
+        for column, values in zip(self.columns, zip(*rows)):
+            if max(map(len, values)) > MAX_CELL_CHARS:
+                values = [value[:MAX_CELL_CHARS] for value in values]
+            column.add(np.array(values, dtype=str))
+        self.rows += len(rows)
+
+    def consume(self, rows: Iterable[List[str]], max_rows: Optional[int] = None) -> bool:
+        """
+        Profile rows from an iterator, batch by batch. Returns False when
+        max_rows was reached (the iterator may still hold rows), True otherwise.
+        """
+        rows = iter(rows)
+        while True:
+            size = TABLE_PROFILE_BATCH_ROWS if not max_rows else min(TABLE_PROFILE_BATCH_ROWS, max_rows - self.rows)
+            if size <= 0:
+                return False
+            batch = list(islice(rows, size))
+            self.add_batch(batch)
+            if len(batch) < size:
+                return True
+
+    def render(self, title: str, row_count: Optional[str] = None) -> str:
+        """row_count replaces the number of profiled rows when the table was only partly read"""
+        lines = [title, f"{row_count or f'{self.rows} lignes de données'}, {len(self.header)} colonnes", "", "Profil des colonnes:"]
+        lines.extend(column.render() for column in self.columns)
+        if self.rows:
+            sample = self.head + [row for _, row in sorted(self.sample, key=lambda item: item[0])]
+            lines += ["", f"Échantillon ({len(sample)} lignes: les premières puis un tirage aléatoire):", " | ".join(self.header)]
+            lines.extend(" | ".join(_shorten(" ".join(cell.split())) for cell in row).rstrip(" |") for row in sample)
+        return "\n".join(lines) + "\n"
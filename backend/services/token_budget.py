@@ -0,0 +1,183 @@
+import logging
+import math
+import re
+from typing import Dict, List, Optional
+from config.settings import CONTEXT_MAX_TOKENS, CONTEXT_SAFETY_TOKENS
+from services.providers import PROVIDERS, Provider, get_provider
+from services.worker_pool import run_in_thread
+
+try:
+    import tiktoken
+except ImportError:  # optional: every provider is then counted with the calibrated estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+ESTIMATE = "estimate"
+# Pièces comptées par l'estimation: idéogramme, mot, groupe de 3 chiffres, signe ou saut de ligne
+_PIECE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]|[^\W\d_]+|\d{1,3}|[^\w\s]|\n+")
+# Letters per token inside long words (BPE vocabularies split rare words)
+WORD_CHARS_PER_TOKEN = 6
+# Upper bound of characters per token, to cut a text before counting it
+MAX_CHARS_PER_TOKEN = 8
+# Calibration: moving average of reported / estimated prompt tokens, per provider
+CALIBRATION_WEIGHT = 0.2
+CALIBRATION_BOUNDS = (0.5, 2.0)
+CALIBRATION_MIN_TOKENS = 200  # shorter prompts are dominated by the message framing
+# Seconds to load (and download on first run) a tokenizer vocabulary at startup
+TOKENIZER_LOAD_TIMEOUT = 30
+
+class Tokenizers:
+    """Local tokenizers (None: not available here) and estimate calibration of the other providers"""
+    encodings: Dict[str, Optional["tiktoken.Encoding"]] = {}
+    ratios: Dict[str, float] = {}
+    calibrations: Dict[str, int] = {}
+
+# Global tokenizers
+tokenizers = Tokenizers()
+
+def _encoding(name: str):
+    # Only tokenizers loaded at startup are used: loading one may download its vocabulary
+    return tokenizers.encodings.get(name)
+
+async def load_tokenizers():
+    """Load the local tokenizers of the registered providers, off the event loop (at startup)"""
+    if tiktoken is None:
+        return
+    for name in {provider.tokenizer for provider in PROVIDERS.values()} - {ESTIMATE} - set(tokenizers.encodings):
+        try:
+            tokenizers.encodings[name] = await run_in_thread(tiktoken.get_encoding, name, timeout=TOKENIZER_LOAD_TIMEOUT)
+        except Exception as e:
+            # Vocabulaire absent du cache local et pas de réseau: on estime
+            logger.warning(f"Tokenizer {name} unavailable, token counts are estimated: {str(e) or type(e).__name__}")
+            tokenizers.encodings[name] = None
+
+def estimate_tokens(text: str) -> int:
+    """
+    Token count of a BPE tokenizer, estimated without its vocabulary: one
+    token per word, digit group, symbol or ideogram, more for long words.
+    """
+    return sum(1 + (len(piece) - 1) // WORD_CHARS_PER_TOKEN for piece in _PIECE.findall(text))
+
+def _calibrated(estimate: int, provider: Optional[Provider]) -> int:
+    ratio = tokenizers.ratios.get(provider.name, 1.0) if provider is not None else 1.0
+    return math.ceil(estimate * ratio)
+
+def count_tokens(text: str, provider: Optional[Provider] = None) -> int:
+    """Tokens of text for a provider: its tokenizer when it runs locally, the calibrated estimate otherwise"""
+    encoding = _encoding(provider.tokenizer) if provider is not None else None
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return _calibrated(estimate_tokens(text), provider)
+
+def chunk_token_counts(text: str) -> Dict[str, int]:
+    """
+    Counts stored with a chunk (file_chunks.token_counts): one per local
+    tokenizer of the registered providers, plus the raw estimate.
+    """
+    counts = {ESTIMATE: estimate_tokens(text)}
+    for name in {provider.tokenizer for provider in PROVIDERS.values()}:
+        encoding = _encoding(name)
+        if encoding is not None:
+            counts[name] = len(encoding.encode(text, disallowed_special=()))
+    return counts
+
+def chunk_tokens(text: str, counts: Optional[Dict[str, int]], provider: Optional[Provider]) -> int:
+    """Tokens of a stored chunk for a provider, from its stored counts when they apply"""
+    if counts:
+        if provider is not None and provider.tokenizer in counts:
+            return counts[provider.tokenizer]
+        if ESTIMATE in counts and (provider is None or _encoding(provider.tokenizer) is None):
+            return _calibrated(counts[ESTIMATE], provider)
+    # Chunk antérieur au comptage, ou tokenizer devenu disponible depuis
+    return count_tokens(text, provider)
+
+def record_prompt_usage(provider: Provider, prompt: str, reported_tokens: int):
+    """
+    Calibrate the estimate of a provider without local tokenizer against the
+    prompt tokens its API reported for a call.
+    """
+    if reported_tokens <= 0 or _encoding(provider.tokenizer) is not None:
+        return
+    estimate = estimate_tokens(f"{provider.system_prompt}\n{prompt}")
+    if estimate < CALIBRATION_MIN_TOKENS:
+        return
+    low, high = CALIBRATION_BOUNDS
+    ratio = min(max(reported_tokens / estimate, low), high)
+    previous = tokenizers.ratios.get(provider.name)
+    tokenizers.ratios[provider.name] = ratio if previous is None else previous + CALIBRATION_WEIGHT * (ratio - previous)
+    tokenizers.calibrations[provider.name] = tokenizers.calibrations.get(provider.name, 0) + 1
+
+def _prefix_length(text: str, budget: int, provider: Optional[Provider]) -> int:
+    """Length of the longest prefix of text within budget tokens (only a prefix is counted)"""
+    end = min(len(text), max(0, budget) * MAX_CHARS_PER_TOKEN)
+    while end > 0:
+        tokens = count_tokens(text[:end], provider)
+        if tokens <= budget:
+            return end
+        end = min(end - 1, int(end * budget / tokens * 0.99))
+    return 0
+
+class ContextBudget:
+    """
+    Tokens left for file context in a prompt, for each provider it is sent
+    to (the streaming compare mode sends one prompt to every model): the
+    context window minus the system prompt, the rest of the prompt (question
+    and instructions) and max_tokens, capped at CONTEXT_MAX_TOKENS. A piece
+    of text is taken only if it fits the budget of every provider.
+    """
+
+    def __init__(self, providers: List[Provider], frame: str):
+        """frame: the prompt without its file context"""
+        self.providers: List[Optional[Provider]] = list(providers) or [None]
+        self.remaining: List[int] = []
+        for provider in self.providers:
+            if provider is None:
+                left = CONTEXT_MAX_TOKENS - count_tokens(frame)
+            else:
+                reserved = (
+                    count_tokens(provider.system_prompt, provider) + count_tokens(frame, provider)
+                    + provider.max_tokens + CONTEXT_SAFETY_TOKENS
+                )
+                left = provider.context_window - reserved
+            self.remaining.append(max(0, min(CONTEXT_MAX_TOKENS, left)))
+
+    def max_chars(self) -> int:
+        """Upper bound of the characters that can fit (to stop an extraction early)"""
+        return max(self.remaining) * MAX_CHARS_PER_TOKEN
+
+    def take(self, text: str, counts: Optional[Dict[str, int]] = None, header: str = "") -> bool:
+        """Take a chunk (with its stored token counts) and its header if they fit"""
+        costs = [
+            chunk_tokens(text, counts, provider) + (count_tokens(header, provider) if header else 0)
+            for provider in self.providers
+        ]
+        if any(cost > left for cost, left in zip(costs, self.remaining)):
+            return False
+        self.remaining = [left - cost for cost, left in zip(costs, self.remaining)]
+        return True
+
+    def fit(self, text: str) -> str:
+        """Take the longest prefix of text that fits, cut at a line or word break"""
+        end = len(text)
+        for provider, left in zip(self.providers, self.remaining):
+            end = _prefix_length(text[:end], left, provider)
+        if end < len(text):
+            cut = max(text.rfind("\n", 0, end), text.rfind(" ", 0, end))
+            if cut > end * 0.9:
+                end = cut
+        taken = text[:end]
+        self.remaining = [left - count_tokens(taken, provider) for provider, left in zip(self.providers, self.remaining)]
+        return taken
+
+def context_budget(ai_models: List[str], frame: str) -> ContextBudget:
+    """Budget of a prompt sent to the given models (unknown names are ignored)"""
+    providers = [get_provider(model) for model in ai_models]
+    return ContextBudget([provider for provider in providers if provider is not None], frame)
+
+def get_tokenizer_stats() -> dict:
+    return {
+        "local_tokenizers": {name: encoding is not None for name, encoding in tokenizers.encodings.items()},
+        "estimate_ratios": {name: round(ratio, 3) for name, ratio in tokenizers.ratios.items()},
+        "calibrations": dict(tokenizers.calibrations)
+    }
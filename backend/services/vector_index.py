@@ -0,0 +1,277 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from config.settings import VECTOR_INDEX_DIR, VECTOR_TOP_K, VECTOR_ANN_MIN_VECTORS
+from services.embeddings import embed_texts, load_embedder
+from services.worker_pool import run_in_thread
+
+try:
+    import hnswlib
+except ImportError:  # optional: brute-force search only
+    hnswlib = None
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: the index is then only safe with a single worker process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SEARCH_BLOCK_ROWS = 65536
+COMPACT_DEAD_RATIO = 0.3
+
+class UserVectorStore:
+    """
+    Semantic index of one user's chunks.
+
+    vectors.f32 is an append-only float32 matrix (one row per chunk) read
+    through np.memmap; meta.json maps rows to (file_id, chunk_index). Rows of
+    deleted files are tombstoned and the matrix is compacted once too many
+    rows are dead. Above VECTOR_ANN_MIN_VECTORS rows an HNSW index is used when
+    hnswlib is installed.
+
+    The files are shared by the worker processes of the server: every
+    operation holds a file lock (exclusive to write, shared to search) and
+    first reloads the index if another process rewrote meta.json.
+    """
+
+    def __init__(self, directory: Path, provider: str, dim: int):
+        self.directory = directory
+        self.provider = provider
+        self.dim = dim
+        self.rows: List[Tuple[str, int]] = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.matrix: Optional[np.memmap] = None
+        self.hnsw = None
+        self.version = None  # (inode, mtime) of the meta.json that was loaded
+        with self._locked(exclusive=True):
+            self._load()
+
+    @property
+    def vectors_path(self) -> Path:
+        return self.directory / "vectors.f32"
+
+    @property
+    def meta_path(self) -> Path:
+        return self.directory / "meta.json"
+
+    @property
+    def hnsw_path(self) -> Path:
+        return self.directory / "hnsw.bin"
+
+    @property
+    def lock_path(self) -> Path:
+        # Next to the directory, which is removed when the index is reset
+        return self.directory.parent / f"{self.directory.name}.lock"
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _meta_version(self):
+        try:
+            stat = self.meta_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _refresh(self):
+        """Reload the index when another process rewrote meta.json since it was read"""
+        if self._meta_version() != self.version:
+            self._load()
+
+    def _load(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.rows = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.hnsw = None
+        if self.meta_path.exists():
+            meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+            if meta.get("provider") != self.provider or meta.get("dim") != self.dim:
+                # Embeddings of another model are not comparable: start over
+                logger.warning(f"Vector index {self.directory} built with {meta.get('provider')}, resetting")
+                shutil.rmtree(self.directory)
+                self.directory.mkdir(parents=True)
+            else:
+                self.rows = [tuple(row) for row in meta["rows"]]
+                self.alive = np.ones(len(self.rows), dtype=bool)
+                self.alive[meta["dead_rows"]] = False
+        self.version = self._meta_version()
+        self._map()
+        if hnswlib is not None and self.hnsw_path.exists():
+            self.hnsw = hnswlib.Index(space="ip", dim=self.dim)
+            self.hnsw.load_index(str(self.hnsw_path), max_elements=len(self.rows))
+
+    def _map(self):
+        self.matrix = None
+        if self.rows:
+            self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.rows), self.dim))
+
+    def _save_meta(self):
+        tmp_path = self.meta_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({
+            "provider": self.provider,
+            "dim": self.dim,
+            "rows": self.rows,
+            "dead_rows": np.flatnonzero(~self.alive).tolist()
+        }), encoding="utf-8")
+        os.replace(tmp_path, self.meta_path)
+        self.version = self._meta_version()
+
+    def _build_hnsw(self):
+        self.hnsw = hnswlib.Index(space="ip", dim=self.dim)
+        self.hnsw.init_index(max_elements=max(len(self.rows) * 2, 1024), ef_construction=200, M=16)
+        for start in range(0, len(self.rows), SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.matrix[start:start + SEARCH_BLOCK_ROWS])
+            self.hnsw.add_items(block, np.arange(start, start + len(block)))
+        for row in np.flatnonzero(~self.alive):
+            self.hnsw.mark_deleted(int(row))
+        self.hnsw.save_index(str(self.hnsw_path))
+
+    def add(self, file_id: str, vectors: np.ndarray):
+        """Append the vectors of a file (re-indexing a file replaces it)"""
+        with self._locked(exclusive=True):
+            self._refresh()
+            self._remove_file(file_id)
+            self._append(file_id, vectors)
+
+    def _append(self, file_id: str, vectors: np.ndarray):
+        start = len(self.rows)
+        with open(self.vectors_path, "ab") as f:
+            # Lignes d'un ajout interrompu avant l'écriture de meta.json
+            f.truncate(start * self.dim * np.dtype(np.float32).itemsize)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        self.rows.extend((file_id, index) for index in range(len(vectors)))
+        self.alive = np.concatenate([self.alive, np.ones(len(vectors), dtype=bool)])
+        self._save_meta()
+        self._map()
+
+        if self.hnsw is not None:
+            if len(self.rows) > self.hnsw.get_max_elements():
+                self.hnsw.resize_index(len(self.rows) * 2)
+            self.hnsw.add_items(vectors, np.arange(start, len(self.rows)))
+            self.hnsw.save_index(str(self.hnsw_path))
+        elif hnswlib is not None and len(self.rows) >= VECTOR_ANN_MIN_VECTORS:
+            self._build_hnsw()
+
+    def remove_file(self, file_id: str):
+        """Tombstone the rows of a file, compacting when too many rows are dead"""
+        with self._locked(exclusive=True):
+            self._refresh()
+            self._remove_file(file_id)
+
+    def _remove_file(self, file_id: str):
+        rows = [i for i, (row_file_id, _) in enumerate(self.rows) if row_file_id == file_id and self.alive[i]]
+        if not rows:
+            return
+        self.alive[rows] = False
+        if self.hnsw is not None:
+            for row in rows:
+                self.hnsw.mark_deleted(row)
+            self.hnsw.save_index(str(self.hnsw_path))
+        if 1 - self.alive.mean() > COMPACT_DEAD_RATIO:
+            self._compact()
+        else:
+            self._save_meta()
+
+    def _compact(self):
+        keep = np.flatnonzero(self.alive)
+        tmp_path = self.vectors_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            for start in range(0, len(keep), SEARCH_BLOCK_ROWS):
+                f.write(np.asarray(self.matrix[keep[start:start + SEARCH_BLOCK_ROWS]]).tobytes())
+        self.matrix = None
+        os.replace(tmp_path, self.vectors_path)
+        self.rows = [self.rows[i] for i in keep]
+        self.alive = np.ones(len(self.rows), dtype=bool)
+        self._save_meta()
+        self._map()
+        self.hnsw = None
+        self.hnsw_path.unlink(missing_ok=True)
+        if hnswlib is not None and len(self.rows) >= VECTOR_ANN_MIN_VECTORS:
+            self._build_hnsw()
+
+    def search(self, query: np.ndarray, top_k: int) -> List[Tuple[str, int, float]]:
+        """Return (file_id, chunk_index, score) of the nearest live chunks"""
+        with self._locked(exclusive=False):
+            self._refresh()
+            return self._search(query, top_k)
+
+    def _search(self, query: np.ndarray, top_k: int) -> List[Tuple[str, int, float]]:
+        if self.matrix is None or not self.alive.any():
+            return []
+        if self.hnsw is not None:
+            k = min(top_k, int(self.alive.sum()))
+            labels, distances = self.hnsw.knn_query(query, k=k)
+            return [(*self.rows[int(row)], 1.0 - float(distance)) for row, distance in zip(labels[0], distances[0])]
+
+        # Brute force: batched dot products over the memory-mapped matrix
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float32)
+        for start in range(0, len(self.rows), SEARCH_BLOCK_ROWS):
+            scores = np.asarray(self.matrix[start:start + SEARCH_BLOCK_ROWS]) @ query
+            scores[~self.alive[start:start + len(scores)]] = -np.inf
+            best_rows = np.concatenate([best_rows, np.arange(start, start + len(scores))])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_scores) > top_k:
+                keep = np.argpartition(-best_scores, top_k - 1)[:top_k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+        order = np.argsort(-best_scores)
+        return [
+            (*self.rows[int(best_rows[i])], float(best_scores[i]))
+            for i in order if np.isfinite(best_scores[i])
+        ]
+
+class VectorStores:
+    """Open per-user stores and their write locks"""
+    stores: Dict[str, UserVectorStore] = {}
+    locks: Dict[str, asyncio.Lock] = {}
+
+# Global vector stores
+vector_stores = VectorStores()
+
+async def _get_store(user_id: str) -> UserVectorStore:
+    store = vector_stores.stores.get(user_id)
+    if store is None:
+        embedder = await load_embedder()
+        store = await run_in_thread(UserVectorStore, VECTOR_INDEX_DIR / user_id, embedder.name, embedder.dim)
+        vector_stores.stores[user_id] = store
+    return store
+
+async def index_file_chunks(user_id: str, file_id: str, texts: List[str]):
+    """Embed the chunks of a file and append them to the user's index"""
+    vectors = await embed_texts(texts)
+    lock = vector_stores.locks.setdefault(user_id, asyncio.Lock())
+    async with lock:
+        store = await _get_store(user_id)
+        await run_in_thread(store.add, file_id, vectors)
+    logger.info(f"Vector index updated for user {user_id}: {len(texts)} chunks of {file_id}")
+
+async def remove_file_vectors(user_id: str, file_id: str):
+    """Remove the chunks of a deleted file from the user's index"""
+    lock = vector_stores.locks.setdefault(user_id, asyncio.Lock())
+    async with lock:
+        store = await _get_store(user_id)
+        await run_in_thread(store.remove_file, file_id)
+
+async def search_user_chunks(user_id: str, query: str, top_k: int = VECTOR_TOP_K) -> List[Tuple[str, int, float]]:
+    """Semantic search across all of a user's files"""
+    query_vector = (await embed_texts([query]))[0]
+    lock = vector_stores.locks.setdefault(user_id, asyncio.Lock())
+    async with lock:
+        store = await _get_store(user_id)
+        return await run_in_thread(store.search, query_vector, top_k)
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from fastapi import HTTPException, Request
+from config.settings import EXTRACTION_PROCESS_WORKERS, EXTRACTION_THREAD_WORKERS, EXTRACTION_TIMEOUT, STORAGE_IO_WORKERS
+
+logger = logging.getLogger(__name__)
+
+class WorkerPools:
+    """Bounded executors for blocking document parsing and object store transfers"""
+    process_pool: Optional[ProcessPoolExecutor] = None
+    thread_pool: Optional[ThreadPoolExecutor] = None
+    io_pool: Optional[ThreadPoolExecutor] = None
+    # Counters are updated from the event loop and from the executors' threads
+    lock = threading.Lock()
+    # Jobs submitted and not finished yet, per pool
+    inflight = {"process": 0, "thread": 0, "io": 0}
+    submitted = {"process": 0, "thread": 0, "io": 0}
+    timeouts = {"process": 0, "thread": 0, "io": 0}
+    cancelled = {"process": 0, "thread": 0, "io": 0}
+
+# Global worker pools
+worker_pools = WorkerPools()
+
+def _get_executor(kind: str):
+    if kind == "process":
+        if worker_pools.process_pool is None:
+            worker_pools.process_pool = ProcessPoolExecutor(max_workers=EXTRACTION_PROCESS_WORKERS)
+        return worker_pools.process_pool
+    if kind == "io":
+        # Slow transfers must not hold the threads extraction and hashing wait for
+        if worker_pools.io_pool is None:
+            worker_pools.io_pool = ThreadPoolExecutor(max_workers=STORAGE_IO_WORKERS, thread_name_prefix="storage")
+        return worker_pools.io_pool
+    if worker_pools.thread_pool is None:
+        worker_pools.thread_pool = ThreadPoolExecutor(
+            max_workers=EXTRACTION_THREAD_WORKERS, thread_name_prefix="extraction"
+        )
+    return worker_pools.thread_pool
+
+async def _run(kind: str, func: Callable, *args, timeout: Optional[float] = None) -> Any:
+    """
+    Submit a job to a pool and await it with a timeout.
+    If the caller gives up (timeout or cancellation), a job still waiting in the
+    queue is removed; a job already running finishes in its worker.
+    """
+    # Counted before submit, so that a job done at once is never decremented first
+    with worker_pools.lock:
+        worker_pools.inflight[kind] += 1
+    try:
+        future: Future = _get_executor(kind).submit(func, *args)
+    except BaseException:
+        with worker_pools.lock:
+            worker_pools.inflight[kind] -= 1
+        raise
+    with worker_pools.lock:
+        worker_pools.submitted[kind] += 1
+
+    def _done(_):
+        with worker_pools.lock:
+            worker_pools.inflight[kind] -= 1
+    future.add_done_callback(_done)
+
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout or EXTRACTION_TIMEOUT)
+    except asyncio.TimeoutError:
+        with worker_pools.lock:
+            worker_pools.timeouts[kind] += 1
+        future.cancel()
+        logger.error(f"{kind.capitalize()} job {func.__name__} timed out after {timeout or EXTRACTION_TIMEOUT}s")
+        raise
+    except asyncio.CancelledError:
+        with worker_pools.lock:
+            worker_pools.cancelled[kind] += 1
+        future.cancel()
+        raise
+
+async def run_in_process(func: Callable, *args, timeout: Optional[float] = None) -> Any:
+    """Run a CPU-bound function (PDF/DOCX/XML parsing) in the process pool"""
+    return await _run("process", func, *args, timeout=timeout)
+
+async def run_in_thread(func: Callable, *args, timeout: Optional[float] = None) -> Any:
+    """Run an I/O-bound function (file reads, hashing) in the thread pool"""
+    return await _run("thread", func, *args, timeout=timeout)
+
+async def run_in_io_thread(func: Callable, *args, timeout: Optional[float] = None) -> Any:
+    """Run a blocking object store call (S3 request or transfer) in the storage pool"""
+    return await _run("io", func, *args, timeout=timeout)
+
+async def run_until_disconnected(request: Request, coro, poll_interval: float = 0.5) -> Any:
+    """Await a coroutine, cancelling it (and its queued jobs) if the client disconnects"""
+    task = asyncio.ensure_future(coro)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=poll_interval)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            task.cancel()
+            logger.info("Client disconnected, extraction cancelled")
+            raise HTTPException(status_code=499, detail="Client déconnecté")
+
+def get_pool_stats() -> dict:
+    """Queue depth and counters of the pools (used to size them)"""
+    workers = {"process": EXTRACTION_PROCESS_WORKERS, "thread": EXTRACTION_THREAD_WORKERS, "io": STORAGE_IO_WORKERS}
+    with worker_pools.lock:
+        return {
+            kind: {
+                "workers": workers[kind],
+                "inflight": worker_pools.inflight[kind],
+                "queue_depth": max(0, worker_pools.inflight[kind] - workers[kind]),
+                "submitted": worker_pools.submitted[kind],
+                "timeouts": worker_pools.timeouts[kind],
+                "cancelled": worker_pools.cancelled[kind]
+            }
+            for kind in ("process", "thread", "io")
+        }
+
+def shutdown_pools():
+    """Shut the pools down, dropping jobs that did not start yet"""
+    if worker_pools.process_pool is not None:
+        worker_pools.process_pool.shutdown(wait=False, cancel_futures=True)
+        worker_pools.process_pool = None
+    if worker_pools.thread_pool is not None:
+        worker_pools.thread_pool.shutdown(wait=False, cancel_futures=True)
+        worker_pools.thread_pool = None
+    if worker_pools.io_pool is not None:
+        worker_pools.io_pool.shutdown(wait=False, cancel_futures=True)
+        worker_pools.io_pool = None
+    logger.info("Worker pools shut down")
@@ -131,8 +131,7 @@ def create_collections_with_validation(db):
                 },
                 "mode": {
                     "bsonType": "string",
-                    "enum": ["compare", "chatgpt", "gemini", "deepseek", "claude"],
-                    "description": "Mode de chat utilisé"
+                    "description": "Mode de chat utilisé ('compare' ou nom d'un fournisseur enregistré)"
                 },
                 "timestamp": {
                     "bsonType": "date",
@@ -230,13 +229,25 @@ def create_collections_with_validation(db):
                 },
                 "analysis_status": {
                     "bsonType": "string",
-                    "enum": ["pending", "processing", "completed", "failed"],
+                    "enum": ["pending", "processing", "ready", "completed", "failed"],
                     "description": "Statut de l'analyse du fichier"
                 },
                 "analysis_result": {
                     "bsonType": ["string", "null"],
                     "description": "Résultat de l'analyse du fichier"
                 },
+                "content_hash": {
+                    "bsonType": "string",
+                    "description": "SHA-256 du contenu (clé du cache d'extraction)"
+                },
+                "analysis_stage": {
+                    "bsonType": "string",
+                    "description": "Étape d'ingestion en cours (extracting, chunking, done, failed)"
+                },
+                "chunk_count": {
+                    "bsonType": "int",
+                    "description": "Nombre de chunks produits par l'ingestion"
+                },
                 "uploaded_at": {
                     "bsonType": "date",
                     "description": "Date d'upload du fichier"
@@ -249,23 +260,19 @@ def create_collections_with_validation(db):
     file_chunks_validator = {
         "$jsonSchema": {
             "bsonType": "object",
-            "required": ["id", "file_id", "user_id", "chunk_text", "chunk_index", "created_at"],
+            "required": ["id", "content_hash", "chunk_text", "chunk_index", "created_at"],
             "properties": {
                 "id": {
                     "bsonType": "string",
                     "description": "ID unique du chunk"
                 },
-                "file_id": {
-                    "bsonType": "string",
-                    "description": "ID du fichier parent"
-                },
-                "user_id": {
+                "blob_key": {
                     "bsonType": "string",
-                    "description": "ID de l'utilisateur propriétaire"
+                    "description": "Blob découpé (SHA-256 + extension): les chunks sont partagés par tous les fichiers identiques"
                 },
-                "filename": {
+                "content_hash": {
                     "bsonType": "string",
-                    "description": "Nom du fichier original"
+                    "description": "SHA-256 du contenu"
                 },
                 "chunk_text": {
                     "bsonType": "string",
@@ -279,6 +286,10 @@ def create_collections_with_validation(db):
                     "bsonType": "int",
                     "description": "Taille du chunk en caractères"
                 },
+                "token_counts": {
+                    "bsonType": "object",
+                    "description": "Nombre de tokens du chunk par tokenizer (tiktoken) et estimé ('estimate')"
+                },
                 "embedding": {
                     "bsonType": "array",
                     "description": "Vecteur d'embedding du chunk",
@@ -308,6 +319,40 @@ def create_collections_with_validation(db):
         }
     }
     
+    # Collection blobs (contenus uploadés, adressés par hash et comptés par référence)
+    blobs_validator = {
+        "$jsonSchema": {
+            "bsonType": "object",
+            "required": ["_id", "path", "size", "ref_count", "created_at"],
+            "properties": {
+                "_id": {
+                    "bsonType": "string",
+                    "description": "SHA-256 du contenu suivi de l'extension"
+                },
+                "path": {
+                    "bsonType": "string",
+                    "description": "Chemin du blob sur disque"
+                },
+                "size": {
+                    "bsonType": ["int", "long"],
+                    "description": "Taille en octets"
+                },
+                "ref_count": {
+                    "bsonType": "int",
+                    "description": "Nombre de documents files qui référencent le blob"
+                },
+                "chunk_count": {
+                    "bsonType": ["int", "null"],
+                    "description": "Nombre de chunks partagés, une fois le contenu découpé"
+                },
+                "created_at": {
+                    "bsonType": "date",
+                    "description": "Date du premier upload"
+                }
+            }
+        }
+    }
+    
     # Collection sessions (pour la gestion des sessions de chat)
     sessions_validator = {
         "$jsonSchema": {
@@ -348,6 +393,7 @@ def create_collections_with_validation(db):
         ("users", users_validator),
         ("files", files_validator),
         ("file_chunks", file_chunks_validator),
+        ("blobs", blobs_validator),
         ("sessions", sessions_validator)
     ]
     
@@ -392,22 +438,20 @@ def create_indexes(db):
         ("files", "analysis_status", 1),
         ("files", [("user_id", 1), ("uploaded_at", -1)], None),
         ("files", [("user_id", 1), ("analysis_status", 1)], None),
+        ("files", "content_hash", 1),
         
         # Index pour file_chunks
-        ("file_chunks", "file_id", 1),
-        ("file_chunks", "user_id", 1),
-        ("file_chunks", "chunk_index", 1),
+        ("file_chunks", "content_hash", 1),
         ("file_chunks", "created_at", -1),
-        ("file_chunks", [("file_id", 1), ("chunk_index", 1)], None),
-        ("file_chunks", [("user_id", 1), ("file_id", 1)], None),
-        ("file_chunks", [("user_id", 1), ("created_at", -1)], None),
+        ("file_chunks", [("blob_key", 1), ("chunk_index", 1)], None),
         
         # Index pour sessions
         ("sessions", "user_id", 1),
         ("sessions", "session_id", 1),
         ("sessions", "created_at", -1),
         ("sessions", "updated_at", -1),
-        ("sessions", [("user_id", 1), ("created_at", -1)], None)
+        ("sessions", [("user_id", 1), ("created_at", -1)], None),
+        ("sessions", [("user_id", 1), ("updated_at", -1)], None)
     ]
     
     for collection_name, field, direction in indexes_to_create: